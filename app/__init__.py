@@ -11,6 +11,13 @@ from app.utils.cloudflare_protection import cloudflare_protection_middleware
 # Initialize extensions
 cache = Cache()
 
+# Added to every response (static assets included - nosniff matters for JS/CSS)
+SECURITY_HEADERS = (
+    ('X-Content-Type-Options', 'nosniff'),
+    ('X-Frame-Options', 'DENY'),
+    ('X-XSS-Protection', '1; mode=block'),
+)
+
 
 def create_app(config_name: str = None):
     """
@@ -29,6 +36,16 @@ def create_app(config_name: str = None):
     # Setup logging
     setup_logging(app)
 
+    # Tracing (optional, see TRACING_EXPORTER) and the Server-Timing header
+    init_tracing(app)
+    init_server_timing(app)
+
+    # Per-request memory accounting (see MEMORY_TRACKING and /debug/memory)
+    init_memory_tracking(app)
+
+    # Storage I/O counters summed in Redis (optional, see IO_METRICS_REDIS and /debug/io)
+    init_io_metrics(app)
+
     # Initialize extensions
     cache.init_app(app)
 
@@ -43,6 +60,9 @@ def create_app(config_name: str = None):
 
     # Cloudflare protection - block direct access
     if app.config.get('REQUIRE_CLOUDFLARE', True):
+        if not app.config.get('DEFER_BACKGROUND_THREADS'):
+            start_cloudflare_ip_refresh(app)
+
         @app.before_request
         def check_cloudflare():
             return cloudflare_protection_middleware()
@@ -50,9 +70,9 @@ def create_app(config_name: str = None):
     # Add security headers
     @app.after_request
     def add_security_headers(response):
-        response.headers['X-Content-Type-Options'] = 'nosniff'
-        response.headers['X-Frame-Options'] = 'DENY'
-        response.headers['X-XSS-Protection'] = '1; mode=block'
+        headers = response.headers
+        for name, value in SECURITY_HEADERS:
+            headers[name] = value
         return response
 
     # Health check endpoint for Cloud Run
@@ -60,18 +80,31 @@ def create_app(config_name: str = None):
     def health_check():
         return {'status': 'healthy'}, 200
 
-    # Readiness check
+    # Readiness check - not ready until warmup has finished
     @app.route('/ready')
     def readiness_check():
+        from app.utils.warmup import warmup_state
+        if not warmup_state.ready:
+            return {'status': 'warming up', 'warmup': warmup_state.to_dict()}, 503
         try:
-            from app.utils.database import db_manager
-            with db_manager.engine.connect() as conn:
-                conn.execute("SELECT 1")
-            return {'status': 'ready'}, 200
+            from app.utils.database import db_manager, get_configured_database_url, text
+            if get_configured_database_url():
+                with db_manager.engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+            return {'status': 'ready', 'warmup': warmup_state.to_dict()}, 200
         except Exception as e:
             app.logger.error(f"Readiness check failed: {e}")
             return {'status': 'not ready', 'error': str(e)}, 503
 
+    # Warm clients and hot datasets (optional, see WARMUP_MODE)
+    init_warmup(app)
+
+    # Apply data changes made on other instances (optional, see CACHE_INVALIDATION_REDIS)
+    init_invalidation(app)
+
+    # Pick up files changed upstream without a manual refresh (optional, see SOURCE_WATCH_INTERVAL)
+    init_source_watcher(app)
+
     return app
 
 
@@ -84,26 +117,73 @@ def setup_logging(app):
     )
 
 
+def init_tracing(app):
+    """Set up OpenTelemetry spans if an exporter is configured"""
+    from app.utils.tracing import init_tracing as setup_tracing
+    setup_tracing(app)
+
+
+def init_server_timing(app):
+    """Report per-stage latency in a Server-Timing header (see SERVER_TIMING)"""
+    from app.utils.server_timing import init_server_timing as setup_server_timing
+    setup_server_timing(app)
+
+
+def init_memory_tracking(app):
+    """Record memory growth per route and dataset footprints"""
+    from app.utils.memory import init_memory_tracking as setup_memory_tracking
+    setup_memory_tracking(app)
+
+
+def start_cloudflare_ip_refresh(app):
+    """Refresh Cloudflare IP ranges in the background - requests use the bundled snapshot meanwhile"""
+    from app.utils.cloudflare_ips import start_background_refresh
+
+    start_background_refresh(
+        [app.config['CLOUDFLARE_IPS_URL'], app.config['CLOUDFLARE_IPS_V6_URL']],
+        interval=app.config.get('CLOUDFLARE_IPS_REFRESH_INTERVAL', 86400),
+        retries=app.config.get('CLOUDFLARE_IPS_REFRESH_RETRIES', 3)
+    )
+
+
 def init_database(app):
     """Initialize database connection (lazy) - only when first used"""
-    from app.utils.database import db_manager
-    from app.config import Config
+    from app.utils.database import get_configured_database_url
 
     # Don't initialize at startup - let it initialize lazily on first use
-    # This allows the app to start even if database is not available
-    with app.app_context():
+    # This allows the app to start even if database is not available,
+    # and keeps SQLAlchemy/psycopg2 off the cold start path
+    if get_configured_database_url():
         app.logger.info("Database will be initialized on first use")
-        # Store config for lazy initialization
-        database_url = Config.get_database_url()
-        # Only initialize if we have valid connection info
-        if database_url and database_url != "postgresql://postgres:@localhost:5432/reports_db":
-            try:
-                db_manager.init_engine(database_url)
-                app.logger.info("Database connection initialized")
-            except Exception as e:
-                app.logger.warning(f"Could not initialize database at startup: {e}. Will retry on first use.")
-        else:
-            app.logger.warning("Database URL not configured. App will work but database features will be unavailable.")
+    else:
+        app.logger.warning("Database URL not configured. App will work but database features will be unavailable.")
+
+
+def init_io_metrics(app):
+    """Flush the storage I/O counters to Redis in the background"""
+    if not app.config.get('DEFER_BACKGROUND_THREADS'):
+        from app.utils.io_metrics import io_metrics
+        io_metrics.start()
+
+
+def init_invalidation(app):
+    """Listen for cache invalidation events in the background"""
+    if not app.config.get('DEFER_BACKGROUND_THREADS'):
+        from app.utils.invalidation import invalidation_bus
+        invalidation_bus.start()
+
+
+def init_source_watcher(app):
+    """Poll the source bucket for changed files in the background"""
+    if not app.config.get('DEFER_BACKGROUND_THREADS'):
+        from app.utils.source_watcher import source_watcher
+        source_watcher.start()
+
+
+def init_warmup(app):
+    """Preload clients and hot datasets so the first request after a cold start is fast"""
+    from app.utils.warmup import start_warmup
+    start_warmup(app, allow_threads=not app.config.get('DEFER_BACKGROUND_THREADS'))
 
 
 def register_blueprints(app):
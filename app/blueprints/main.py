@@ -1,22 +1,60 @@
 """
 Main blueprint - All routes from original version, adapted for Cloud Run
 """
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, Response, send_file
+from __future__ import annotations
+
+from flask import Blueprint, request, jsonify, redirect, url_for, flash, Response, send_file
+from flask import render_template as flask_render_template
+from app.utils.alert_stats import BUCKETS, MAX_TREND_POINTS, alert_history, daily_history, latest_per_location, location_trends
 from app.utils.cache import cached
 from app.utils.database import db_manager
-from app.utils.s3_client import S3Manager
 from app.utils.gcs_client import GCSManager
+from app.utils.storage import OFFLINE_DATA_SOURCES, get_s3_manager, get_gcs_manager, get_storage_manager, write_dataset
+from app.utils.datasets import dataset_cache, dataset_path, get_shared_store, invalidate_dataset, load_dataset, load_derived
+from app.utils.dimensions import get_customer_locations
+from app.utils.exclusions import exclusion_store
+from app.utils.inventory import INVENTORY_SOURCES, load_env_inventory, publish_env_inventory
+from app.utils.invalidation import apply_event, invalidation_bus
+from app.utils.io_metrics import PRICES, io_metrics, summarize_backends, usage_costs
+from app.utils.lazy_import import lazy_import
+from app.utils.location_partitions import LOCATION_DATASETS, load_location, publish_location_partitions
+from app.utils.memory import memory_summary
+from app.utils.refresh_jobs import RefreshJob, refresh_jobs
+from app.utils.report_partitions import REPORT_FILE, delivered_dates, load_report_month, missing_rows, publish_report_partitions, report_mask
+from app.utils.snapshots import POINTER_FILE, snapshot_store
+from app.utils.storage_backends import parse_csv
+from app.utils.source_watcher import source_watcher
+from app.utils.tracing import span, traced
 from app.config import Config
-import pandas as pd
 import json
 import logging
+import re
 from datetime import datetime
+from functools import partial
 from io import StringIO
+from typing import Optional
+
+# Heavy dependencies are imported on first use by the routes that need them
+pd = lazy_import('pandas')
+requests = lazy_import('requests')
+bs4 = lazy_import('bs4')
 
 logger = logging.getLogger(__name__)
 
 main_bp = Blueprint('main', __name__)
 
+
+def render_template(template_name: str, **context) -> str:
+    """flask.render_template, traced as its own stage"""
+    with span('render_template', template=template_name):
+        return flask_render_template(template_name, **context)
+
+
+def to_records(df: pd.DataFrame) -> list:
+    """DataFrame rows as a list of dicts for templates/JSON, traced as its own stage"""
+    with span('dataframe.to_dict', rows=len(df)):
+        return df.to_dict(orient='records')
+
 # Template constants
 TEMPLATE_ALERTS_REPORT = 'alerts-report.html'
 TEMPLATE_MONTHLY_REPORTS = 'monthly-report.html'
@@ -55,73 +93,6 @@ REDIRECT_STATISTICS_REPORT = 'main.statistics_report_page'
 REDIRECT_ENV_VERSIONS_REPORT = 'main.env_versions_report_page'
 
 
-def get_s3_manager():
-    """Get S3 manager instance"""
-    return S3Manager(
-        bucket_name=Config.S3_BUCKET_NAME,
-        aws_access_key=Config.AWS_ACCESS_KEY_ID,
-        aws_secret_key=Config.AWS_SECRET_ACCESS_KEY,
-        region=Config.AWS_DEFAULT_REGION
-    )
-
-
-def get_gcs_manager():
-    """Get GCS manager instance"""
-    try:
-        return GCSManager(
-            bucket_name=Config.GCS_BUCKET_NAME,
-            project_id=Config.GCP_PROJECT_ID
-        )
-    except ImportError as e:
-        logger.warning(f"GCS not available: {e}. Falling back to S3.")
-        return None
-
-
-def get_storage_manager():
-    """
-    Get storage manager - prefers GCS if available, falls back to S3.
-    This reduces AWS egress costs by using GCS as cache.
-    
-    If FORCE_GCS_ONLY is True, will raise an error if GCS is not available.
-    """
-    # Force GCS only mode - fail if GCS is not available
-    if Config.FORCE_GCS_ONLY:
-        gcs_manager = get_gcs_manager()
-        if gcs_manager is None:
-            raise RuntimeError("FORCE_GCS_ONLY is enabled but GCS is not available. Install google-cloud-storage package.")
-        if not gcs_manager.file_exists('report.csv'):
-            raise RuntimeError(f"FORCE_GCS_ONLY is enabled but GCS bucket {Config.GCS_BUCKET_NAME} is empty. Please run 'Refresh Data' first.")
-        logger.info(f"[FORCED] Using GCS as data source (bucket: {Config.GCS_BUCKET_NAME})")
-        return gcs_manager
-    
-    # Normal mode - prefer GCS, fallback to S3
-    if Config.DATA_SOURCE == 'gcs' or Config.DATA_SOURCE == 'gcs-only':
-        gcs_manager = get_gcs_manager()
-        if gcs_manager is not None:
-            try:
-                # Check if GCS has data, if not fallback to S3 (unless gcs-only)
-                if gcs_manager.file_exists('report.csv'):
-                    logger.info(f"Using GCS as data source (bucket: {Config.GCS_BUCKET_NAME})")
-                    return gcs_manager
-                else:
-                    if Config.DATA_SOURCE == 'gcs-only':
-                        raise RuntimeError(f"GCS-only mode enabled but bucket {Config.GCS_BUCKET_NAME} is empty. Please run 'Refresh Data' first.")
-                    logger.warning(f"GCS cache empty (bucket: {Config.GCS_BUCKET_NAME}), falling back to S3")
-            except Exception as e:
-                if Config.DATA_SOURCE == 'gcs-only':
-                    raise RuntimeError(f"GCS-only mode enabled but error occurred: {e}")
-                logger.warning(f"GCS error: {e}. Falling back to S3.")
-        else:
-            if Config.DATA_SOURCE == 'gcs-only':
-                raise RuntimeError("GCS-only mode enabled but GCS is not available. Install google-cloud-storage package.")
-        # Fallback to S3 if GCS is not available or has no data
-        logger.info(f"Using S3 as data source (bucket: {Config.S3_BUCKET_NAME})")
-        return get_s3_manager()
-    else:
-        logger.info(f"Using S3 as data source (DATA_SOURCE={Config.DATA_SOURCE}, bucket: {Config.S3_BUCKET_NAME})")
-        return get_s3_manager()
-
-
 def is_valid_date(year, month, day):
     """Check if a date is valid"""
     try:
@@ -131,12 +102,15 @@ def is_valid_date(year, month, day):
         return False
 
 
-def create_table_data(filtered_df, month, year, exclude_missing, frequencies_df, customer_location_df):
-    """Create table data for monthly report - processes data for each day of the month"""
-    # Ensure the 'date' column is in datetime format
-    if 'date' in filtered_df.columns:
-        filtered_df['date'] = pd.to_datetime(filtered_df['date'], errors='coerce')
-    
+@traced('transform.monthly_table')
+def create_table_data(groups, delivered, month, year, exclude_missing, frequencies_df):
+    """
+    Create table data for monthly report - processes data for each day of the month
+
+    Args:
+        groups: Deliveries over all history per (report name, location), one table row each
+        delivered: {(report name, location): delivered dates} covering at least the month's quarter and weeks
+    """
     days_columns = [f'{day:02}' for day in range(1, 32) if is_valid_date(year, month, day)]
     weekend_columns = [day for day in days_columns if pd.Timestamp(f'{year}-{month:02}-{day}').weekday() >= 5]
     today_day = str(datetime.now().day).zfill(2) if datetime.now().month == month and datetime.now().year == year else None
@@ -146,7 +120,7 @@ def create_table_data(filtered_df, month, year, exclude_missing, frequencies_df,
     end_date = start_date + pd.offsets.MonthEnd(1)
     
     table_data = []
-    for (report_name, location), group in filtered_df.groupby(['report name', 'location']):
+    for (report_name, location), delivered_count in groups.items():
         new_row = {'report name': report_name, 'location': location}
         
         # Find frequency for this report/location
@@ -171,14 +145,8 @@ def create_table_data(filtered_df, month, year, exclude_missing, frequencies_df,
             specific_days = ''
         
         # Get delivered dates
-        delivered_dates = []
-        if 'date' in group.columns and 'attachment' in group.columns:
-            try:
-                delivered_dates = group[group['attachment'] == 'Yes']['date'].dt.date.tolist()
-            except Exception as e:
-                logger.warning(f"Error extracting delivered dates: {e}")
-                delivered_dates = []
-        has_delivered = bool(delivered_dates)
+        delivered_dates = delivered.get((report_name, location), set())
+        has_delivered = delivered_count > 0
         
         for day in days_columns:
             date_str = f'{year}-{month:02}-{day}'
@@ -221,7 +189,6 @@ def create_table_data(filtered_df, month, year, exclude_missing, frequencies_df,
                         new_row[day] = 'N/A'
                 elif frequency.isdigit():
                     expected_count = int(frequency)
-                    delivered_count = len(delivered_dates)
                     if delivered_count < expected_count:
                         new_row[day] = 'No' if current_date <= datetime.now().date() else 'N/A'
                     else:
@@ -249,8 +216,12 @@ def debug_storage_info():
     """Debug endpoint to show current storage source and files"""
     try:
         storage_manager = get_storage_manager()
-        source_type = "GCS" if isinstance(storage_manager, GCSManager) else "S3"
-        bucket_name = Config.GCS_BUCKET_NAME if source_type == "GCS" else Config.S3_BUCKET_NAME
+        if Config.DATA_SOURCE in OFFLINE_DATA_SOURCES:
+            source_type = Config.DATA_SOURCE.upper()
+            bucket_name = storage_manager.bucket_name
+        else:
+            source_type = "GCS" if isinstance(storage_manager, GCSManager) else "S3"
+            bucket_name = Config.GCS_BUCKET_NAME if source_type == "GCS" else Config.S3_BUCKET_NAME
         
         all_files = storage_manager.list_files()
         csv_files = [f for f in all_files if f.endswith('.csv')]
@@ -260,7 +231,7 @@ def debug_storage_info():
         file_status = {}
         for key_file in key_files:
             try:
-                file_status[key_file] = storage_manager.file_exists(key_file)
+                file_status[key_file] = storage_manager.file_exists(dataset_path(key_file))
             except Exception as e:
                 file_status[key_file] = f"Error: {str(e)}"
         
@@ -270,7 +241,7 @@ def debug_storage_info():
         gcs_has_data = False
         if gcs_available:
             try:
-                gcs_has_data = gcs_manager.file_exists('report.csv')
+                gcs_has_data = gcs_manager.file_exists(POINTER_FILE) or gcs_manager.file_exists('report.csv')
             except:
                 pass
         
@@ -292,6 +263,7 @@ def debug_storage_info():
             'file_count': len(all_files),
             'csv_count': len(csv_files),
             'key_files_status': file_status,
+            'snapshot': getattr(snapshot_store.current(), 'version', None),
             'sample_files': csv_files[:20],
             'message': f'Currently using {source_type} (bucket: {bucket_name})',
             'warning': 'S3 is being used!' if s3_used and not force_gcs_only else None,
@@ -350,20 +322,59 @@ def debug_test_csv(filename):
         return jsonify({'error': str(e)}), 500
 
 
+@main_bp.route('/debug/memory')
+def debug_memory():
+    """Debug endpoint with this worker's memory use, top routes by memory growth and cached datasets"""
+    try:
+        summary = memory_summary(limit=int(request.args.get('limit', 10)))
+        summary['dataset_cache'] = dataset_cache.summary()
+        shared_store = get_shared_store()
+        summary['shared_datasets_mb'] = shared_store.files() if shared_store is not None else {}
+        return jsonify(summary)
+    except Exception as e:
+        logger.error(f"Error in debug_memory: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@main_bp.route('/debug/io')
+def debug_io():
+    """Debug endpoint with storage requests and bytes per backend and object, cache hit rates and projected costs"""
+    try:
+        limit = int(request.args.get('limit', 20))
+        return jsonify({
+            'worker': io_metrics.snapshot(limit),
+            # Summed over all workers and instances (null without Redis)
+            'global': io_metrics.global_snapshot(limit),
+            'prices': PRICES,
+        })
+    except Exception as e:
+        logger.error(f"Error in debug_io: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@main_bp.route('/debug/invalidation')
+def debug_invalidation():
+    """Debug endpoint with this worker's cache invalidation events, their delivery latency and the source watcher"""
+    return jsonify({
+        **invalidation_bus.stats(),
+        'snapshot': getattr(snapshot_store.current(), 'version', None),
+        'source_watcher': source_watcher.stats(),
+    })
+
+
 @main_bp.route('/snapshot_report')
 def snapshot_report_page():
     """Snapshot report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
         # Try different possible file names
-        snapshot_reports_df = storage_manager.read_csv('combined_snapshot_reports.csv')
+        snapshot_reports_df = load_dataset('combined_snapshot_reports.csv')
         if snapshot_reports_df.empty:
             # Try alternative name
-            snapshot_reports_df = storage_manager.read_csv('snapshot_reports.csv')
+            snapshot_reports_df = load_dataset('snapshot_reports.csv')
         if snapshot_reports_df.empty:
             logger.warning("Snapshot reports file is empty or not found")
             return render_template(TEMPLATE_SNAPSHOT_REPORTS, table_data=[])
-        table_data = snapshot_reports_df.to_dict(orient='records')
+        table_data = to_records(snapshot_reports_df)
         logger.info(f"Rendering snapshot report with {len(table_data)} records")
         return render_template(TEMPLATE_SNAPSHOT_REPORTS, table_data=table_data)
     except Exception as e:
@@ -375,11 +386,10 @@ def snapshot_report_page():
 def vhealth_report_page():
     """vHealth report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
-        combined_vhealth_df = storage_manager.read_csv('combined_vhealth_reports.csv')
+        combined_vhealth_df = load_dataset('combined_vhealth_reports.csv')
         if combined_vhealth_df.empty:
             return render_template(TEMPLATE_VHEALTH_REPORTS, table_data='[]')
-        table_data = combined_vhealth_df.to_dict(orient='records')
+        table_data = to_records(combined_vhealth_df)
         table_data_json = json.dumps(table_data)
         return render_template(TEMPLATE_VHEALTH_REPORTS, table_data=table_data_json)
     except Exception as e:
@@ -391,51 +401,20 @@ def vhealth_report_page():
 def firmware_report_page():
     """Firmware report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
-        combined_firmware_df = storage_manager.read_csv('combined_firmware_reports.csv')
-        customer_locations_df = storage_manager.read_csv('customer_locations.csv')
+        combined_firmware_df = load_dataset('combined_firmware_reports.csv')
+        dims = get_customer_locations()
         
-        if combined_firmware_df.empty or customer_locations_df.empty:
+        if combined_firmware_df.empty or dims.empty:
             return render_template(TEMPLATE_FIRMWARE_REPORTS, table_data=[], customers=[], locations=[])
         
-        # Find location column names (case-insensitive)
-        firmware_loc_col = None
-        for col in ['Location', 'location', 'LOCATION']:
-            if col in combined_firmware_df.columns:
-                firmware_loc_col = col
-                break
-        
-        customer_loc_col = None
-        for col in ['location', 'Location', 'LOCATION']:
-            if col in customer_locations_df.columns:
-                customer_loc_col = col
-                break
-        
-        if not firmware_loc_col or not customer_loc_col:
-            logger.error(f"Location columns not found. Firmware: {combined_firmware_df.columns.tolist()}, Customer: {customer_locations_df.columns.tolist()}")
+        if 'Location' not in combined_firmware_df.columns:
+            logger.error(f"Location column not found. Available: {combined_firmware_df.columns.tolist()}")
             return render_template(TEMPLATE_FIRMWARE_REPORTS, table_data=[], customers=[], locations=[])
         
-        combined_firmware_df = combined_firmware_df.merge(
-            customer_locations_df, left_on=firmware_loc_col, right_on=customer_loc_col, how='left'
-        )
-        
-        # Find customer column
-        customer_col = None
-        for col in ['Customer', 'customer', 'CUSTOMER']:
-            if col in customer_locations_df.columns:
-                customer_col = col
-                break
-        
-        if customer_col and 'Customer' not in combined_firmware_df.columns:
-            combined_firmware_df['Customer'] = combined_firmware_df[customer_loc_col].map(
-                customer_locations_df.set_index(customer_loc_col)[customer_col]
-            )
-        
-        table_data = combined_firmware_df.to_dict(orient='records')
-        customers = sorted(customer_locations_df[customer_col].unique()) if customer_col else []
-        locations = sorted(customer_locations_df[customer_loc_col].unique())
+        combined_firmware_df['Customer'] = dims.customer_of(combined_firmware_df['Location'])
         
-        return render_template(TEMPLATE_FIRMWARE_REPORTS, table_data=table_data, customers=customers, locations=locations)
+        table_data = to_records(combined_firmware_df)
+        return render_template(TEMPLATE_FIRMWARE_REPORTS, table_data=table_data, customers=dims.customers, locations=dims.locations)
     except Exception as e:
         logger.error(f"Error in firmware_report_page: {e}", exc_info=True)
         return render_template(TEMPLATE_FIRMWARE_REPORTS, table_data=[], customers=[], locations=[])
@@ -445,32 +424,19 @@ def firmware_report_page():
 def vinfo_report_page():
     """vInfo report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
-        rvtools_vinfo_df = storage_manager.read_csv('rvtools_vinfo.csv')
+        rvtools_vinfo_df = load_dataset('rvtools_vinfo.csv')
         
         if rvtools_vinfo_df.empty:
             return render_template(TEMPLATE_VINFO_REPORT, table_data=[], customers=[], locations=[])
         
-        # Find column names (case-insensitive)
-        location_col = None
-        for col in ['Location', 'location', 'LOCATION']:
-            if col in rvtools_vinfo_df.columns:
-                location_col = col
-                break
-        
-        customer_col = None
-        for col in ['Customer', 'customer', 'CUSTOMER']:
-            if col in rvtools_vinfo_df.columns:
-                customer_col = col
-                break
-        
-        if not location_col:
+        if 'Location' not in rvtools_vinfo_df.columns:
             logger.error(f"Location column not found. Available: {rvtools_vinfo_df.columns.tolist()}")
             return render_template(TEMPLATE_VINFO_REPORT, table_data=[], customers=[], locations=[])
         
-        table_data = rvtools_vinfo_df.to_dict(orient='records')
-        customers = sorted(rvtools_vinfo_df[customer_col].unique()) if customer_col else []
-        locations = sorted(rvtools_vinfo_df[location_col].unique())
+        table_data = to_records(rvtools_vinfo_df)
+        with span('transform.filter_options'):
+            customers = sorted(rvtools_vinfo_df['Customer'].unique()) if 'Customer' in rvtools_vinfo_df.columns else []
+            locations = sorted(rvtools_vinfo_df['Location'].unique())
         
         return render_template(TEMPLATE_VINFO_REPORT, table_data=table_data, customers=customers, locations=locations)
     except Exception as e:
@@ -482,11 +448,10 @@ def vinfo_report_page():
 def vdisk_report_page():
     """vDisk report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
-        combined_vdisk_reports_df = storage_manager.read_csv('combined_vdisk_reports.csv')
+        combined_vdisk_reports_df = load_dataset('combined_vdisk_reports.csv')
         if combined_vdisk_reports_df.empty:
             return render_template(TEMPLATE_VDISK_REPORT, table_data=[])
-        table_data = combined_vdisk_reports_df.to_dict(orient='records')
+        table_data = to_records(combined_vdisk_reports_df)
         return render_template(TEMPLATE_VDISK_REPORT, table_data=table_data)
     except Exception as e:
         logger.error(f"Error in vdisk_report_page: {e}", exc_info=True)
@@ -497,11 +462,10 @@ def vdisk_report_page():
 def vhosts_report_page():
     """vHosts report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
-        combined_vhosts_reports_df = storage_manager.read_csv('combined_vhosts_reports.csv')
+        combined_vhosts_reports_df = load_dataset('combined_vhosts_reports.csv')
         if combined_vhosts_reports_df.empty:
             return render_template(TEMPLATE_VHOSTS_REPORT, table_data=[])
-        table_data = combined_vhosts_reports_df.to_dict(orient='records')
+        table_data = to_records(combined_vhosts_reports_df)
         return render_template(TEMPLATE_VHOSTS_REPORT, table_data=table_data)
     except Exception as e:
         logger.error(f"Error in vhosts_report_page: {e}", exc_info=True)
@@ -512,143 +476,165 @@ def vhosts_report_page():
 def statistics_report_page():
     """Statistics report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
-        vrops_alerts_df = storage_manager.read_csv('vrops_alerts_historical.csv')
+        vrops_alerts_df = load_dataset('vrops_alerts_historical.csv')
         
         if vrops_alerts_df.empty:
             return render_template(TEMPLATE_STATISTICS_REPORT, table_data=[], locations=[])
         
-        # Check if required columns exist, use alternatives if needed
-        date_col = 'date' if 'date' in vrops_alerts_df.columns else 'Date' if 'Date' in vrops_alerts_df.columns else None
-        location_col = 'location' if 'location' in vrops_alerts_df.columns else 'Location' if 'Location' in vrops_alerts_df.columns else None
-        customer_col = 'customer' if 'customer' in vrops_alerts_df.columns else 'Customer' if 'Customer' in vrops_alerts_df.columns else None
-        
-        if not date_col or not location_col:
+        if 'date' not in vrops_alerts_df.columns or 'location' not in vrops_alerts_df.columns:
             logger.error(f"Missing required columns. Available: {vrops_alerts_df.columns.tolist()}")
             return render_template(TEMPLATE_STATISTICS_REPORT, table_data=[], locations=[])
         
-        vrops_alerts_df['date'] = pd.to_datetime(vrops_alerts_df[date_col], errors='coerce')
-        for col in ['critical', 'immediate', 'warning', 'total']:
-            if col in vrops_alerts_df.columns:
-                vrops_alerts_df[col] = vrops_alerts_df[col].fillna(0).astype(int)
-            else:
-                vrops_alerts_df[col] = 0
-        
-        vrops_alerts_df = vrops_alerts_df.sort_values(by=[location_col, 'date'])
-        vrops_alerts_df['critical_diff'] = vrops_alerts_df.groupby(location_col)['critical'].diff()
-        latest_data = vrops_alerts_df.sort_values('date', ascending=False).drop_duplicates(location_col)
-        
-        table_data = []
-        for _, row in latest_data.iterrows():
-            critical_diff = row['critical_diff']
-            color = '#f8d7da' if critical_diff > 0 else '#d4edda' if critical_diff < 0 else ''
-            table_data.append({
-                'customer': row.get(customer_col, 'Unknown') if customer_col else 'Unknown',
-                'date': row['date'].strftime('%Y-%m-%d') if pd.notna(row['date']) else 'Missing',
-                'location': row[location_col],
-                'critical': int(row['critical']),
-                'immediate': int(row['immediate']),
-                'warning': int(row['warning']),
-                'total': int(row['total']),
-                'color': color
-            })
+        with span('transform.latest_alerts', rows=len(vrops_alerts_df)):
+            latest_data = latest_per_location(vrops_alerts_df)
         
-        locations = vrops_alerts_df[location_col].unique() if location_col else []
+        table_data = to_records(latest_data)
+        locations = latest_data['location'].tolist()
         return render_template(TEMPLATE_STATISTICS_REPORT, table_data=table_data, locations=locations)
     except Exception as e:
         logger.error(f"Error in statistics_report_page: {e}", exc_info=True)
         return render_template(TEMPLATE_STATISTICS_REPORT, table_data=[], locations=[])
 
 
+@main_bp.route('/get_trend_data')
+def get_trend_data():
+    """
+    Alert count trend as JSON - reads directly from S3.
+
+    Query args: location (a list of points for that location; otherwise
+    {location: points} for all), freq ('day', 'week' or 'month') and max_points.
+    """
+    location = request.args.get('location')
+    freq = request.args.get('freq', 'day')
+    if freq not in BUCKETS:
+        return jsonify({'error': f"freq must be one of {', '.join(BUCKETS)}"}), 400
+    try:
+        max_points = int(request.args.get('max_points', MAX_TREND_POINTS))
+    except ValueError:
+        return jsonify({'error': 'max_points must be an integer'}), 400
+    
+    try:
+        vrops_alerts_df = load_dataset('vrops_alerts_historical.csv')
+        if vrops_alerts_df.empty or not {'date', 'location'} <= set(vrops_alerts_df.columns):
+            return jsonify([] if location else {})
+        
+        with span('transform.alert_trend', rows=len(vrops_alerts_df)):
+            trends = location_trends(vrops_alerts_df, location=location, freq=freq, max_points=max_points)
+        return jsonify(trends.get(location, []) if location else trends)
+    except Exception as e:
+        logger.error(f"Error in get_trend_data: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@main_bp.route('/get_alert_history')
+def get_alert_history():
+    """
+    Alert history summed per time bucket, as JSON - reads directly from S3.
+
+    Query args: location and customer (repeatable or comma-separated),
+    start and end (YYYY-MM-DD, inclusive), bucket ('day', 'week' or
+    'month') and max_points.
+    """
+    def values(name):
+        return [value.strip() for arg in request.args.getlist(name) for value in arg.split(',') if value.strip()]
+    
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        return jsonify({'error': f"bucket must be one of {', '.join(BUCKETS)}"}), 400
+    try:
+        start = pd.Timestamp(request.args['start']) if request.args.get('start') else None
+        end = pd.Timestamp(request.args['end']) if request.args.get('end') else None
+        max_points = int(request.args.get('max_points', MAX_TREND_POINTS))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid argument: {e}'}), 400
+    
+    try:
+        # One row per location and day, prepared once per loaded copy of the history
+        daily = load_derived('vrops_alerts_historical.csv', 'daily_history', daily_history)
+        with span('transform.alert_history', rows=len(daily)):
+            history = alert_history(
+                daily, locations=values('location'), customers=values('customer'),
+                start=start, end=end, bucket=bucket, max_points=max_points,
+            )
+        return jsonify(history)
+    except Exception as e:
+        logger.error(f"Error in get_alert_history: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
 @main_bp.route('/network_utilization_report')
 def network_utilization_report_page():
     """Network utilization report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
-        combined_network_utilization_df = storage_manager.read_csv('combined_network_utilization_report.csv')
+        combined_network_utilization_df = load_dataset('combined_network_utilization_report.csv')
         
-        # Load exclusions from storage
-        excluded_networks_df = pd.DataFrame(columns=['Network', 'Location'])
+        # Exclude specified networks
         try:
-            excluded_networks_df = storage_manager.read_csv('excluded_networks.csv')
-            if excluded_networks_df.empty or 'Network' not in excluded_networks_df.columns or 'Location' not in excluded_networks_df.columns:
-                excluded_networks_df = pd.DataFrame(columns=['Network', 'Location'])
+            combined_network_utilization_df = exclusion_store.exclude(combined_network_utilization_df)
         except Exception as e:
             logger.warning(f"Could not load exclusions from S3: {e}")
         
-        # Find column names
-        network_col = None
-        location_col = None
-        for col in ['Network', 'network', 'NETWORK']:
-            if col in combined_network_utilization_df.columns:
-                network_col = col
-                break
-        for col in ['Location', 'location', 'LOCATION']:
-            if col in combined_network_utilization_df.columns:
-                location_col = col
-                break
-        
-        # Exclude specified networks
-        if not excluded_networks_df.empty and network_col and location_col:
-            exclusions = excluded_networks_df[['Network', 'Location']].apply(tuple, axis=1)
-            combined_network_utilization_df = combined_network_utilization_df[
-                ~combined_network_utilization_df[[network_col, location_col]].apply(tuple, axis=1).isin(exclusions)
-            ]
-        
-        table_data = combined_network_utilization_df.to_dict(orient='records')
-        
-        customer_locations_df = s3_manager.read_csv('customer_locations.csv')
-        if customer_locations_df.empty:
-            return render_template(TEMPLATE_NETWORK_UTILIZATION_REPORT, table_data=table_data, locations=[], customers=[])
-        
-        # Find location and customer columns
-        loc_col = None
-        cust_col = None
-        for col in ['location', 'Location', 'LOCATION']:
-            if col in customer_locations_df.columns:
-                loc_col = col
-                break
-        for col in ['Customer', 'customer', 'CUSTOMER']:
-            if col in customer_locations_df.columns:
-                cust_col = col
-                break
+        table_data = to_records(combined_network_utilization_df)
         
-        locations = sorted(customer_locations_df[loc_col].unique()) if loc_col else []
-        customers = sorted(customer_locations_df[cust_col].unique()) if cust_col else []
-        
-        return render_template(TEMPLATE_NETWORK_UTILIZATION_REPORT, table_data=table_data, locations=locations, customers=customers)
+        dims = get_customer_locations()
+        return render_template(TEMPLATE_NETWORK_UTILIZATION_REPORT, table_data=table_data, locations=dims.locations, customers=dims.customers)
     except Exception as e:
         logger.error(f"Error in network_utilization_report_page: {e}", exc_info=True)
         return render_template(TEMPLATE_NETWORK_UTILIZATION_REPORT, table_data=[], locations=[], customers=[])
 
 
+@main_bp.route('/manage_exclusions')
+def manage_exclusions():
+    """Exclusion list (loaded into the network utilization report's modal)"""
+    try:
+        return render_template(TEMPLATE_MANAGE_EXCLUSIONS, exclusion_list=exclusion_store.records())
+    except Exception as e:
+        logger.error(f"Error in manage_exclusions: {e}", exc_info=True)
+        return render_template(TEMPLATE_MANAGE_EXCLUSIONS, exclusion_list=[])
+
+
+@main_bp.route('/add_exclusion', methods=['POST'])
+def add_exclusion():
+    """Exclude a network at a location from the network utilization report"""
+    network = request.form.get('network', '').strip()
+    location = request.form.get('location', '').strip()
+    if not network or not location:
+        return jsonify({'status': 'error', 'message': 'Network and location are required'}), 400
+    try:
+        if not exclusion_store.add(network, location):
+            return jsonify({'status': 'error', 'message': 'Could not save the exclusion'}), 500
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        logger.error(f"Error in add_exclusion: {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@main_bp.route('/remove_exclusion', methods=['POST'])
+def remove_exclusion():
+    """Remove a network exclusion"""
+    data = request.get_json(silent=True) or {}
+    network = str(data.get('network', '')).strip()
+    location = str(data.get('location', '')).strip()
+    if not network or not location:
+        return jsonify({'status': 'error', 'message': 'Network and location are required'}), 400
+    try:
+        if not exclusion_store.remove(network, location):
+            return jsonify({'status': 'error', 'message': 'Could not remove the exclusion'}), 500
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        logger.error(f"Error in remove_exclusion: {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
 @main_bp.route('/certificate_expiry_report')
 def certificate_expiry_report_page():
     """Certificate expiry report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
-        certificate_expiry_df = storage_manager.read_csv('combined_certificate_expiry_reports.csv')
-        table_data = certificate_expiry_df.to_dict(orient='records') if not certificate_expiry_df.empty else []
-        
-        customer_locations_df = s3_manager.read_csv('customer_locations.csv')
-        if customer_locations_df.empty:
-            return render_template(TEMPLATE_CERTIFICATE_EXPIRY_REPORT, table_data=table_data, customers=[], locations=[])
-        
-        # Find columns
-        loc_col = None
-        cust_col = None
-        for col in ['location', 'Location', 'LOCATION']:
-            if col in customer_locations_df.columns:
-                loc_col = col
-                break
-        for col in ['Customer', 'customer', 'CUSTOMER']:
-            if col in customer_locations_df.columns:
-                cust_col = col
-                break
+        certificate_expiry_df = load_dataset('combined_certificate_expiry_reports.csv')
+        table_data = to_records(certificate_expiry_df) if not certificate_expiry_df.empty else []
         
-        customers = sorted(customer_locations_df[cust_col].unique()) if cust_col else []
-        locations = sorted(customer_locations_df[loc_col].unique()) if loc_col else []
-        return render_template(TEMPLATE_CERTIFICATE_EXPIRY_REPORT, table_data=table_data, customers=customers, locations=locations)
+        dims = get_customer_locations()
+        return render_template(TEMPLATE_CERTIFICATE_EXPIRY_REPORT, table_data=table_data, customers=dims.customers, locations=dims.locations)
     except Exception as e:
         logger.error(f"Error in certificate_expiry_report_page: {e}", exc_info=True)
         return render_template(TEMPLATE_CERTIFICATE_EXPIRY_REPORT, table_data=[], customers=[], locations=[])
@@ -658,29 +644,11 @@ def certificate_expiry_report_page():
 def password_expiration_report_page():
     """Password expiration report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
-        password_expiration_df = storage_manager.read_csv('combined_password_expiration_reports.csv')
-        table_data = password_expiration_df.to_dict(orient='records') if not password_expiration_df.empty else []
-        
-        customer_locations_df = s3_manager.read_csv('customer_locations.csv')
-        if customer_locations_df.empty:
-            return render_template(TEMPLATE_PASSWORD_EXPIRATION_REPORT, table_data=table_data, customers=[], locations=[])
+        password_expiration_df = load_dataset('combined_password_expiration_reports.csv')
+        table_data = to_records(password_expiration_df) if not password_expiration_df.empty else []
         
-        # Find columns
-        loc_col = None
-        cust_col = None
-        for col in ['location', 'Location', 'LOCATION']:
-            if col in customer_locations_df.columns:
-                loc_col = col
-                break
-        for col in ['Customer', 'customer', 'CUSTOMER']:
-            if col in customer_locations_df.columns:
-                cust_col = col
-                break
-        
-        customers = sorted(customer_locations_df[cust_col].unique()) if cust_col else []
-        locations = sorted(customer_locations_df[loc_col].unique()) if loc_col else []
-        return render_template(TEMPLATE_PASSWORD_EXPIRATION_REPORT, table_data=table_data, customers=customers, locations=locations)
+        dims = get_customer_locations()
+        return render_template(TEMPLATE_PASSWORD_EXPIRATION_REPORT, table_data=table_data, customers=dims.customers, locations=dims.locations)
     except Exception as e:
         logger.error(f"Error in password_expiration_report_page: {e}", exc_info=True)
         return render_template(TEMPLATE_PASSWORD_EXPIRATION_REPORT, table_data=[], customers=[], locations=[])
@@ -690,29 +658,11 @@ def password_expiration_report_page():
 def antivirus_asset_report_page():
     """Antivirus asset report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
-        combined_antivirus_asset_report_df = storage_manager.read_csv('combined_antivirus_asset_reports.csv')
-        table_data = combined_antivirus_asset_report_df.to_dict(orient='records') if not combined_antivirus_asset_report_df.empty else []
-        
-        customer_locations_df = s3_manager.read_csv('customer_locations.csv')
-        if customer_locations_df.empty:
-            return render_template(TEMPLATE_ANTIVIRUS_ASSET_REPORT, table_data=table_data, customers=[], locations=[])
+        combined_antivirus_asset_report_df = load_dataset('combined_antivirus_asset_reports.csv')
+        table_data = to_records(combined_antivirus_asset_report_df) if not combined_antivirus_asset_report_df.empty else []
         
-        # Find columns
-        loc_col = None
-        cust_col = None
-        for col in ['location', 'Location', 'LOCATION']:
-            if col in customer_locations_df.columns:
-                loc_col = col
-                break
-        for col in ['Customer', 'customer', 'CUSTOMER']:
-            if col in customer_locations_df.columns:
-                cust_col = col
-                break
-        
-        customers = sorted(customer_locations_df[cust_col].unique()) if cust_col else []
-        locations = sorted(customer_locations_df[loc_col].unique()) if loc_col else []
-        return render_template(TEMPLATE_ANTIVIRUS_ASSET_REPORT, table_data=table_data, customers=customers, locations=locations)
+        dims = get_customer_locations()
+        return render_template(TEMPLATE_ANTIVIRUS_ASSET_REPORT, table_data=table_data, customers=dims.customers, locations=dims.locations)
     except Exception as e:
         logger.error(f"Error in antivirus_asset_report_page: {e}", exc_info=True)
         return render_template(TEMPLATE_ANTIVIRUS_ASSET_REPORT, table_data=[], customers=[], locations=[])
@@ -722,37 +672,12 @@ def antivirus_asset_report_page():
 def env_versions_report_page():
     """Environment versions report page - reads directly from S3"""
     try:
-        storage_manager = get_storage_manager()
-        combined_non_vcf_inventory_df = storage_manager.read_csv('combined_non_vcf_inventory.csv')
-        combined_vcf_inventory_df = storage_manager.read_csv('combined_vcf_inventory.csv')
-        
-        if combined_non_vcf_inventory_df.empty and combined_vcf_inventory_df.empty:
+        # Combined and deduplicated once per refresh (app.utils.inventory)
+        env_inventory_df = load_env_inventory()
+        if env_inventory_df.empty:
             return render_template(TEMPLATE_ENV_VERSIONS_REPORT, table_data=[])
         
-        combined_both_inventory_df = pd.concat([combined_non_vcf_inventory_df, combined_vcf_inventory_df], ignore_index=True)
-        
-        # Find date column
-        date_col = None
-        for col in ['Report Date', 'report_date', 'REPORT_DATE', 'Date', 'date']:
-            if col in combined_both_inventory_df.columns:
-                date_col = col
-                break
-        
-        if date_col:
-            combined_both_inventory_df['Report Date'] = pd.to_datetime(combined_both_inventory_df[date_col], errors='coerce')
-            if combined_both_inventory_df['Report Date'].dt.time.any():
-                combined_both_inventory_df['Report Date'] = combined_both_inventory_df['Report Date'].dt.date
-        
-        # Find required columns for deduplication
-        dedup_cols = []
-        for col in ['Customer', 'Location', 'Report Date', 'VM', 'Name']:
-            if col in combined_both_inventory_df.columns:
-                dedup_cols.append(col)
-        
-        if dedup_cols:
-            combined_both_inventory_df = combined_both_inventory_df.drop_duplicates(subset=dedup_cols)
-        
-        table_data = combined_both_inventory_df.to_dict(orient='records')
+        table_data = to_records(env_inventory_df)
         return render_template(TEMPLATE_ENV_VERSIONS_REPORT, table_data=table_data)
     except Exception as e:
         logger.error(f"Error in env_versions_report_page: {e}", exc_info=True)
@@ -764,25 +689,16 @@ def alerts_report_page():
     """Alerts report page - reads directly from S3"""
     try:
         location = request.args.get('location')
-        storage_manager = get_storage_manager()
-        vrops_list_of_alerts_df = storage_manager.read_csv('combined_vrops_list_of_alerts.csv')
+        if location:
+            # Only this location's partition (or the whole file, filtered)
+            filtered_alerts = load_location('combined_vrops_list_of_alerts.csv', location)
+        else:
+            filtered_alerts = load_dataset('combined_vrops_list_of_alerts.csv')
         
-        if vrops_list_of_alerts_df.empty:
+        if filtered_alerts.empty:
             return render_template(TEMPLATE_ALERTS_REPORT, alerts_data=[])
         
-        # Find location column
-        location_col = None
-        for col in ['Location', 'location', 'LOCATION']:
-            if col in vrops_list_of_alerts_df.columns:
-                location_col = col
-                break
-        
-        if location and location_col:
-            filtered_alerts = vrops_list_of_alerts_df[vrops_list_of_alerts_df[location_col] == location]
-        else:
-            filtered_alerts = vrops_list_of_alerts_df
-        
-        alerts_data = filtered_alerts.to_dict(orient='records')
+        alerts_data = to_records(filtered_alerts)
         return render_template(TEMPLATE_ALERTS_REPORT, alerts_data=alerts_data)
     except Exception as e:
         logger.error(f"Error in alerts_report_page: {e}", exc_info=True)
@@ -798,14 +714,8 @@ def set_frequencies():
             frequencies_df = pd.DataFrame(json.loads(frequency_data))
             
             # Upload the updated frequencies to both S3 (source) and GCS (cache)
-            s3_manager = get_s3_manager()
-            s3_success = s3_manager.write_csv(frequencies_df, 'frequencies.csv')
-            
-            # Also update GCS cache if available
-            gcs_manager = get_gcs_manager()
-            gcs_success = gcs_manager.write_csv(frequencies_df, 'frequencies.csv')
-            
-            success = s3_success  # Primary success is S3
+            success = write_dataset(frequencies_df, 'frequencies.csv')
+            invalidate_dataset('frequencies.csv')
             
             if success:
                 flash('Frequencies updated successfully', 'success')
@@ -822,7 +732,7 @@ def set_frequencies():
 
 
 @main_bp.route('/monthly_report')
-@cached(timeout=1800, key_prefix="monthly_report")
+@cached(timeout=1800, key_prefix="monthly_report", vary=lambda: datetime.now().strftime('%Y-%m-%d'))
 def monthly_report_page():
     """Monthly report page - reads directly from S3"""
     month = int(request.args.get('month', pd.Timestamp.now().month))
@@ -832,13 +742,11 @@ def monthly_report_page():
     selected_report = request.args.get('report', 'All Reports')
     exclude_missing = request.args.get('exclude_missing', 'false').lower() == 'true'
     
-    # Load data directly from S3 (stateless)
-    storage_manager = get_storage_manager()
-    reports_df = storage_manager.read_csv('report.csv')
-    frequencies_df = storage_manager.read_csv('frequencies.csv')
-    customer_location_df = storage_manager.read_csv('customer_locations.csv')
+    # Totals over all history plus the partitions around the month (or all of report.csv)
+    groups, rows = load_report_month(year, month)
+    frequencies_df = load_dataset('frequencies.csv')
     
-    if reports_df.empty:
+    if groups.empty:
         logger.warning("report.csv is empty")
         return render_template(
             TEMPLATE_MONTHLY_REPORTS,
@@ -859,93 +767,30 @@ def monthly_report_page():
             frequencies_data=[]
         )
     
-    # Normalize column names - find actual column names and create normalized versions
-    customer_col = None
-    location_col = None
-    report_name_col = None
-    date_col = None
-    attachment_col = None
-    
-    for col in ['customer', 'Customer', 'CUSTOMER']:
-        if col in reports_df.columns:
-            customer_col = col
-            break
-    for col in ['location', 'Location', 'LOCATION']:
-        if col in reports_df.columns:
-            location_col = col
-            break
-    for col in ['report name', 'report_name', 'Report Name', 'REPORT_NAME']:
-        if col in reports_df.columns:
-            report_name_col = col
-            break
-    for col in ['date', 'Date', 'DATE']:
-        if col in reports_df.columns:
-            date_col = col
-            break
-    for col in ['attachment', 'Attachment', 'ATTACHMENT']:
-        if col in reports_df.columns:
-            attachment_col = col
-            break
-    
-    if not customer_col or not location_col or not report_name_col:
-        logger.error(f"Missing required columns in report.csv. Available: {reports_df.columns.tolist()}")
-        return render_template(
-            TEMPLATE_MONTHLY_REPORTS,
-            table_data=pd.DataFrame(),
-            days_columns=[],
-            weekend_columns=[],
-            today_day=None,
-            customers=[],
-            locations=[],
-            reports=[],
-            selected_customer=selected_customer,
-            selected_location=selected_location,
-            selected_report=selected_report,
-            selected_month=month,
-            selected_year=year,
-            selected_month_name=pd.to_datetime(f'{year}-{month:02}-01').strftime('%B'),
-            exclude_missing=exclude_missing,
-            frequencies_data=[]
-        )
-    
-    # Create normalized copy with standard column names
-    filtered_df = reports_df.copy()
-    filtered_df['customer'] = filtered_df[customer_col]
-    filtered_df['location'] = filtered_df[location_col]
-    filtered_df['report name'] = filtered_df[report_name_col]
-    if date_col:
-        filtered_df['date'] = filtered_df[date_col]
-    if attachment_col:
-        filtered_df['attachment'] = filtered_df[attachment_col]
-    
-    # Apply filters
-    if selected_customer != 'All Customers':
-        filtered_df = filtered_df[filtered_df['customer'] == selected_customer]
-    if selected_location != 'All Locations':
-        filtered_df = filtered_df[filtered_df['location'] == selected_location]
-    if selected_report != 'All Reports':
-        filtered_df = filtered_df[filtered_df['report name'] == selected_report]
-    
-    if exclude_missing:
-        filtered_df = filtered_df[~filtered_df.apply(lambda row: row.str.contains('Missing').any(), axis=1)]
+    # Filter with a single mask - the cached frames are never copied or modified
+    filters = {
+        'customer': None if selected_customer == 'All Customers' else selected_customer,
+        'location': None if selected_location == 'All Locations' else selected_location,
+        'report': None if selected_report == 'All Reports' else selected_report,
+    }
+    rows_col, delivered_col = ('clean_rows', 'clean_delivered') if exclude_missing else ('rows', 'delivered')
+    filtered_groups = groups[report_mask(groups, **filters) & (groups[rows_col] > 0)]
+    filtered_rows = rows[report_mask(rows, **filters)] if not rows.empty else rows
+    if exclude_missing and not filtered_rows.empty:
+        filtered_rows = filtered_rows[~missing_rows(filtered_rows)]
     
-    customers = filtered_df['customer'].unique()
-    # Get locations from customer_location_df
-    loc_col = None
-    for col in ['location', 'Location', 'LOCATION']:
-        if col in customer_location_df.columns:
-            loc_col = col
-            break
-    locations = customer_location_df[loc_col].unique() if loc_col else []
-    reports = filtered_df['report name'].unique()
+    customers = filtered_groups['customer'].unique()
+    locations = get_customer_locations().locations
+    reports = filtered_groups['report name'].unique()
     
     # Create table data using the create_table_data function
+    table_groups = filtered_groups.groupby(['report name', 'location'], observed=True)[delivered_col].sum()
     table_data, days_columns, weekend_columns, today_day = create_table_data(
-        filtered_df, month, year, exclude_missing, frequencies_df, customer_location_df
+        table_groups, delivered_dates(filtered_rows), month, year, exclude_missing, frequencies_df
     )
     
     selected_month_name = pd.to_datetime(f'{year}-{month:02}-01').strftime('%B')
-    frequencies_data = frequencies_df.to_dict(orient='records')
+    frequencies_data = to_records(frequencies_df)
     
     # Convert reports to list of strings for template sorting
     reports_list = [str(r) for r in reports] if len(reports) > 0 else []
@@ -970,236 +815,406 @@ def monthly_report_page():
     )
 
 
-@main_bp.route('/refresh_cache', methods=['POST', 'GET'])
-def refresh_cache():
+# CSV files copied from S3 to GCS on refresh (plus any other CSV found in S3)
+REFRESH_FILES = [
+    'report.csv',
+    'frequencies.csv',
+    'customer_locations.csv',
+    'vrops_alerts_historical.csv',
+    'vrops_list_of_alerts.csv',
+    'combined_non_vcf_inventory.csv',
+    'combined_vcf_inventory.csv',
+    'excluded_networks.csv',
+    'combined_snapshot_reports.csv',
+    'combined_vhealth_reports.csv',
+    'combined_firmware_reports.csv',
+    'rvtools_vinfo.csv',
+    'combined_vdisk_reports.csv',
+    'combined_vhosts_reports.csv',
+    'combined_network_utilization_report.csv',
+    'combined_certificate_expiry_reports.csv',
+    'combined_password_expiration_reports.csv',
+    'combined_antivirus_asset_reports.csv',
+    'combined_vrops_list_of_alerts.csv',
+]
+
+
+def _publish_derived(target, frames: Optional[dict] = None, changed: Optional[set] = None):
     """
-    Refresh cache - copies data from S3 to GCS.
-    This reduces egress costs by caching data in GCS.
+    Rebuild the datasets derived from copied files: all of them, or only
+    those built from a file an incremental update changed.
+
+    Args:
+        target: Backend (or snapshot writer) the files were copied to
+        frames: Already loaded copied files by filename; others are read from target
+        changed: Files an incremental update copied (None for a full refresh)
     """
-    try:
-        logger.info("Starting data refresh: copying from S3 to GCS")
-        
-        # Get managers
-        s3_manager = get_s3_manager()
-        gcs_manager = get_gcs_manager()
-        
-        if gcs_manager is None:
-            error_msg = 'GCS not available. Install google-cloud-storage package. Using S3 directly.'
-            logger.warning(error_msg)
-            # Return JSON even for GET requests (for AJAX calls)
-            if request.headers.get('Accept') == 'application/json' or request.args.get('format') == 'json':
-                return jsonify({'status': 'warning', 'message': error_msg, 'note': 'Data will be read from S3 directly until GCS is configured.'}), 200
-            # For regular GET requests (browser navigation), redirect
-            if request.method == 'GET':
-                flash(error_msg, 'warning')
-                next_page = request.args.get('next', 'main.index')
-                return redirect(url_for(next_page))
-            return jsonify({'status': 'error', 'message': error_msg}), 500
-        
-        # List of CSV files to copy
-        csv_files = [
-            'report.csv',
-            'frequencies.csv',
-            'customer_locations.csv',
-            'vrops_alerts_historical.csv',
-            'vrops_list_of_alerts.csv',
-            'combined_non_vcf_inventory.csv',
-            'combined_vcf_inventory.csv',
-            'excluded_networks.csv',
-            'combined_snapshot_reports.csv',
-            'combined_vhealth_reports.csv',
-            'combined_firmware_reports.csv',
-            'rvtools_vinfo.csv',
-            'combined_vdisk_reports.csv',
-            'combined_vhosts_reports.csv',
-            'combined_network_utilization_report.csv',
-            'combined_certificate_expiry_reports.csv',
-            'combined_password_expiration_reports.csv',
-            'combined_antivirus_asset_reports.csv',
-            'combined_vrops_list_of_alerts.csv',
-        ]
-        
-        # List all files in S3 to find additional CSVs
-        s3_files = s3_manager.list_files()
-        csv_files_from_s3 = [f for f in s3_files if f.endswith('.csv')]
-        csv_files = list(set(csv_files + csv_files_from_s3))
-        
-        copied_files = []
-        total_size = 0
-        failed_files = []
-        
+    frames = frames or {}
+    load = lambda filename: frames[filename] if filename in frames else target.read_csv(filename)
+    if changed is None or changed & set(INVENTORY_SOURCES):
+        publish_env_inventory(target, [load(filename) for filename in INVENTORY_SOURCES])
+    if changed is None or REPORT_FILE in changed:
+        publish_report_partitions(target, load(REPORT_FILE))
+    datasets = tuple(filename for filename in LOCATION_DATASETS if changed is None or filename in changed)
+    if datasets:
+        publish_location_partitions(target, {filename: load(filename) for filename in datasets}, datasets)
+
+
+def _announce_refresh(changed: Optional[set] = None):
+    """Drop what a refresh replaced from this worker's caches and tell the other workers and instances"""
+    if changed is None:
+        invalidate_dataset()
+        exclusion_store.invalidate()
+        invalidation_bus.announce()
+    else:
+        apply_event({'datasets': sorted(changed)})
+        invalidation_bus.announce(sorted(changed))
+
+
+def _reload_offline(job: RefreshJob, filenames: Optional[list] = None) -> dict:
+    """
+    Refresh job for the local/in-memory backend - publish its plain files as a new snapshot.
+
+    Args:
+        filenames: Copy only these files, on top of the current snapshot (None for all of them)
+    """
+    storage = get_storage_manager()
+    target = snapshot_store.begin(storage, incremental=filenames is not None)
+    failed_files = []
+    # Generation of each plain file copied, recorded in the snapshot (app.utils.source_watcher)
+    generations = {}
+    if target is not storage:
+        # The plain CSV files are the source, copied as they are
+        listing = storage.list_generations()
+        if filenames is None:
+            csv_files = sorted(f for f in listing if f.endswith('.csv') and '/' not in f)
+        else:
+            csv_files = sorted(filenames)
+        job.set_files(csv_files)
+        for filename in csv_files:
+            job.file_started(filename)
+            content = storage.read_bytes(filename)
+            if content and target.write_from_bytes(content, filename):
+                if filename in listing:
+                    generations[filename] = listing[filename]
+                job.file_done(filename, size_bytes=len(content))
+            else:
+                failed_files.append(filename)
+                job.file_failed(filename, 'Copy failed')
+    changed = set(generations) if filenames is not None else None
+    message = f'Reloading data from {Config.DATA_SOURCE} storage ({Config.LOCAL_STORAGE_DIR})'
+    if changed is not None:
+        if not changed:
+            raise RuntimeError(f"None of the changed files could be copied: {', '.join(failed_files)}")
+        message = f'Updated {len(changed)} changed files from {Config.DATA_SOURCE} storage ({Config.LOCAL_STORAGE_DIR})'
+    _publish_derived(target, changed=changed)
+    if not snapshot_store.publish(target, keep=failed_files, sources=generations):
+        raise RuntimeError('Failed to publish the data snapshot')
+    snapshot_store.prune(storage, Config.SNAPSHOT_KEEP)
+    _announce_refresh(changed)
+    return {'status': 'success' if not failed_files else 'partial', 'message': message, 'copied_files': [], 'failed_files': failed_files}
+
+
+def _copy_s3_to_gcs(job: RefreshJob, filenames: Optional[list] = None) -> dict:
+    """
+    Refresh job: copy the CSV files from S3 to GCS, reporting per-file progress.
+
+    Files are copied byte for byte; only those derived datasets are built
+    from are parsed. Everything is written as a new snapshot that readers
+    switch to at the end; files that fail to copy (or are empty or missing
+    in S3) keep their last copy.
+
+    Args:
+        filenames: Copy only these files, on top of the current snapshot (None for all of them)
+
+    Returns:
+        Result with status, message, copied_files, failed_files, total_size_gb and costs
+    """
+    logger.info("Starting data refresh: copying from S3 to GCS")
+    s3_manager = get_s3_manager()
+    gcs_manager = get_gcs_manager()
+    target = snapshot_store.begin(gcs_manager, incremental=filenames is not None)
+
+    # One listing of S3 gives the additional CSVs and the generation (ETag) of each file
+    s3_generations = s3_manager.list_generations()
+    if filenames is None:
+        csv_files = sorted(set(REFRESH_FILES + [f for f in s3_generations if f.endswith('.csv')]))
+    else:
+        csv_files = sorted(filenames)
+    job.set_files(csv_files)
+
+    copied_files = []
+    total_size = 0
+    failed_files = []
+    skipped_files = []
+    # Copied files that derived datasets are built from
+    frames = {}
+    # Generation each copy (or skipped empty file) was made from, recorded in the snapshot
+    generations = {}
+
+    # Requests and bytes of the copy itself, as measured by the storage managers
+    with io_metrics.scope() as migration_usage:
         for filename in csv_files:
             try:
                 # Read from S3
                 logger.info(f"Copying {filename} from S3 to GCS")
-                df = s3_manager.read_csv(filename)
-                
-                if df.empty:
-                    logger.warning(f"{filename} is empty, skipping")
+                job.file_started(filename)
+                content = s3_manager.read_bytes(filename)
+
+                # No data rows (missing, empty or just a header)
+                if not content or b'\n' not in content.strip():
+                    logger.warning(f"{filename} is empty or missing, skipping")
+                    skipped_files.append(filename)
+                    if filename in s3_generations:
+                        generations[filename] = s3_generations[filename]
+                    job.file_done(filename, status='skipped')
                     continue
-                
-                # Write to GCS
-                success = gcs_manager.write_csv(df, filename)
-                
+                rows = None
+                if filename in INVENTORY_SOURCES or filename in LOCATION_DATASETS or filename == REPORT_FILE:
+                    frames[filename] = parse_csv(content, filename)
+                    rows = len(frames[filename])
+
+                # Write to GCS, exactly as it is in S3
+                success = target.write_from_bytes(content, filename)
+
                 if success:
-                    file_size = gcs_manager.get_file_size(filename)
+                    file_size = len(content)
                     total_size += file_size
                     copied_files.append({
                         'filename': filename,
-                        'rows': len(df),
+                        'rows': rows,
                         'size_bytes': file_size
                     })
-                    logger.info(f"Successfully copied {filename} ({len(df)} rows, {file_size} bytes)")
+                    if filename in s3_generations:
+                        generations[filename] = s3_generations[filename]
+                    job.file_done(filename, rows=rows or 0, size_bytes=file_size)
+                    logger.info(f"Successfully copied {filename} ({file_size} bytes)")
                 else:
                     failed_files.append(filename)
+                    job.file_failed(filename, 'GCS write failed')
                     logger.error(f"Failed to copy {filename}")
-                    
+
             except Exception as e:
                 logger.error(f"Error copying {filename}: {e}", exc_info=True)
                 failed_files.append(filename)
-        
-        # Calculate costs
-        total_size_gb = total_size / (1024 ** 3)
-        costs = calculate_migration_costs(total_size_gb, len(copied_files))
-        
-        result = {
-            'status': 'success' if not failed_files else 'partial',
-            'message': f'Copied {len(copied_files)} files ({total_size_gb:.2f} GB) from S3 to GCS',
-            'copied_files': copied_files,
-            'failed_files': failed_files,
-            'total_size_gb': round(total_size_gb, 2),
-            'costs': costs
-        }
-        
-        if request.method == 'GET':
-            # Check if this is an AJAX request (wants JSON)
-            if request.headers.get('Accept') == 'application/json' or request.args.get('format') == 'json':
-                # Return JSON for AJAX requests
-                return jsonify(result), 200
-            
-            # For regular browser navigation, redirect
-            next_page = request.args.get('next', 'main.index')
-            # Convert path to endpoint name if needed
+                job.file_failed(filename, str(e))
+
+        if filenames is None:
+            # Derived datasets, built from what was just copied
+            changed = None
+            frames = {filename: frames.get(filename, pd.DataFrame())
+                      for filename in (*INVENTORY_SOURCES, *LOCATION_DATASETS, REPORT_FILE)}
+        else:
+            # Only those of the changed files, with the others read from the current snapshot
+            changed = {copied['filename'] for copied in copied_files}
+            if not changed and not skipped_files:
+                raise RuntimeError(f"None of the changed files could be copied: {', '.join(failed_files)}")
+        _publish_derived(target, frames, changed)
+
+        # Serve the refreshed data from now on (all readers switch at once)
+        if not snapshot_store.publish(target, keep=failed_files + skipped_files, sources=generations):
+            raise RuntimeError('Copied the files but failed to publish the data snapshot')
+        snapshot_store.prune(gcs_manager, Config.SNAPSHOT_KEEP)
+    _announce_refresh(changed)
+
+    # Calculate costs
+    total_size_gb = total_size / (1024 ** 3)
+    costs = calculate_migration_costs(total_size_gb, migration_usage)
+
+    return {
+        'status': 'success' if not failed_files else 'partial',
+        'message': f'Copied {len(copied_files)} files ({total_size_gb:.2f} GB) from S3 to GCS',
+        'copied_files': copied_files,
+        'failed_files': failed_files,
+        'total_size_gb': round(total_size_gb, 2),
+        'costs': costs
+    }
+
+
+def _update_changed_sources(filenames: list) -> bool:
+    """Source watcher handler: copy the files changed upstream into a new snapshot, as a refresh job; True if started"""
+    if Config.DATA_SOURCE in OFFLINE_DATA_SOURCES:
+        work = _reload_offline
+    elif get_gcs_manager() is not None:
+        work = _copy_s3_to_gcs
+    else:
+        return False
+    job, started = refresh_jobs.start(partial(work, filenames=filenames))
+    if started:
+        logger.info(f"Started refresh {job['id']} for {len(filenames)} files changed upstream")
+    return started
+
+
+source_watcher.on_change(_update_changed_sources)
+
+
+def _refresh_next_page() -> str:
+    """Endpoint to redirect to after a browser refresh request (?next= path or endpoint)"""
+    next_page = request.args.get('next', 'main.index')
+    # Convert path to endpoint name if needed
+    if next_page.startswith('/'):
+        # Convert /monthly_report to main.monthly_report_page
+        if next_page == '/monthly_report':
+            next_page = 'main.monthly_report_page'
+        elif next_page == '/':
+            next_page = 'main.index'
+        else:
+            # Try to find the route
+            from flask import current_app
+            for rule in current_app.url_map.iter_rules():
+                if rule.rule == next_page:
+                    next_page = rule.endpoint
+                    break
             if next_page.startswith('/'):
-                # Convert /monthly_report to main.monthly_report_page
-                if next_page == '/monthly_report':
-                    next_page = 'main.monthly_report_page'
-                elif next_page == '/':
-                    next_page = 'main.index'
-                else:
-                    # Try to find the route
-                    from flask import current_app
-                    with current_app.app_context():
-                        for rule in current_app.url_map.iter_rules():
-                            if rule.rule == next_page:
-                                next_page = rule.endpoint
-                                break
-                    if next_page.startswith('/'):
-                        next_page = 'main.index'  # Fallback
-            
-            flash(result['message'], 'success' if not failed_files else 'warning')
-            return redirect(url_for(next_page))
-        
-        return jsonify(result), 200
-        
+                next_page = 'main.index'  # Fallback
+    return next_page
+
+
+@main_bp.route('/refresh_cache', methods=['POST', 'GET'])
+def refresh_cache():
+    """
+    Refresh cache - copies data from S3 to GCS.
+    This reduces egress costs by caching data in GCS.
+
+    The copy runs as a background job (one at a time across instances); the
+    response has its id and a status URL to poll (/refresh_status/<job_id>).
+    If a refresh is already running, that job is returned instead.
+    """
+    wants_json = request.method == 'POST' or request.headers.get('Accept') == 'application/json' or request.args.get('format') == 'json'
+    try:
+        if Config.DATA_SOURCE in OFFLINE_DATA_SOURCES:
+            work = _reload_offline
+        elif get_gcs_manager() is None:
+            error_msg = 'GCS not available. Install google-cloud-storage package. Using S3 directly.'
+            logger.warning(error_msg)
+            # Return JSON even for GET requests (for AJAX calls)
+            if request.method == 'GET' and wants_json:
+                return jsonify({'status': 'warning', 'message': error_msg, 'note': 'Data will be read from S3 directly until GCS is configured.'}), 200
+            # For regular GET requests (browser navigation), redirect
+            if request.method == 'GET':
+                flash(error_msg, 'warning')
+                return redirect(url_for(_refresh_next_page()))
+            return jsonify({'status': 'error', 'message': error_msg}), 500
+        else:
+            work = _copy_s3_to_gcs
+
+        job, started = refresh_jobs.start(work)
+        status_url = url_for('main.refresh_status', job_id=job['id'])
+        message = 'Data refresh started' if started else 'A data refresh is already running'
+
+        if not wants_json:
+            # For regular browser navigation, redirect
+            flash(f"{message} (progress: {status_url})", 'info')
+            return redirect(url_for(_refresh_next_page()))
+
+        return jsonify({
+            'status': 'started' if started else 'running',
+            'message': message,
+            'job_id': job['id'],
+            'status_url': status_url,
+        }), 202
+
     except Exception as e:
         logger.error(f"Error in refresh_cache: {e}", exc_info=True)
         error_msg = f'Error refreshing data: {str(e)}'
-        
+
         if request.method == 'GET':
             flash(error_msg, 'error')
             return redirect(url_for('main.index'))
-        
+
         return jsonify({'status': 'error', 'message': error_msg}), 500
 
 
-def calculate_migration_costs(total_size_gb: float, num_files: int) -> dict:
+@main_bp.route('/refresh_status/<job_id>')
+def refresh_status(job_id):
     """
-    Calculate costs for migrating data from S3 to GCS.
-    
-    Costs (as of 2024):
-    - AWS S3 egress (first 10TB): $0.09/GB
-    - GCS Standard Storage: $0.020/GB/month
-    - GCS Class A operations (write): $0.05/10k operations
-    - GCS Class B operations (read): $0.004/10k operations
-    - GCS to Cloud Run transfer: FREE (same region)
-    
+    Progress of a refresh job ('latest' for the most recent one), from any instance.
+
+    Returns:
+        JSON job state: status (running, success, partial or error), message,
+        per-file progress, files_done/files_total, bytes_copied and, once
+        finished, the result (copied/failed files and costs)
+    """
+    job = refresh_jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'Unknown refresh job: {job_id}'}), 404
+    job['status_url'] = url_for('main.refresh_status', job_id=job['id'])
+    return jsonify(job), 200
+
+
+def calculate_migration_costs(total_size_gb: float, migration_usage: dict) -> dict:
+    """
+    Calculate costs for migrating data from S3 to GCS, from measured usage.
+
+    The one-time cost uses the requests and bytes the copy actually made;
+    the ongoing cost projects the GCS reads counted since the I/O counters
+    started (all instances if Redis aggregation is on, else this worker) to
+    a month - once they cover MIN_PROJECTION_WINDOW; until then the read
+    and savings figures are None. Prices are in app.utils.io_metrics.PRICES.
+
+    Args:
+        total_size_gb: Size of the copied data
+        migration_usage: Counters collected by io_metrics.scope() around the copy
+
     Returns:
         Dictionary with cost breakdown
     """
-    # AWS S3 egress cost (one-time)
-    aws_egress_cost = total_size_gb * 0.09  # $0.09/GB
-    
-    # GCS storage cost (monthly)
-    gcs_storage_monthly = total_size_gb * 0.020  # $0.020/GB/month
-    
-    # GCS operations cost
-    # Class A (write): assume 1 write per file
-    gcs_write_ops = num_files
-    gcs_write_cost = (gcs_write_ops / 10000) * 0.05  # $0.05/10k ops
-    
-    # Class B (read): assume 100 reads per day = 3000/month
-    reads_per_month = 100 * 30
-    gcs_read_ops = reads_per_month
-    gcs_read_cost = (gcs_read_ops / 10000) * 0.004  # $0.004/10k ops
-    
-    total_monthly = gcs_storage_monthly + gcs_write_cost + gcs_read_cost
-    
+    migration = usage_costs(summarize_backends(migration_usage))
+
+    report = io_metrics.global_snapshot() or io_metrics.snapshot()
+    monthly = report['projected_monthly_usd']
+    gcs_storage_monthly = total_size_gb * PRICES['gcs_storage_per_gb_month']
+    if monthly is not None:
+        gcs_read_monthly = monthly['gcs_class_b_usd']
+        total_monthly = gcs_storage_monthly + gcs_read_monthly
+        # The same reads served from S3 would have been billed as egress
+        s3_egress_monthly = monthly['s3_egress_avoided_usd']
+    else:
+        # Too little traffic counted yet to project reads to a month
+        gcs_read_monthly = total_monthly = s3_egress_monthly = None
+    rounded = lambda value: round(value, 4) if value is not None else None
+
     return {
         'one_time_migration': {
-            'aws_egress_usd': round(aws_egress_cost, 4),
-            'gcs_write_ops_usd': round(gcs_write_cost, 4),
-            'total_usd': round(aws_egress_cost + gcs_write_cost, 4)
+            'aws_egress_usd': round(migration['s3_egress_usd'], 4),
+            'aws_requests_usd': round(migration['s3_requests_usd'], 4),
+            'gcs_write_ops_usd': round(migration['gcs_class_a_usd'], 4),
+            'total_usd': round(migration['total_usd'], 4)
         },
         'monthly_ongoing': {
             'gcs_storage_usd': round(gcs_storage_monthly, 4),
-            'gcs_read_ops_usd': round(gcs_read_cost, 4),
-            'total_usd': round(total_monthly, 4)
+            'gcs_read_ops_usd': rounded(gcs_read_monthly),
+            'total_usd': rounded(total_monthly)
         },
         'savings_vs_s3_egress': {
-            's3_egress_per_month_usd': round(reads_per_month * (total_size_gb * 0.09), 4),
-            'gcs_total_per_month_usd': round(total_monthly, 4),
-            'savings_usd': round((reads_per_month * (total_size_gb * 0.09)) - total_monthly, 4)
-        }
+            's3_egress_per_month_usd': rounded(s3_egress_monthly),
+            'gcs_total_per_month_usd': rounded(total_monthly),
+            'savings_usd': rounded(s3_egress_monthly - total_monthly) if monthly is not None else None
+        },
+        'measured_over_hours': round(report['elapsed_s'] / 3600, 2)
     }
 
 
 # Additional routes for scraping and data APIs
-import requests
-from bs4 import BeautifulSoup
-import re
 
 
 def get_locations():
     """Get list of locations from S3"""
     try:
-        storage_manager = get_storage_manager()
-        customer_locations_df = storage_manager.read_csv('customer_locations.csv')
-        if customer_locations_df.empty:
-            return []
-        
-        # Try different column name variations
-        location_col = None
-        for col in ['location', 'Location', 'LOCATION']:
-            if col in customer_locations_df.columns:
-                location_col = col
-                break
-        
-        if not location_col:
-            logger.error(f"Location column not found. Available: {customer_locations_df.columns.tolist()}")
-            return []
-        
-        return customer_locations_df[location_col].unique().tolist()
+        return list(get_customer_locations().locations)
     except Exception as e:
         logger.error(f"Error getting locations: {e}", exc_info=True)
         return []
 
 
+@traced('scrape.esxi_versions')
 def scrape_vmware_versions(url):
     """Scrape VMware ESXi versions from knowledge base"""
-    response = requests.get(url)
+    with span('scrape.fetch', **{'http.url': url}) as current:
+        response = requests.get(url)
+        current.set_attributes({'http.status_code': response.status_code, 'bytes': len(response.content)})
     response.raise_for_status()
-    soup = BeautifulSoup(response.text, 'html.parser')
+    soup = bs4.BeautifulSoup(response.text, 'html.parser')
     tables = soup.find_all('table')
     
     def process_table(table):
@@ -1234,7 +1249,7 @@ def vmware_versions_report_page():
         versions_df = scrape_vmware_versions(
             'https://knowledge.broadcom.com/external/article/316595/build-numbers-and-versions-of-vmware-esx.html'
         )
-        table_data = versions_df.to_dict(orient='records')
+        table_data = to_records(versions_df)
         locations = get_locations()
         return render_template(TEMPLATE_VMWARE_VERSIONS_REPORT, table_data=table_data, locations=locations)
     except Exception as e:
@@ -1246,8 +1261,10 @@ def vmware_versions_report_page():
 def get_vhosts_data():
     """Get vHosts data as JSON - reads directly from S3"""
     location = request.args.get('location', 'all')
-    storage_manager = get_storage_manager()
-    combined_vhosts_reports_df = storage_manager.read_csv('combined_vhosts_reports.csv')
+    if location != 'all':
+        combined_vhosts_reports_df = load_location('combined_vhosts_reports.csv', location)
+    else:
+        combined_vhosts_reports_df = load_dataset('combined_vhosts_reports.csv')
     
     def extract_version_and_build(esx_version):
         match = re.search(r'VMware ESXi (\d+\.\d+)\.\d+ build-(\d+)', str(esx_version))
@@ -1255,52 +1272,52 @@ def get_vhosts_data():
             return match.group(1), match.group(2)
         return None, None
     
-    combined_vhosts_reports_df['Version'], combined_vhosts_reports_df['Build'] = zip(
-        *combined_vhosts_reports_df['ESX Version'].apply(extract_version_and_build)
-    )
-    
-    if location != 'all':
-        combined_vhosts_reports_df = combined_vhosts_reports_df[
-            combined_vhosts_reports_df['Location'] == location
-        ]
+    with span('transform.parse_versions', rows=len(combined_vhosts_reports_df)):
+        # Lists rather than zip(*...), which fails on a location without hosts
+        versions = combined_vhosts_reports_df['ESX Version'].apply(extract_version_and_build).tolist()
+        combined_vhosts_reports_df['Version'] = [version for version, _ in versions]
+        combined_vhosts_reports_df['Build'] = [build for _, build in versions]
     
     versions_df = scrape_vmware_versions(
         'https://knowledge.broadcom.com/external/article/316595/build-numbers-and-versions-of-vmware-esx.html'
     )
     versions_df['Major_Minor_Version'] = versions_df['Version'].str[:8].str[-3:]
     
-    merged_data = pd.merge(
-        combined_vhosts_reports_df,
-        versions_df[['Major_Minor_Version', 'Build Number', 'Label']],
-        left_on=['Version', 'Build'],
-        right_on=['Major_Minor_Version', 'Build Number'],
-        how='left'
-    )
-    
-    merged_data = merged_data.where(pd.notnull(merged_data), None)
-    merged_data['Label'] = merged_data['Label'].fillna('NoLabel').replace('None', 'NoLabel')
-    
-    pie_chart_data = merged_data.groupby('Label').size().reset_index(name='count')
-    pie_chart_data['count'] = pie_chart_data['count'].astype(int)
+    with span('transform.merge_versions'):
+        merged_data = pd.merge(
+            combined_vhosts_reports_df,
+            versions_df[['Major_Minor_Version', 'Build Number', 'Label']],
+            left_on=['Version', 'Build'],
+            right_on=['Major_Minor_Version', 'Build Number'],
+            how='left'
+        )
+
+        merged_data['Label'] = merged_data['Label'].fillna('NoLabel').replace('None', 'NoLabel')
+
+        pie_chart_data = merged_data.groupby('Label').size().reset_index(name='count')
+        pie_chart_data['count'] = pie_chart_data['count'].astype(int)
     
-    hosts_table_data = merged_data[
-        ['Host', 'Version', 'Build', 'Location', 'Customer', 'Label']
-    ].to_dict(orient='records')
+    # Missing values as null in the JSON (categorical columns would give NaN)
+    hosts_table = merged_data[['Host', 'Version', 'Build', 'Location', 'Customer', 'Label']].astype(object)
+    hosts_table_data = to_records(hosts_table.where(pd.notnull(hosts_table), None))
     
-    scraped_data = versions_df.to_dict(orient='records')
+    scraped_data = to_records(versions_df)
     
     return jsonify({
-        'pie_chart_data': pie_chart_data.to_dict(orient='records'),
+        'pie_chart_data': to_records(pie_chart_data),
         'hosts_table_data': hosts_table_data,
         'scraped_data': scraped_data
     })
 
 
+@traced('scrape.vcenter_versions')
 def scrape_vcenter_versions():
     """Scrape vCenter versions from knowledge base"""
     url = "https://knowledge.broadcom.com/external/article/326316/build-numbers-and-versions-of-vmware-vce.html"
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    with span('scrape.fetch', **{'http.url': url}) as current:
+        response = requests.get(url)
+        current.set_attributes({'http.status_code': response.status_code, 'bytes': len(response.content)})
+    soup = bs4.BeautifulSoup(response.content, 'html.parser')
     tables = soup.find_all('table')
     vcenter_data = []
     
@@ -1330,8 +1347,10 @@ def get_vinfo_data():
     """Get vInfo data as JSON - reads directly from S3"""
     location = request.args.get('location', 'all')
     vcenter_data = scrape_vcenter_versions()
-    storage_manager = get_storage_manager()
-    vinfo_df = storage_manager.read_csv('rvtools_vinfo.csv')
+    if location != 'all':
+        vinfo_df = load_location('rvtools_vinfo.csv', location)
+    else:
+        vinfo_df = load_dataset('rvtools_vinfo.csv')
     vcs_machines = vinfo_df[vinfo_df['VM'].str.contains("vcs00", na=False)].copy()
     
     vcs_machines.loc[:, 'Location'] = vinfo_df.loc[
@@ -1341,34 +1360,33 @@ def get_vinfo_data():
         vinfo_df['VM'].str.contains("vcs00", na=False), 'Customer'
     ]
     
-    if location != 'all':
-        vcs_machines = vcs_machines[vcs_machines['Location'] == location]
-    
-    vcs_machines['Version'], vcs_machines['Build'] = zip(
-        *vcs_machines['VI SDK Server type'].apply(
-            lambda x: re.search(r'VMware vCenter Server (\d+\.\d+)\.\d+ build-(\d+)', str(x)).groups()
-            if re.search(r'VMware vCenter Server (\d+\.\d+)\.\d+ build-(\d+)', str(x))
-            else ('', '')
+    with span('transform.parse_versions', rows=len(vcs_machines)):
+        vcs_machines['Version'], vcs_machines['Build'] = zip(
+            *vcs_machines['VI SDK Server type'].apply(
+                lambda x: re.search(r'VMware vCenter Server (\d+\.\d+)\.\d+ build-(\d+)', str(x)).groups()
+                if re.search(r'VMware vCenter Server (\d+\.\d+)\.\d+ build-(\d+)', str(x))
+                else ('', '')
+            )
         )
-    )
     
     vcenter_df = pd.DataFrame(vcenter_data)
     vcenter_df['Major_Minor_Version'] = vcenter_df['Version'].apply(
         lambda x: '.'.join(str(x).split('.')[:2])
     )
     
-    merged_data = pd.merge(
-        vcs_machines,
-        vcenter_df,
-        left_on=['Version', 'Build'],
-        right_on=['Major_Minor_Version', 'Build Version'],
-        how='left'
-    )
-    
-    merged_data['Label'] = merged_data['Label'].fillna('NoLabel').replace('None', 'NoLabel')
-    vcs_machines_data = merged_data[
+    with span('transform.merge_versions'):
+        merged_data = pd.merge(
+            vcs_machines,
+            vcenter_df,
+            left_on=['Version', 'Build'],
+            right_on=['Major_Minor_Version', 'Build Version'],
+            how='left'
+        )
+
+        merged_data['Label'] = merged_data['Label'].fillna('NoLabel').replace('None', 'NoLabel')
+    vcs_machines_data = to_records(merged_data[
         ['VM', 'VI SDK Server type', 'Location', 'Customer', 'Label']
-    ].to_dict(orient='records')
+    ])
     
     pie_chart_data = pd.DataFrame(vcs_machines_data).groupby('Label').size().reset_index(name='count')
     pie_chart_data['count'] = pie_chart_data['count'].astype(int)
@@ -1376,5 +1394,5 @@ def get_vinfo_data():
     return jsonify({
         'vcenter_data': vcenter_data,
         'vcs_machines_data': vcs_machines_data,
-        'pie_chart_data': pie_chart_data.to_dict(orient='records')
+        'pie_chart_data': to_records(pie_chart_data)
     })
@@ -3,6 +3,7 @@ Configuration module for Reports App Cloud Run version.
 Optimized for stateless, on-demand scaling.
 """
 import os
+import tempfile
 from typing import Optional
 
 
@@ -43,13 +44,21 @@ class Config:
     
     # Data source preference: 'gcs' (default) or 's3'
     # Set to 'gcs-only' to force GCS and fail if GCS is not available
+    # 'local' (files in LOCAL_STORAGE_DIR) and 'memory' (loaded from it) run without any bucket
     DATA_SOURCE = os.getenv('DATA_SOURCE', 'gcs')
     FORCE_GCS_ONLY = os.getenv('FORCE_GCS_ONLY', 'false').lower() == 'true'
+    LOCAL_STORAGE_DIR = os.getenv('LOCAL_STORAGE_DIR', 'data')
+    # Simulated bucket round trip and transfer rate for the local/memory backends (0 = none)
+    STORAGE_LATENCY_MS = float(os.getenv('STORAGE_LATENCY_MS', '0'))
+    STORAGE_BANDWIDTH_MBPS = float(os.getenv('STORAGE_BANDWIDTH_MBPS', '0'))
     
     # Cloudflare protection
     ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'reporting.dabronet.pl').split(',')
     REQUIRE_CLOUDFLARE = os.getenv('REQUIRE_CLOUDFLARE', 'true').lower() == 'true'
     CLOUDFLARE_IPS_URL = 'https://www.cloudflare.com/ips-v4'
+    CLOUDFLARE_IPS_V6_URL = 'https://www.cloudflare.com/ips-v6'
+    CLOUDFLARE_IPS_REFRESH_INTERVAL = int(os.getenv('CLOUDFLARE_IPS_REFRESH_INTERVAL', '86400'))
+    CLOUDFLARE_IPS_REFRESH_RETRIES = int(os.getenv('CLOUDFLARE_IPS_REFRESH_RETRIES', '3'))
 
     # Redis Cache (Cloud Memorystore)
     REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
@@ -63,6 +72,26 @@ class Config:
     CACHE_REDIS_PASSWORD = REDIS_PASSWORD
     CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_TTL', '3600'))
 
+    # In-process dataset cache per worker (seconds, 0 disables)
+    DATASET_CACHE_TTL = int(os.getenv('DATASET_CACHE_TTL', '300'))
+    # One download and parse per instance: workers read a dataset from an Arrow file another worker wrote
+    # (kept in SHARED_DATASET_DIR, in-memory on Cloud Run; for shared memory use GUNICORN_PRELOAD instead)
+    SHARED_DATASETS = os.getenv('SHARED_DATASETS', 'false').lower() == 'true'
+    SHARED_DATASET_DIR = os.getenv('SHARED_DATASET_DIR', os.path.join(tempfile.gettempdir(), 'reports-app-datasets'))
+    # Refreshes publish into snapshots/<version>/ and switch readers over with one pointer object
+    DATA_SNAPSHOTS = os.getenv('DATA_SNAPSHOTS', 'true').lower() == 'true'
+    # Seconds between reads of the pointer per worker, and snapshot versions kept in storage
+    SNAPSHOT_CHECK_INTERVAL = float(os.getenv('SNAPSHOT_CHECK_INTERVAL', '30'))
+    SNAPSHOT_KEEP = int(os.getenv('SNAPSHOT_KEEP', '3'))
+    # Seconds between listings of the source bucket to pick up files changed upstream (0 disables)
+    SOURCE_WATCH_INTERVAL = float(os.getenv('SOURCE_WATCH_INTERVAL', '0'))
+
+    # Startup warmup: 'off', 'background' (warm in a thread, /ready waits) or 'blocking' (warm before serving)
+    WARMUP_MODE = os.getenv('WARMUP_MODE', 'off').lower()
+    WARMUP_DATASETS = os.getenv('WARMUP_DATASETS', 'report.csv,frequencies.csv,customer_locations.csv').split(',')
+    # Set by gunicorn.conf.py when preloading: background threads start in each worker after fork
+    DEFER_BACKGROUND_THREADS = os.getenv('DEFER_BACKGROUND_THREADS', 'false').lower() == 'true'
+
     # Cloud Run specific
     PORT = int(os.getenv('PORT', '8080'))
     WORKERS = int(os.getenv('WORKERS', '2'))
@@ -72,6 +101,26 @@ class Config:
     # Logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 
+    # Tracing (OpenTelemetry): 'none', 'console', 'file', 'otlp', 'gcp' or a 'module:factory' path
+    TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'none').strip()
+    TRACING_FILE = os.getenv('TRACING_FILE', 'traces.jsonl')
+    TRACING_SAMPLE_RATIO = float(os.getenv('TRACING_SAMPLE_RATIO', '1.0'))
+    TRACING_SERVICE_NAME = os.getenv('K_SERVICE', 'reports-app')
+    # Per-stage latency breakdown in a Server-Timing response header (exposes internal timings to clients)
+    SERVER_TIMING = os.getenv('SERVER_TIMING', 'false').lower() == 'true'
+    # Per-request memory accounting: 'off', 'rss' (cheap) or 'tracemalloc' (detailed, slows requests)
+    MEMORY_TRACKING = os.getenv('MEMORY_TRACKING', 'rss').lower()
+    MEMORY_TRACEMALLOC_FRAMES = int(os.getenv('MEMORY_TRACEMALLOC_FRAMES', '1'))
+    # Storage I/O and cache hit counters (/debug/io), summed across instances in Redis
+    IO_METRICS_REDIS = os.getenv('IO_METRICS_REDIS', os.getenv('ENABLE_CACHE', 'true')).lower() == 'true'
+    IO_METRICS_FLUSH_INTERVAL = float(os.getenv('IO_METRICS_FLUSH_INTERVAL', '10'))
+    # Background data refresh jobs: state and the one-refresh-at-a-time lock shared in Redis
+    REFRESH_JOBS_REDIS = os.getenv('REFRESH_JOBS_REDIS', os.getenv('ENABLE_CACHE', 'true')).lower() == 'true'
+    REFRESH_JOB_TTL = int(os.getenv('REFRESH_JOB_TTL', '86400'))
+    REFRESH_LOCK_TTL = int(os.getenv('REFRESH_LOCK_TTL', '600'))
+    # Cross-instance cache invalidation: data changes are announced on a Redis pub/sub channel
+    CACHE_INVALIDATION_REDIS = os.getenv('CACHE_INVALIDATION_REDIS', os.getenv('ENABLE_CACHE', 'true')).lower() == 'true'
+
     # Session
     SESSION_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
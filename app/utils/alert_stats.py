@@ -0,0 +1,236 @@
+"""
+Alert statistics for Cloud Run.
+Vectorized computations over vrops_alerts_historical.csv: the latest
+alert counts per location (colored by the change in critical alerts since
+the previous report), per-location trend series and aggregated history
+series, bucketed by day, week or month and downsampled for charts.
+"""
+from __future__ import annotations
+
+import math
+from typing import Optional
+from app.utils.lazy_import import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+COUNT_COLUMNS = ['critical', 'immediate', 'warning', 'total']
+
+# Row colors of the statistics report
+CRITICAL_UP_COLOR = '#f8d7da'
+CRITICAL_DOWN_COLOR = '#d4edda'
+
+BUCKETS = ('day', 'week', 'month')
+# Series longer than this are merged into wider buckets
+MAX_TREND_POINTS = 400
+
+# A Monday - week buckets start on Mondays
+WEEK_EPOCH = '1970-01-05'
+
+
+def alert_counts(df: pd.DataFrame) -> pd.DataFrame:
+    """The count columns as plain integers (missing values and columns count as 0)"""
+    return pd.DataFrame({
+        col: df[col].fillna(0).astype('int64') if col in df.columns else pd.Series(0, index=df.index, dtype='int64')
+        for col in COUNT_COLUMNS
+    }, index=df.index)
+
+
+def _dates(df: pd.DataFrame) -> pd.Series:
+    dates = df['date']
+    return dates if pd.api.types.is_datetime64_any_dtype(dates) else pd.to_datetime(dates, errors='coerce')
+
+
+def _last_at_max(dates: pd.Series, locations: pd.Series) -> pd.Index:
+    """Index of each location's newest row (the last one in file order on ties)"""
+    newest = dates.eq(dates.groupby(locations, observed=True).transform('max'))
+    candidates = locations[newest]
+    return candidates.index[~candidates.duplicated(keep='last')]
+
+
+def latest_per_location(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Most recent report of every location, newest first.
+
+    Args:
+        df: Alert history with 'date', 'location' and (optionally) 'customer' and count columns
+
+    Returns:
+        DataFrame with customer, date ('YYYY-MM-DD' or 'Missing'), location,
+        the counts and color (red if critical alerts went up since the
+        location's previous report, green if they went down)
+    """
+    dates = _dates(df)
+    known = df['location'].notna()
+    dated = known & dates.notna()
+    locations, dated_dates = df.loc[dated, 'location'], dates[dated]
+
+    # Newest and second newest report per location, without sorting the history
+    latest = _last_at_max(dated_dates, locations)
+    previous = _last_at_max(dated_dates.mask(dated_dates.index.isin(latest)), locations)
+    critical = alert_counts(df.loc[latest.append(previous), ['critical']])['critical']
+    latest_critical = pd.Series(critical.loc[latest].to_numpy(), index=locations.loc[latest].astype(object))
+    previous_critical = pd.Series(critical.loc[previous].to_numpy(), index=locations.loc[previous].astype(object))
+    diff = (latest_critical - previous_critical.reindex(latest_critical.index)).to_numpy()
+
+    # Locations without any dated report still get a row
+    undated = df.loc[known & ~df['location'].isin(locations.unique())].drop_duplicates('location').index
+    latest = latest.append(undated)
+    diff = np.concatenate([diff, np.full(len(undated), np.nan)])
+
+    rows = df.loc[latest]
+    if 'customer' in rows.columns:
+        customer = rows['customer'].astype(object).where(rows['customer'].notna(), 'Unknown')
+    else:
+        customer = 'Unknown'
+    result = pd.DataFrame({
+        'customer': customer,
+        'date': dates.loc[latest].dt.strftime('%Y-%m-%d').fillna('Missing'),
+        'location': rows['location'].astype(object),
+        **alert_counts(rows),
+        'color': np.select([diff > 0, diff < 0], [CRITICAL_UP_COLOR, CRITICAL_DOWN_COLOR], default=''),
+    }, index=latest)
+    newest_first = dates.loc[latest].sort_values(ascending=False, kind='stable', na_position='last').index
+    return result.loc[newest_first].reset_index(drop=True)
+
+
+def _bucket_width(first: pd.Timestamp, last: pd.Timestamp, bucket: str, max_points: int) -> int:
+    """Buckets to merge into one so a series from `first` to `last` has at most `max_points` points"""
+    if bucket == 'day':
+        needed = (last - first).days + 1
+    elif bucket == 'week':
+        needed = math.ceil(((last - first).days + 1) / 7) + 1
+    else:
+        needed = (last.year - first.year) * 12 + last.month - first.month + 1
+    if needed <= max_points:
+        return 1
+    # Wide buckets are aligned to a fixed epoch, so the series may straddle one more of them
+    return math.ceil(needed / max(1, max_points - 1))
+
+
+def _buckets(dates: pd.Series, bucket: str, width: int) -> pd.Series:
+    """Start of the `width`-day, -week or -month bucket of every date"""
+    days = dates.dt.normalize()
+    if bucket == 'day':
+        return days if width == 1 else days.dt.floor(f'{width}D')
+    if bucket == 'week':
+        epoch = pd.Timestamp(WEEK_EPOCH)
+        weeks = (days - epoch).dt.days // 7
+        return epoch + pd.to_timedelta((weeks - weeks % width) * 7, unit='D')
+    months = days.dt.year * 12 + days.dt.month - 1
+    months -= months % width
+    return pd.to_datetime(pd.DataFrame({'year': months // 12, 'month': months % 12 + 1, 'day': 1}))
+
+
+def location_trends(df: pd.DataFrame, location: Optional[str] = None, freq: str = 'day',
+                    max_points: int = MAX_TREND_POINTS) -> dict:
+    """
+    Alert counts over time per location.
+
+    Counts are snapshots, so each bucket holds the location's last report
+    in it. Buckets without a report are left out. When a series would have
+    more than `max_points` buckets, they are widened to a multiple of a
+    day, week or month until it fits.
+
+    Args:
+        df: Alert history
+        location: Only this location (default: all)
+        freq: 'day', 'week' or 'month'
+        max_points: Maximum buckets per series (at least 2)
+
+    Returns:
+        {location: [{'date', 'critical', 'immediate', 'warning', 'total'}, ...]} in date order
+    """
+    if freq not in BUCKETS:
+        raise ValueError(f"freq must be one of {BUCKETS}")
+    history = alert_counts(df).assign(location=df['location'], date=_dates(df))
+    history = history[history['date'].notna() & history['location'].notna()]
+    if location is not None:
+        history = history[history['location'] == location]
+    if history.empty:
+        return {}
+
+    width = _bucket_width(history['date'].min(), history['date'].max(), freq, max_points)
+    history = history.sort_values(['location', 'date'], kind='stable')
+    history['date'] = _buckets(history['date'], freq, width)
+    trend = history.groupby(['location', 'date'], observed=True, sort=True)[COUNT_COLUMNS].last().reset_index()
+    trend['date'] = trend['date'].dt.strftime('%Y-%m-%d')
+
+    # One pass over plain lists - per-location to_dict() calls dominate on long histories
+    fields = ['date'] + COUNT_COLUMNS
+    points = (dict(zip(fields, values)) for values in zip(*(trend[col].tolist() for col in fields)))
+    trends = {}
+    for name, point in zip(trend['location'].astype(object).tolist(), points):
+        trends.setdefault(str(name), []).append(point)
+    return trends
+
+
+def daily_history(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The alert history reduced to one row per location and day (its last report), in date order.
+
+    Built once per loaded copy of the dataset (see load_derived), so
+    history queries only filter and aggregate.
+    """
+    history = alert_counts(df).assign(date=_dates(df).dt.normalize(), location=df['location'])
+    history['customer'] = df['customer'] if 'customer' in df.columns else None
+    history = history[history['date'].notna() & history['location'].notna()]
+    history = history.sort_values('date', kind='stable')
+    history = history[~history.duplicated(['location', 'date'], keep='last')]
+    return history.reset_index(drop=True)
+
+
+def alert_history(daily: pd.DataFrame, locations: Optional[list] = None, customers: Optional[list] = None,
+                  start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None,
+                  bucket: str = 'day', max_points: int = MAX_TREND_POINTS) -> dict:
+    """
+    Alert counts of the selected locations summed per time bucket.
+
+    Each location contributes its last report in a bucket (counts are
+    snapshots), so a week shows the alerts open at the end of that week.
+
+    Args:
+        daily: Output of daily_history()
+        locations: Only these locations (default: all)
+        customers: Only locations of these customers (default: all)
+        start: First day (inclusive)
+        end: Last day (inclusive)
+        bucket: 'day', 'week' or 'month'
+        max_points: Maximum points; longer series get wider buckets
+
+    Returns:
+        {'bucket', 'bucket_width', 'locations', 'points': [{'date', 'locations', <counts>}, ...]}
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {BUCKETS}")
+    mask = pd.Series(True, index=daily.index)
+    if locations:
+        mask &= daily['location'].isin(locations)
+    if customers:
+        mask &= daily['customer'].isin(customers)
+    if start is not None:
+        mask &= daily['date'] >= start
+    if end is not None:
+        mask &= daily['date'] <= end
+    history = daily if mask.all() else daily[mask]
+    if history.empty:
+        return {'bucket': bucket, 'bucket_width': 1, 'locations': [], 'points': []}
+
+    # daily is in date order, so the last row of a location in a bucket is its newest
+    width = _bucket_width(history['date'].iloc[0], history['date'].iloc[-1], bucket, max_points)
+    per_location = history[COUNT_COLUMNS].assign(
+        location=history['location'], date=_buckets(history['date'], bucket, width),
+    ).groupby(['location', 'date'], observed=True)[COUNT_COLUMNS].last()
+    by_date = per_location.groupby(level='date')
+    series = by_date.sum()
+    series['locations'] = by_date.size()
+    series = series.reset_index()
+    series['date'] = series['date'].dt.strftime('%Y-%m-%d')
+
+    fields = ['date', 'locations'] + COUNT_COLUMNS
+    return {
+        'bucket': bucket,
+        'bucket_width': width,
+        'locations': sorted(map(str, history['location'].unique())),
+        'points': [dict(zip(fields, values)) for values in zip(*(series[col].tolist() for col in fields))],
+    }
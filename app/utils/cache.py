@@ -2,11 +2,17 @@
 Cache utilities for Cloud Run.
 Uses Redis (Cloud Memorystore) for caching data between requests.
 """
+from __future__ import annotations
+
 import logging
 import pickle
 from typing import Any, Optional, Callable
 from functools import wraps
-import pandas as pd
+from urllib.parse import urlencode
+from app.utils.lazy_import import lazy_import
+from app.utils.tracing import span
+
+pd = lazy_import('pandas')
 
 logger = logging.getLogger(__name__)
 
@@ -18,13 +24,25 @@ def cache_key_builder(*args, **kwargs) -> str:
     return ":".join(key_parts)
 
 
-def cached(timeout: int = 3600, key_prefix: str = ""):
+def _app_cache(app):
+    """The app's cache backend (Flask-Caching keeps {Cache: backend} in app.extensions)"""
+    backends = app.extensions.get('cache') or {}
+    return next(iter(backends.values()), None)
+
+
+def cached(timeout: int = 3600, key_prefix: str = "", vary: Optional[Callable[[], str]] = None):
     """
-    Decorator for caching function results.
+    Decorator for caching function results (e.g. rendered views).
+
+    Results are keyed on the version of the data snapshot they were built
+    from (app.utils.snapshots), so a new refresh or dataset change never
+    serves an old result, and on the query string when called in a request.
+    Without a published snapshot nothing is cached.
 
     Args:
-        timeout: Cache timeout in seconds
+        timeout: Cache timeout in seconds (entries never go stale - this only bounds their number)
         key_prefix: Prefix for cache key
+        vary: Function giving another part of the key (e.g. today's date)
 
     Usage:
         @cached(timeout=3600, key_prefix="report")
@@ -34,32 +52,41 @@ def cached(timeout: int = 3600, key_prefix: str = ""):
     def decorator(func: Callable):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            from flask import current_app
+            from flask import current_app, has_request_context, request
+            from app.utils.snapshots import snapshot_store
+
+            snapshot = snapshot_store.current()
+            cache = _app_cache(current_app) if snapshot is not None else None
+            if cache is None:
+                return func(*args, **kwargs)
 
             # Build cache key
-            cache_key = f"{key_prefix}:{func.__name__}:{cache_key_builder(*args, **kwargs)}"
+            key_parts = [key_prefix, func.__name__, snapshot.version, cache_key_builder(*args, **kwargs)]
+            if has_request_context():
+                key_parts.append(urlencode(sorted(request.args.items(multi=True))))
+            if vary is not None:
+                key_parts.append(vary())
+            cache_key = ":".join(key_parts)
 
             # Try to get from cache
-            cache = current_app.extensions.get('cache')
-            if cache:
-                try:
+            try:
+                with span('cache.lookup', key=cache_key):
                     cached_value = cache.get(cache_key)
-                    if cached_value is not None:
-                        logger.debug(f"Cache hit for {cache_key}")
-                        return cached_value
-                except Exception as e:
-                    logger.warning(f"Cache get error for {cache_key}: {e}")
+                if cached_value is not None:
+                    logger.debug(f"Cache hit for {cache_key}")
+                    return cached_value
+            except Exception as e:
+                logger.warning(f"Cache get error for {cache_key}: {e}")
 
             # Execute function
             result = func(*args, **kwargs)
 
             # Store in cache
-            if cache:
-                try:
-                    cache.set(cache_key, result, timeout=timeout)
-                    logger.debug(f"Cached result for {cache_key}")
-                except Exception as e:
-                    logger.warning(f"Cache set error for {cache_key}: {e}")
+            try:
+                cache.set(cache_key, result, timeout=timeout)
+                logger.debug(f"Cached result for {cache_key}")
+            except Exception as e:
+                logger.warning(f"Cache set error for {cache_key}: {e}")
 
             return result
 
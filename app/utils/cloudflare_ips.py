@@ -0,0 +1,216 @@
+"""
+Cloudflare IP range matching for Cloud Run.
+Ranges are compiled into sorted integer intervals so a lookup is a single bisect,
+seeded from a bundled snapshot and refreshed in the background.
+"""
+import logging
+import ipaddress
+import socket
+import threading
+import time
+from bisect import bisect_right
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bundled snapshot of https://www.cloudflare.com/ips-v4 and /ips-v6.
+# Used until the first background refresh succeeds, so a cold instance never blocks on the network.
+BUNDLED_CLOUDFLARE_IPV4 = [
+    '173.245.48.0/20',
+    '103.21.244.0/22',
+    '103.22.200.0/22',
+    '103.31.4.0/22',
+    '141.101.64.0/18',
+    '108.162.192.0/18',
+    '190.93.240.0/20',
+    '188.114.96.0/20',
+    '197.234.240.0/22',
+    '198.41.128.0/17',
+    '162.158.0.0/15',
+    '104.16.0.0/13',
+    '104.24.0.0/14',
+    '172.64.0.0/13',
+    '131.0.72.0/22',
+]
+
+BUNDLED_CLOUDFLARE_IPV6 = [
+    '2400:cb00::/32',
+    '2606:4700::/32',
+    '2803:f800::/32',
+    '2405:b500::/32',
+    '2405:8100::/32',
+    '2a06:98c0::/29',
+    '2c0f:f248::/32',
+]
+
+# ::ffff:a.b.c.d addresses are matched against the IPv4 ranges
+_IPV4_MAPPED_PREFIX = bytes(10) + b'\xff\xff'
+
+
+class IPRangeMatcher:
+    """
+    Immutable matcher over a set of CIDR ranges (IPv4 and IPv6).
+
+    Each address family is stored as two parallel sorted lists of merged
+    [start, end] integer bounds, so membership is O(log n) with no
+    ipaddress.ip_network objects touched on the hot path.
+    """
+
+    __slots__ = ('_starts', '_ends', 'networks')
+
+    def __init__(self, cidrs: Iterable[str]):
+        self.networks = []
+        spans = {4: [], 6: []}
+        for cidr in cidrs:
+            cidr = cidr.strip()
+            if not cidr:
+                continue
+            network = ipaddress.ip_network(cidr, strict=False)
+            self.networks.append(network)
+            spans[network.version].append((int(network.network_address), int(network.broadcast_address)))
+
+        self._starts = {}
+        self._ends = {}
+        for version, ranges in spans.items():
+            merged = []
+            for start, end in sorted(ranges):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self._starts[version] = [start for start, _ in merged]
+            self._ends[version] = [end for _, end in merged]
+
+    def __len__(self) -> int:
+        return len(self.networks)
+
+    def __contains__(self, client_ip: str) -> bool:
+        return self.contains(client_ip)
+
+    def contains(self, client_ip: str) -> bool:
+        """Check if an IP address string falls inside any range"""
+        if not client_ip:
+            return False
+        # inet_pton is several times cheaper than ipaddress.ip_address()
+        try:
+            if ':' in client_ip:
+                packed = socket.inet_pton(socket.AF_INET6, client_ip)
+                if packed[:12] == _IPV4_MAPPED_PREFIX:
+                    version, packed = 4, packed[12:]
+                else:
+                    version = 6
+            else:
+                version, packed = 4, socket.inet_pton(socket.AF_INET, client_ip)
+        except (OSError, ValueError):
+            # Invalid IP address
+            return False
+        value = int.from_bytes(packed, 'big')
+        index = bisect_right(self._starts[version], value) - 1
+        return index >= 0 and value <= self._ends[version][index]
+
+
+# Current matcher - swapped atomically by refresh, never replaced with an empty set
+_matcher = IPRangeMatcher(BUNDLED_CLOUDFLARE_IPV4 + BUNDLED_CLOUDFLARE_IPV6)
+_matcher_source = 'bundled'
+_refresh_lock = threading.Lock()
+_refresh_thread: Optional[threading.Thread] = None
+_stop_event = threading.Event()
+
+
+def get_matcher() -> IPRangeMatcher:
+    """Get the current Cloudflare IP range matcher"""
+    return _matcher
+
+
+def get_matcher_source() -> str:
+    """Where the current ranges came from ('bundled' or 'remote')"""
+    return _matcher_source
+
+
+def fetch_cloudflare_ranges(urls: List[str], timeout: int = 5) -> List[str]:
+    """
+    Download Cloudflare IP ranges.
+
+    Args:
+        urls: Range list URLs (one CIDR per line)
+        timeout: Per-request timeout in seconds
+
+    Returns:
+        List of CIDR strings
+
+    Raises:
+        ValueError: If any list is empty or contains invalid ranges
+    """
+    import requests
+
+    cidrs = []
+    for url in urls:
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        ranges = [line.strip() for line in response.text.splitlines() if line.strip()]
+        if not ranges:
+            raise ValueError(f"Empty Cloudflare IP list from {url}")
+        for cidr in ranges:
+            ipaddress.ip_network(cidr, strict=False)
+        cidrs.extend(ranges)
+    return cidrs
+
+
+def refresh_cloudflare_ips(urls: List[str], retries: int = 3, backoff: float = 2.0) -> bool:
+    """
+    Refresh Cloudflare IP ranges, retrying with exponential backoff.
+    On failure the current matcher (bundled or last good) is kept.
+
+    Returns:
+        True if the ranges were refreshed, False otherwise
+    """
+    global _matcher, _matcher_source
+
+    delay = backoff
+    for attempt in range(1, retries + 1):
+        try:
+            cidrs = fetch_cloudflare_ranges(urls)
+            matcher = IPRangeMatcher(cidrs)
+            with _refresh_lock:
+                _matcher = matcher
+                _matcher_source = 'remote'
+            logger.info(f"Loaded {len(matcher)} Cloudflare IP ranges")
+            return True
+        except Exception as e:
+            logger.warning(f"Error fetching Cloudflare IP ranges (attempt {attempt}/{retries}): {e}")
+            if attempt < retries and _stop_event.wait(delay):
+                break
+            delay *= 2
+
+    logger.warning(f"Keeping {_matcher_source} Cloudflare IP ranges ({len(_matcher)} ranges)")
+    return False
+
+
+def start_background_refresh(urls: List[str], interval: int = 86400, retries: int = 3):
+    """
+    Start a daemon thread that refreshes the ranges now and every `interval` seconds.
+    Safe to call more than once - only one thread runs per process.
+    """
+    global _refresh_thread
+
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _stop_event.clear()
+
+        def run():
+            while not _stop_event.is_set():
+                started = time.monotonic()
+                refresh_cloudflare_ips(urls, retries=retries)
+                logger.debug(f"Cloudflare IP refresh took {time.monotonic() - started:.2f}s")
+                if _stop_event.wait(interval):
+                    break
+
+        _refresh_thread = threading.Thread(target=run, name='cloudflare-ip-refresh', daemon=True)
+        _refresh_thread.start()
+        logger.info(f"Started Cloudflare IP background refresh (every {interval}s)")
+
+
+def stop_background_refresh():
+    """Stop the background refresh thread"""
+    _stop_event.set()
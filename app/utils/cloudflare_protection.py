@@ -3,71 +3,35 @@ Cloudflare protection middleware - blocks direct access to Cloud Run
 Only allows requests from Cloudflare (reporting.dabronet.pl)
 """
 import logging
-import ipaddress
+from functools import lru_cache
 from flask import request, abort
 from app.config import Config
-import requests
-from functools import lru_cache
+from app.utils.cloudflare_ips import get_matcher
 
 logger = logging.getLogger(__name__)
 
-# Cache Cloudflare IP ranges
-_CLOUDFLARE_IPS = None
 
-
-@lru_cache(maxsize=1)
 def get_cloudflare_ips():
-    """Get Cloudflare IP ranges (cached)"""
-    global _CLOUDFLARE_IPS
-    if _CLOUDFLARE_IPS is None:
-        try:
-            response = requests.get(Config.CLOUDFLARE_IPS_URL, timeout=5)
-            if response.status_code == 200:
-                _CLOUDFLARE_IPS = [ipaddress.ip_network(ip.strip()) for ip in response.text.strip().split('\n') if ip.strip()]
-                logger.info(f"Loaded {len(_CLOUDFLARE_IPS)} Cloudflare IP ranges")
-            else:
-                logger.warning("Could not fetch Cloudflare IP ranges")
-                _CLOUDFLARE_IPS = []
-        except Exception as e:
-            logger.warning(f"Error fetching Cloudflare IP ranges: {e}")
-            _CLOUDFLARE_IPS = []
-    return _CLOUDFLARE_IPS
+    """Get Cloudflare IP ranges (bundled snapshot until a background refresh succeeds)"""
+    return get_matcher().networks
 
 
 def is_cloudflare_ip(client_ip: str) -> bool:
     """Check if client IP is from Cloudflare"""
-    if not client_ip:
-        return False
-    
-    try:
-        client_ip_obj = ipaddress.ip_address(client_ip)
-        cloudflare_ips = get_cloudflare_ips()
-        return any(client_ip_obj in network for network in cloudflare_ips)
-    except ValueError:
-        # Invalid IP address
-        return False
+    return get_matcher().contains(client_ip)
 
 
-def check_cloudflare_protection():
-    """
-    Check if request is from Cloudflare.
-    Returns True if allowed, False if blocked.
-    """
-    from app.config import Config
-    
-    # Skip protection if disabled
-    if not Config.REQUIRE_CLOUDFLARE:
-        logger.debug("Cloudflare protection disabled")
-        return True
-    
-    # Get Host header
-    host = request.headers.get('Host', '')
-    allowed_hosts = Config.ALLOWED_HOSTS
-    
-    # Check if Host is allowed
-    host_allowed = any(allowed_host.lower() in host.lower() for allowed_host in allowed_hosts)
-    
-    # Get client IP for logging
+# Direct Cloud Run / Cloud Functions hostnames
+CLOUD_RUN_HOST_MARKERS = ('run.app', 'cloudfunctions.net')
+
+# Paths served without the protection check (public static assets)
+EXEMPT_PATH_PREFIXES = ('/static/',)
+
+CLOUDFLARE_HEADERS = ('CF-Connecting-IP', 'CF-Ray', 'CF-IPCountry')
+
+
+def get_client_ip() -> str:
+    """Resolve the client IP (CF-Connecting-IP, then X-Forwarded-For, then remote address)"""
     client_ip = request.headers.get('CF-Connecting-IP')
     if not client_ip:
         forwarded_for = request.headers.get('X-Forwarded-For')
@@ -75,68 +39,81 @@ def check_cloudflare_protection():
             client_ip = forwarded_for.split(',')[0].strip()
         else:
             client_ip = request.remote_addr
-    
-    # Check if request comes from Cloudflare
-    # Method 1: Check CF-Connecting-IP header (most reliable - Cloudflare always adds this)
-    has_cf_connecting_ip = request.headers.get('CF-Connecting-IP') is not None
-    has_cf_ray = request.headers.get('CF-Ray') is not None
-    has_cf_country = request.headers.get('CF-IPCountry') is not None
-    
-    # Method 2: Check if IP is in Cloudflare ranges (fallback)
-    is_cf_ip = is_cloudflare_ip(client_ip)
-    
-    # Log for debugging
-    logger.debug(f"Protection check - Host: {host}, CF-Connecting-IP: {has_cf_connecting_ip}, CF-Ray: {has_cf_ray}, CF-Country: {has_cf_country}, Client IP: {client_ip}")
-    
+    return client_ip
+
+
+@lru_cache(maxsize=1024)
+def get_host_verdict(host: str, has_cloudflare_headers: bool):
+    """
+    Memoized protection verdict for a (Host, Cloudflare headers present) pair.
+
+    Returns:
+        Tuple (allowed, log_level, message). `allowed` is None when the
+        verdict depends on the client IP being in Cloudflare ranges.
+    """
+    allowed_hosts = Config.ALLOWED_HOSTS
+    host_lower = host.lower()
+    host_allowed = any(allowed_host.lower() in host_lower for allowed_host in allowed_hosts)
+    is_cloud_run_host = any(marker in host for marker in CLOUD_RUN_HOST_MARKERS)
+
     # STRICT MODE: Require BOTH Cloudflare headers AND correct Host
-    # Primary check: Cloudflare headers (most reliable)
-    has_cloudflare_headers = has_cf_connecting_ip or has_cf_ray or has_cf_country
-    
     # If we have Cloudflare headers, allow if host is correct
     # BUT: If Host is Cloud Run URL but we have Cloudflare headers, it means Worker didn't set Host correctly
     # In this case, we'll be more lenient and allow it (Worker is proxying from Cloudflare)
     if has_cloudflare_headers:
         if host_allowed:
-            logger.debug(f"Allowed: Request from Cloudflare with valid Host ({host})")
-            return True
-        elif 'run.app' in host or 'cloudfunctions.net' in host:
-            # Worker is proxying from Cloudflare but didn't set Host header correctly
-            # Allow it anyway since we have Cloudflare headers (more lenient for Worker issues)
-            logger.warning(f"Allowed: Cloudflare request with Cloud Run Host ({host}) - Worker may not set Host header correctly, but allowing due to Cloudflare headers")
-            return True
-        else:
-            logger.warning(f"Blocked: Cloudflare request but invalid Host ({host}, allowed: {allowed_hosts})")
-            return False
-    
-    # Fallback: Check IP ranges (less reliable but works if headers are missing)
-    if is_cf_ip:
-        if host_allowed:
-            logger.debug(f"Allowed: Request from Cloudflare IP range with valid Host ({host})")
-            return True
-        else:
-            logger.warning(f"Blocked: Cloudflare IP but invalid Host ({host}, allowed: {allowed_hosts})")
-            return False
-    
+            return True, logging.DEBUG, f"Allowed: Request from Cloudflare with valid Host ({host})"
+        if is_cloud_run_host:
+            return True, logging.WARNING, (
+                f"Allowed: Cloudflare request with Cloud Run Host ({host}) - Worker may not set Host header "
+                f"correctly, but allowing due to Cloudflare headers"
+            )
+        return False, logging.WARNING, f"Blocked: Cloudflare request but invalid Host ({host}, allowed: {allowed_hosts})"
+
     # Block direct Cloud Run URLs immediately (even if they have correct Host header)
-    if 'run.app' in host or 'cloudfunctions.net' in host:
-        logger.warning(f"Blocked: Direct Cloud Run access detected (Host: {host}, IP: {client_ip})")
-        return False
-    
+    if is_cloud_run_host and not host_allowed:
+        return False, logging.WARNING, f"Blocked: Direct Cloud Run access detected (Host: {host})"
+
     # If no Cloudflare indicators and host is not allowed, block
     if not host_allowed:
-        logger.warning(f"Blocked: No Cloudflare indicators and invalid Host ({host}, allowed: {allowed_hosts}, IP: {client_ip})")
-        return False
-    
-    # STRICT: If host is allowed but no Cloudflare indicators, block
-    # This ensures that only requests from Cloudflare (with headers) are allowed
-    # Even if Host header is correct, we require Cloudflare headers for security
-    if host_allowed:
-        logger.warning(f"Blocked: Valid Host ({host}) but missing Cloudflare headers (IP: {client_ip}). Worker may not be configured correctly.")
+        return False, logging.WARNING, f"Blocked: No Cloudflare indicators and invalid Host ({host}, allowed: {allowed_hosts})"
+
+    # Fallback: Check IP ranges (less reliable but works if headers are missing)
+    return None, logging.DEBUG, f"Request without Cloudflare headers for valid Host ({host})"
+
+
+def check_cloudflare_protection():
+    """
+    Check if request is from Cloudflare.
+    Returns True if allowed, False if blocked.
+    """
+    # Skip protection if disabled
+    if not Config.REQUIRE_CLOUDFLARE:
+        return True
+
+    headers = request.headers
+    host = headers.get('Host', '')
+    has_cloudflare_headers = any(header in headers for header in CLOUDFLARE_HEADERS)
+
+    allowed, log_level, message = get_host_verdict(host, has_cloudflare_headers)
+
+    if allowed is None:
+        # Only resolve the IP-range fallback when the verdict depends on it
+        client_ip = get_client_ip()
+        if is_cloudflare_ip(client_ip):
+            logger.debug("Allowed: Request from Cloudflare IP range with valid Host (%s)", host)
+            return True
+        # STRICT: If host is allowed but no Cloudflare indicators, block
+        # This ensures that only requests from Cloudflare (with headers) are allowed
+        logger.warning(
+            "Blocked: Valid Host (%s) but missing Cloudflare headers (IP: %s). Worker may not be configured correctly.",
+            host, client_ip
+        )
         return False
-    
-    # Default: block
-    logger.warning(f"Blocked: No valid indicators (Host: {host}, IP: {client_ip})")
-    return False
+
+    if logger.isEnabledFor(log_level):
+        logger.log(log_level, message)
+    return allowed
 
 
 def cloudflare_protection_middleware():
@@ -144,20 +121,25 @@ def cloudflare_protection_middleware():
     Flask middleware to protect against direct access.
     Add this as @app.before_request
     """
-    # Allow health checks (but still check Cloudflare for /ready)
-    if request.path == '/health':
+    # Allow health checks and static assets (but still check Cloudflare for /ready)
+    path = request.path
+    if path == '/health' or path.startswith(EXEMPT_PATH_PREFIXES):
         return None
-    
+
     # Check Cloudflare protection
     try:
-        if not check_cloudflare_protection():
-            logger.warning(f"Blocked unauthorized access: {request.method} {request.path} from {request.remote_addr} (Host: {request.headers.get('Host', 'unknown')})")
-            abort(403, description="Access denied. This service is only accessible through Cloudflare.")
+        allowed = check_cloudflare_protection()
     except Exception as e:
         logger.error(f"Error in Cloudflare protection check: {e}", exc_info=True)
         # On error, block request (fail closed) for security
         logger.warning("Cloudflare protection check failed, blocking request")
         abort(403, description="Access denied. Security check failed.")
-    
-    return None
 
+    if not allowed:
+        logger.warning(
+            "Blocked unauthorized access: %s %s from %s (Host: %s)",
+            request.method, path, request.remote_addr, request.headers.get('Host', 'unknown')
+        )
+        abort(403, description="Access denied. This service is only accessible through Cloudflare.")
+
+    return None
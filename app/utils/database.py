@@ -2,16 +2,36 @@
 Database utilities for Cloud Run optimized access.
 Implements lazy loading and connection pooling.
 """
+from __future__ import annotations
+
 import logging
 from typing import Optional
-import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool, QueuePool
 from contextlib import contextmanager
+from app.utils.lazy_import import lazy_import
+from app.utils.tracing import span
+
+pd = lazy_import('pandas')
 
 logger = logging.getLogger(__name__)
 
+# Connection URL produced by Config when no database settings are provided
+UNCONFIGURED_DATABASE_URL = "postgresql://postgres:@localhost:5432/reports_db"
+
+
+def get_configured_database_url() -> Optional[str]:
+    """Get the database URL from Config, or None if the database is not configured"""
+    from app.config import Config
+    database_url = Config.get_database_url()
+    if database_url and database_url != UNCONFIGURED_DATABASE_URL:
+        return database_url
+    return None
+
+
+def text(sql: str):
+    """sqlalchemy.text, imported on first use"""
+    from sqlalchemy import text as sql_text
+    return sql_text(sql)
+
 
 class DatabaseManager:
     """
@@ -31,6 +51,10 @@ class DatabaseManager:
         connection exhaustion during scaling.
         """
         if self._engine is None:
+            from sqlalchemy import create_engine
+            from sqlalchemy.orm import sessionmaker
+            from sqlalchemy.pool import QueuePool
+
             logger.info("Initializing database engine")
 
             # Use QueuePool with conservative settings for Cloud Run
@@ -53,16 +77,25 @@ class DatabaseManager:
 
             logger.info("Database engine initialized successfully")
 
+    def _init_from_config(self):
+        """Initialize the engine from Config on first use"""
+        database_url = get_configured_database_url()
+        if not database_url:
+            raise RuntimeError("Database engine not initialized. Call init_engine() first.")
+        self.init_engine(database_url)
+
     @property
     def engine(self):
         """Get database engine (lazy initialization)"""
         if self._engine is None:
-            raise RuntimeError("Database engine not initialized. Call init_engine() first.")
+            self._init_from_config()
         return self._engine
 
     @contextmanager
     def get_session(self):
         """Context manager for database sessions"""
+        if self._session_factory is None:
+            self._init_from_config()
         session = self._session_factory()
         try:
             yield session
@@ -85,17 +118,14 @@ class DatabaseManager:
         """
         try:
             # Lazy initialization - try to initialize if not already done
-            if self._engine is None:
-                from app.config import Config
-                database_url = Config.get_database_url()
-                if database_url and database_url != "postgresql://postgres:@localhost:5432/reports_db":
-                    self.init_engine(database_url)
-                else:
-                    logger.warning("Database not configured. Returning empty DataFrame.")
-                    return pd.DataFrame()
+            if self._engine is None and not get_configured_database_url():
+                logger.warning("Database not configured. Returning empty DataFrame.")
+                return pd.DataFrame()
             
             query = f"SELECT * FROM {table_name}"
-            df = pd.read_sql(query, self.engine)
+            with span('db.query', **{'db.system': 'postgresql', 'db.statement': query}) as current:
+                df = pd.read_sql(query, self.engine)
+                current.set_attribute('rows', len(df))
             logger.info(f"Successfully read {len(df)} rows from {table_name}")
             return df
         except Exception as e:
@@ -116,7 +146,8 @@ class DatabaseManager:
             return
 
         try:
-            with self.engine.connect() as conn:
+            with span('db.write', **{'db.system': 'postgresql', 'db.sql.table': table_name, 'rows': len(df)}), \
+                    self.engine.connect() as conn:
                 df.to_sql(table_name, conn, if_exists=if_exists, index=False)
                 logger.info(f"Successfully wrote {len(df)} rows to {table_name}")
         except Exception as e:
@@ -126,7 +157,8 @@ class DatabaseManager:
     def truncate_table(self, table_name: str):
         """Truncate a table"""
         try:
-            with self.engine.connect() as conn:
+            with span('db.query', **{'db.system': 'postgresql', 'db.statement': f"TRUNCATE TABLE {table_name}"}), \
+                    self.engine.connect() as conn:
                 conn.execute(text(f"TRUNCATE TABLE {table_name} RESTART IDENTITY"))
                 conn.commit()
                 logger.info(f"Truncated table {table_name}")
@@ -137,7 +169,8 @@ class DatabaseManager:
     def table_exists(self, table_name: str) -> bool:
         """Check if a table exists"""
         try:
-            with self.engine.connect() as conn:
+            with span('db.query', **{'db.system': 'postgresql', 'db.sql.table': table_name}), \
+                    self.engine.connect() as conn:
                 result = conn.execute(text(
                     "SELECT EXISTS (SELECT FROM information_schema.tables "
                     "WHERE table_name = :table_name)"
@@ -147,6 +180,11 @@ class DatabaseManager:
             logger.error(f"Error checking if table {table_name} exists: {e}")
             return False
 
+    def after_fork(self):
+        """Drop pooled connections inherited from the parent process without closing them"""
+        if self._engine:
+            self._engine.dispose(close=False)
+
     def dispose(self):
         """Dispose of database connections"""
         if self._engine:
@@ -0,0 +1,241 @@
+"""
+In-process dataset cache for Cloud Run.
+Parsed CSV datasets are kept per worker so repeated page views don't
+re-download and re-parse the same file. Files of a published snapshot
+(app.utils.snapshots) never change and stay cached until the worker
+switches to another snapshot; plain files expire after DATASET_CACHE_TTL.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable, Optional
+from app.config import Config
+from app.utils.io_metrics import record_cache
+from app.utils.lazy_import import lazy_import
+from app.utils.memory import dataset_footprint
+from app.utils.snapshots import is_snapshot_path, snapshot_store
+from app.utils.tracing import span
+
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetCache:
+    """
+    Thread-safe cache of DataFrames keyed by storage path (TTL for plain files).
+
+    Concurrent misses for the same file wait on a per-file lock, so a
+    dataset is downloaded and parsed once per worker, not once per thread.
+    Empty results (missing file, read error) are never cached.
+    """
+
+    def __init__(self, ttl: int = 300):
+        self.ttl = ttl
+        self._entries = {}  # filename -> (loaded_at, DataFrame)
+        self._derived = {}  # filename -> (DataFrame it was built from, {name: value})
+        self._lock = threading.Lock()
+        self._file_locks = {}
+
+    def _file_lock(self, filename: str) -> threading.Lock:
+        with self._lock:
+            return self._file_locks.setdefault(filename, threading.Lock())
+
+    def _fresh(self, filename: str) -> Optional[pd.DataFrame]:
+        entry = self._entries.get(filename)
+        if entry is not None and (is_snapshot_path(filename) or time.time() - entry[0] < self.ttl):
+            return entry[1]
+        return None
+
+    def get(self, filename: str, loader: Callable[[str], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Get a dataset, loading it with `loader(filename)` on a miss.
+
+        Args:
+            filename: Dataset filename (e.g. 'report.csv')
+            loader: Function that reads the file from storage
+
+        Returns:
+            Cached DataFrame (shared - callers must not modify it in place)
+        """
+        if self.ttl <= 0:
+            return loader(filename)
+
+        df = self._fresh(filename)
+        if df is not None:
+            record_cache('dataset', hit=True)
+            return df
+
+        with self._file_lock(filename):
+            df = self._fresh(filename)
+            if df is not None:
+                record_cache('dataset', hit=True)
+                return df
+            record_cache('dataset', hit=False)
+            df = loader(filename)
+            if not df.empty:
+                # Age counts from when the data was fetched (possibly by another worker)
+                self._entries[filename] = (df.attrs.get('loaded_at', time.time()), df)
+                dataset_footprint(filename, df)
+            return df
+
+    def derived(self, filename: str, name: str, build: Callable[[pd.DataFrame], object],
+                loader: Callable[[str], pd.DataFrame]):
+        """
+        Get a value computed from a dataset (an index, lookup table, ...), built once per loaded copy.
+
+        Args:
+            filename: Dataset filename
+            name: Name of the derived value
+            build: Function computing it from the cached DataFrame (must not modify it)
+            loader: Function that reads the file from storage
+
+        Returns:
+            The value built from the current copy of the dataset
+        """
+        df = self.get(filename, loader)
+        if self.ttl <= 0:
+            return build(df)
+        with self._file_lock(filename):
+            source, values = self._derived.get(filename, (None, None))
+            if source is not df:
+                # First use, or the dataset was reloaded since - rebuild everything
+                values = {}
+                self._derived[filename] = (df, values)
+            if name not in values:
+                values[name] = build(df)
+            return values[name]
+
+    def put(self, filename: str, df: pd.DataFrame):
+        """Store a dataset (e.g. one that was just written to storage)"""
+        if self.ttl > 0 and not df.empty:
+            self._entries[filename] = (time.time(), df)
+
+    def invalidate(self, filename: Optional[str] = None):
+        """Drop one dataset, or all of them"""
+        if filename is None:
+            self._entries.clear()
+            self._derived.clear()
+        else:
+            self._entries.pop(filename, None)
+            self._derived.pop(filename, None)
+
+    def retain(self, paths: set):
+        """Drop cached snapshot files that aren't in `paths` (the current snapshot's)"""
+        for filename in list(self._entries):
+            if is_snapshot_path(filename) and filename not in paths:
+                self.invalidate(filename)
+
+    def cached_files(self) -> list:
+        """Filenames currently held in the cache"""
+        return sorted(self._entries)
+
+    def summary(self) -> dict:
+        """Age and size of every cached dataset"""
+        now = time.time()
+        return {
+            filename: {'age_s': round(now - loaded_at), 'rows': len(df)}
+            for filename, (loaded_at, df) in sorted(self._entries.items())
+        }
+
+    def after_fork(self):
+        """Recreate locks in a forked worker (a lock held at fork time would never be released)"""
+        self._lock = threading.Lock()
+        self._file_locks = {}
+
+
+dataset_cache = DatasetCache(ttl=Config.DATASET_CACHE_TTL)
+
+_shared_store = None
+
+
+def get_shared_store():
+    """Get the instance-wide shared dataset store, or None if sharing is disabled"""
+    global _shared_store
+    if _shared_store is None and Config.SHARED_DATASETS and Config.DATASET_CACHE_TTL > 0:
+        from app.utils.shared_datasets import PYARROW_AVAILABLE, SharedDatasetStore
+        if not PYARROW_AVAILABLE:
+            logger.warning("pyarrow not available. Datasets will not be shared between workers.")
+            return None
+        _shared_store = SharedDatasetStore(Config.SHARED_DATASET_DIR, ttl=Config.DATASET_CACHE_TTL)
+    return _shared_store
+
+
+def dataset_path(filename: str) -> str:
+    """Storage path of a dataset: its file in the current snapshot, or the filename itself"""
+    snapshot = snapshot_store.current()
+    return filename if snapshot is None else snapshot.path(filename)
+
+
+def _retain_snapshot(snapshot):
+    """Drop the cached files of the snapshot this worker switched away from"""
+    paths = snapshot.paths() if snapshot is not None else set()
+    dataset_cache.retain(paths)
+    shared_store = get_shared_store()
+    if shared_store is not None:
+        shared_store.retain(paths)
+
+
+snapshot_store.subscribe(_retain_snapshot)
+
+
+def read_from_storage(filename: str) -> pd.DataFrame:
+    """Read a dataset from the current storage backend (GCS or S3); .parquet files are partitions"""
+    from app.utils.storage import get_storage_manager
+    if not filename.endswith('.parquet'):
+        return get_storage_manager().read_csv(filename)
+
+    from app.utils.storage_backends import parse_parquet
+    try:
+        content = get_storage_manager().read_bytes(filename)
+        return parse_parquet(content, filename) if content else pd.DataFrame()
+    except Exception as e:
+        logger.error(f"Error reading {filename}: {e}", exc_info=True)
+        return pd.DataFrame()
+
+
+def read_shared(filename: str) -> pd.DataFrame:
+    """Read a dataset via the shared store (one download and parse per instance)"""
+    shared_store = get_shared_store()
+    if shared_store is None:
+        return read_from_storage(filename)
+    return shared_store.load(filename, read_from_storage)
+
+
+def invalidate_dataset(filename: Optional[str] = None):
+    """Drop a dataset (or all datasets) from this worker and the shared store"""
+    if filename is not None:
+        filename = dataset_path(filename)
+    dataset_cache.invalidate(filename)
+    shared_store = get_shared_store()
+    if shared_store is not None:
+        shared_store.invalidate(filename)
+
+
+def load_dataset(filename: str) -> pd.DataFrame:
+    """
+    Load a dataset through the in-process cache.
+
+    Returns a shallow copy, so routes can add or replace columns without
+    touching the cached frame.
+    """
+    with span('dataset.load', file=filename) as current:
+        path = dataset_path(filename)
+        if path != filename:
+            current.set_attribute('path', path)
+        df = dataset_cache.get(path, read_shared)
+        current.set_attribute('rows', len(df))
+        return df.copy(deep=False)
+
+
+def load_derived(filename: str, name: str, build: Callable[[pd.DataFrame], object]):
+    """
+    Get a value derived from a dataset, built once per loaded copy of it.
+
+    Usage:
+        dims = load_derived('customer_locations.csv', 'dimension', CustomerLocations)
+    """
+    with span('dataset.derived', file=filename, value=name):
+        return dataset_cache.derived(dataset_path(filename), name, build, read_shared)
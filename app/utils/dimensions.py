@@ -0,0 +1,46 @@
+"""
+Customer/location dimension for Cloud Run.
+Built once from customer_locations.csv per loaded copy of it (see
+load_derived), so report routes get sorted customer and location lists and
+enrich rows with a vectorized location -> customer lookup instead of
+merging the mapping file on every request.
+"""
+from __future__ import annotations
+
+from app.utils.datasets import load_derived
+from app.utils.lazy_import import lazy_import
+
+pd = lazy_import('pandas')
+
+CUSTOMER_LOCATIONS = 'customer_locations.csv'
+
+
+class CustomerLocations:
+    """
+    Sorted customers and locations, and the customer of every location.
+
+    Args:
+        df: customer_locations.csv with canonical 'location' and 'Customer' columns
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        # A missing column gives an empty list (and unknown customers), not an error
+        pairs = df.reindex(columns=['location', 'Customer']).astype(object)
+        self.customers = sorted(pairs['Customer'].dropna().unique().tolist())
+        self.locations = sorted(pairs['location'].dropna().unique().tolist())
+        # A location listed twice keeps its first customer (the old merge duplicated its rows)
+        first = pairs.dropna(subset=['location']).drop_duplicates('location')
+        self.customer_by_location = pd.Series(first['Customer'].values, index=first['location'].values)
+
+    @property
+    def empty(self) -> bool:
+        return not self.locations
+
+    def customer_of(self, locations: pd.Series) -> pd.Series:
+        """Customer of every location in `locations` (NaN where unknown)"""
+        return locations.map(self.customer_by_location)
+
+
+def get_customer_locations() -> CustomerLocations:
+    """Customer/location dimension of the current customer_locations.csv"""
+    return load_derived(CUSTOMER_LOCATIONS, 'dimension', CustomerLocations)
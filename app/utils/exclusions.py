@@ -0,0 +1,258 @@
+"""
+Network exclusion store for Cloud Run.
+Excluded (Network, Location) pairs live in excluded_networks.csv plus one
+small object per change (exclusion_changes/<time>-<id>.json), written next
+to the snapshots rather than into them. Adding or removing an exclusion
+writes just that object - no dataset rewrite or snapshot publish - and
+concurrent editors never overwrite each other. Every MAX_PENDING_CHANGES
+changes they are folded into excluded_networks.csv. The current pairs are
+kept per worker as a MultiIndex, and the network utilization report drops
+them with a hashed anti-join instead of building a tuple per row.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Optional
+from app.config import Config
+from app.utils.datasets import dataset_path, invalidate_dataset, load_dataset
+from app.utils.lazy_import import lazy_import
+from app.utils.refresh_jobs import refresh_jobs
+from app.utils.snapshots import is_snapshot_path, snapshot_store
+from app.utils.storage import delete_objects, write_dataset, write_object
+
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+EXCLUSIONS_FILE = 'excluded_networks.csv'
+# Change log of earlier versions (one CSV rewritten per change), replayed until the next compaction
+CHANGES_FILE = 'excluded_networks_changes.csv'
+CHANGES_PREFIX = 'exclusion_changes/'
+# Last change folded into excluded_networks.csv, and when
+COMPACTED_FILE = f'{CHANGES_PREFIX}_compacted.json'
+KEY_COLUMNS = ['Network', 'Location']
+CHANGE_COLUMNS = KEY_COLUMNS + ['Action', 'Changed At']
+# Datasets whose change invalidates the exclusions (app.utils.invalidation)
+EXCLUSION_DATASETS = (EXCLUSIONS_FILE, CHANGES_FILE, CHANGES_PREFIX)
+
+# Fold the changes into excluded_networks.csv once this many are newer than the last compaction
+MAX_PENDING_CHANGES = 100
+# Folded changes are deleted at the next compaction once the file they went into has been
+# published this long (readers keep their snapshot for up to SNAPSHOT_CHECK_INTERVAL seconds)
+COMPACTED_GRACE = 600
+
+
+def _as_text(values: pd.Series) -> pd.Series:
+    """Key column as strings (names that parse as numbers would never match form input otherwise)"""
+    dtype = values.dtype.categories.dtype if isinstance(values.dtype, pd.CategoricalDtype) else values.dtype
+    return values if dtype == object else values.astype(str)
+
+
+def _pairs(df: pd.DataFrame) -> list:
+    if df.empty or not set(KEY_COLUMNS) <= set(df.columns):
+        return []
+    keys = df[KEY_COLUMNS].dropna()
+    return list(zip(_as_text(keys['Network']), _as_text(keys['Location'])))
+
+
+def _apply(keys: set, key: tuple, action: str):
+    if action == 'add':
+        keys.add(key)
+    else:
+        keys.discard(key)
+
+
+class ExclusionStore:
+    """
+    Excluded (Network, Location) pairs of this worker, reloaded every
+    DATASET_CACHE_TTL seconds (at once when another worker or instance
+    announces a change, app.utils.invalidation) or when the current
+    snapshot has another excluded_networks.csv.
+
+    Loading replays the change objects in order on top of the file. Changes
+    already folded into it may be replayed again until they are deleted;
+    replaying a tail of the history gives the same pairs.
+    """
+
+    def __init__(self, ttl: int = 300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._state = None  # (loaded_at, set of pairs, MultiIndex, source paths, change object names)
+        self._changes = {}  # change object name -> (key, action); they never change once written
+        self._compacted_through = ''  # Last change folded in, as far as this worker knows
+
+    def _load(self):
+        keys = set(_pairs(load_dataset(EXCLUSIONS_FILE)))
+        legacy = load_dataset(CHANGES_FILE)
+        if not legacy.empty and set(CHANGE_COLUMNS) <= set(legacy.columns):
+            for key, action in zip(_pairs(legacy), legacy.dropna(subset=KEY_COLUMNS)['Action']):
+                _apply(keys, key, action)
+        from app.utils.storage import get_storage_manager
+        storage = get_storage_manager()
+        names = sorted(
+            name for name in storage.list_files(CHANGES_PREFIX)
+            if name.endswith('.json') and name != COMPACTED_FILE
+        )
+        changes = {}
+        for name in names:
+            change = self._changes.get(name) or self._read_change(storage, name)
+            if change is not None:
+                changes[name] = change
+                _apply(keys, *change)
+        self._changes = changes
+        return time.time(), keys, self._build_index(keys), self._source(), names
+
+    @staticmethod
+    def _read_change(storage, name: str) -> Optional[tuple]:
+        content = storage.read_bytes(name)
+        if content is None:
+            # Deleted by a compaction since the listing - already in excluded_networks.csv
+            return None
+        try:
+            change = json.loads(content)
+            return (str(change['Network']), str(change['Location'])), change['Action']
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Ignoring malformed exclusion change {name}: {e}")
+            return None
+
+    @staticmethod
+    def _source() -> tuple:
+        """Storage paths the exclusions are read from"""
+        return dataset_path(EXCLUSIONS_FILE), dataset_path(CHANGES_FILE)
+
+    def _fresh(self, state) -> bool:
+        if state is None or time.time() - state[0] >= self.ttl:
+            return False
+        source = self._source()
+        return state[3] == source if is_snapshot_path(source[0]) else True
+
+    @staticmethod
+    def _build_index(keys: set) -> pd.MultiIndex:
+        if not keys:
+            return pd.MultiIndex.from_arrays([[], []], names=KEY_COLUMNS)
+        return pd.MultiIndex.from_tuples(sorted(keys), names=KEY_COLUMNS)
+
+    def _current(self):
+        state = self._state
+        if self._fresh(state):
+            return state
+        with self._lock:
+            if not self._fresh(self._state):
+                self._state = self._load()
+            return self._state
+
+    def index(self) -> pd.MultiIndex:
+        """Current exclusions as a (Network, Location) MultiIndex"""
+        return self._current()[2]
+
+    def records(self) -> list:
+        """Current exclusions as [{'Network', 'Location'}], sorted"""
+        return [dict(zip(KEY_COLUMNS, key)) for key in sorted(self._current()[1])]
+
+    def exclude(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Rows of df whose (Network, Location) is not excluded (df itself if nothing matches)"""
+        index = self.index()
+        if index.empty or df.empty or not set(KEY_COLUMNS) <= set(df.columns):
+            return df
+        rows = pd.MultiIndex.from_arrays([_as_text(df['Network']), _as_text(df['Location'])])
+        excluded = rows.isin(index)
+        return df[~excluded] if excluded.any() else df
+
+    def add(self, network: str, location: str) -> bool:
+        """Exclude a network at a location; True if stored"""
+        return self._change(network, location, 'add')
+
+    def remove(self, network: str, location: str) -> bool:
+        """Stop excluding a network at a location; True if stored"""
+        return self._change(network, location, 'remove')
+
+    def _reload(self):
+        """Load from storage now, so changes made by other workers and instances are seen"""
+        snapshot_store.check()
+        invalidate_dataset(EXCLUSIONS_FILE)
+        invalidate_dataset(CHANGES_FILE)
+        return self._load()
+
+    def _change(self, network: str, location: str, action: str) -> bool:
+        from app.utils.invalidation import invalidation_bus
+
+        key = (str(network).strip(), str(location).strip())
+        with self._lock:
+            state = self._state = self._reload()
+            keys, source, names = state[1], state[3], state[4]
+            if (key in keys) == (action == 'add'):
+                return True
+
+            change = dict(zip(CHANGE_COLUMNS, (*key, action, pd.Timestamp.now(tz='UTC').isoformat())))
+            # Names sort in the order the changes were made
+            name = f'{CHANGES_PREFIX}{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json'
+            if not write_object(json.dumps(change).encode('utf-8'), name):
+                return False
+            self._changes[name] = (key, action)
+            _apply(keys, key, action)
+            names = names + [name]
+            self._state = (time.time(), keys, self._build_index(keys), source, names)
+            pending = sum(1 for name in names if name > self._compacted_through)
+        invalidation_bus.announce([CHANGES_PREFIX])
+        if pending >= MAX_PENDING_CHANGES:
+            try:
+                self._compact()
+            except Exception as e:
+                # The change is stored; the next one tries again
+                logger.warning(f"Could not compact the exclusion changes: {e}")
+        return True
+
+    def _read_compacted(self) -> Optional[dict]:
+        from app.utils.storage import get_storage_manager
+        content = get_storage_manager().read_bytes(COMPACTED_FILE)
+        try:
+            return json.loads(content) if content else None
+        except ValueError:
+            return None
+
+    def _compact(self):
+        """
+        Fold the changes into excluded_networks.csv (one instance at a time)
+        and delete those folded in by the previous compaction, once no reader
+        can still be on a snapshot from before it.
+        """
+        with refresh_jobs.task_lock('exclusions') as acquired:
+            if not acquired:
+                return
+            with self._lock:
+                _, keys, _, _, names = self._state = self._reload()
+            compacted = self._read_compacted() or {}
+            through = compacted.get('through', '')
+            pending = [name for name in names if name > through]
+            self._compacted_through = through
+            if len(pending) < MAX_PENDING_CHANGES:
+                return
+
+            logger.info(f"Compacting {len(pending)} exclusion changes into {EXCLUSIONS_FILE} ({len(keys)} exclusions)")
+            if not write_dataset(pd.DataFrame(sorted(keys), columns=KEY_COLUMNS), EXCLUSIONS_FILE):
+                return
+            if not load_dataset(CHANGES_FILE).empty:
+                # Replaying the old log on the new file gives the same pairs, so a failed clear is harmless
+                write_dataset(pd.DataFrame(columns=CHANGE_COLUMNS), CHANGES_FILE)
+            if through and time.time() - compacted.get('compacted_at', 0) >= COMPACTED_GRACE:
+                deleted = delete_objects([name for name in names if name <= through])
+                logger.info(f"Deleted {deleted} exclusion changes folded in earlier")
+            marker = {'through': names[-1], 'compacted_at': time.time()}
+            if write_object(json.dumps(marker).encode('utf-8'), COMPACTED_FILE):
+                self._compacted_through = names[-1]
+
+    def invalidate(self):
+        """Reload from storage on next use"""
+        self._state = None
+
+    def after_fork(self):
+        """Recreate the lock in a forked worker"""
+        self._lock = threading.Lock()
+        self._state = None
+
+
+exclusion_store = ExclusionStore(ttl=Config.DATASET_CACHE_TTL)
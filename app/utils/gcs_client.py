@@ -2,23 +2,43 @@
 Google Cloud Storage client utilities for Cloud Run.
 Used as cache for S3 data to reduce egress costs.
 """
+from __future__ import annotations
+
 import logging
 from typing import Optional
-import pandas as pd
 from io import StringIO
+from app.utils.io_metrics import record_io
+from app.utils.lazy_import import lazy_import, module_available
+from app.utils.storage_backends import parse_csv
+from app.utils.tracing import span
+
+pd = lazy_import('pandas')
 
 logger = logging.getLogger(__name__)
 
-# Optional import - if not available, GCS features will be disabled
-try:
-    from google.cloud import storage
-    from google.cloud.exceptions import GoogleCloudError
-    GCS_AVAILABLE = True
-except ImportError:
+# Optional import - if not available, GCS features will be disabled.
+# The client library is only imported when the first GCS client is created.
+GCS_AVAILABLE = module_available('google.cloud.storage')
+if not GCS_AVAILABLE:
     logger.warning("google-cloud-storage not available. GCS features will be disabled.")
-    GCS_AVAILABLE = False
-    storage = None
-    GoogleCloudError = Exception
+storage = None
+GoogleCloudError = Exception
+# Set with the client library (self.bucket loads it before any request)
+NotFound = None
+PreconditionFailed = None
+
+
+def _load_gcs():
+    """Import google-cloud-storage on first use"""
+    global storage, GoogleCloudError, NotFound, PreconditionFailed
+    if storage is None:
+        from google.cloud import storage as gcs_storage
+        from google.cloud.exceptions import GoogleCloudError as gcs_error, NotFound as gcs_not_found
+        from google.api_core.exceptions import PreconditionFailed as gcs_precondition_failed
+        GoogleCloudError = gcs_error
+        NotFound = gcs_not_found
+        PreconditionFailed = gcs_precondition_failed
+        storage = gcs_storage
 
 
 class GCSManager:
@@ -40,6 +60,7 @@ class GCSManager:
             raise ImportError("google-cloud-storage is not installed. Install it with: pip install google-cloud-storage")
         if self._storage_client is None:
             logger.info("Initializing GCS client")
+            _load_gcs()
             if self.project_id:
                 self._storage_client = storage.Client(project=self.project_id)
             else:
@@ -61,30 +82,16 @@ class GCSManager:
             filename: Name of the CSV file in GCS
 
         Returns:
-            DataFrame with CSV contents
+            DataFrame with CSV contents (empty if missing or unreadable)
         """
         try:
-            logger.info(f"[GCS] Reading {filename} from bucket {self.bucket_name}")
-            blob = self.bucket.blob(filename)
-            
-            if not blob.exists():
-                logger.warning(f"{filename} does not exist in GCS bucket {self.bucket_name}")
+            content = self.read_bytes(filename)
+            if content is None:
                 return pd.DataFrame()
-            
-            content = blob.download_as_text()
-            
-            if not content.strip():
-                logger.warning(f"{filename} is empty")
-                return pd.DataFrame()
-
-            df = pd.read_csv(StringIO(content), quotechar='"')
-            logger.info(f"Successfully read {len(df)} rows and {len(df.columns)} columns from {filename}")
-            if len(df) > 0:
-                logger.debug(f"Columns in {filename}: {df.columns.tolist()[:10]}")
-            return df
+            return parse_csv(content, filename)
 
-        except GoogleCloudError as e:
-            logger.error(f"GCS error reading {filename}: {e}")
+        except GoogleCloudError:
+            # Logged by read_bytes
             return pd.DataFrame()
 
         except pd.errors.EmptyDataError:
@@ -95,6 +102,33 @@ class GCSManager:
             logger.error(f"Error reading {filename} from GCS: {e}", exc_info=True)
             return pd.DataFrame()
 
+    def read_bytes(self, filename: str) -> Optional[bytes]:
+        """
+        Raw file contents from GCS, downloaded in one request (no exists() check first).
+
+        Args:
+            filename: Name of the file in GCS
+
+        Returns:
+            File contents, or None if the file doesn't exist (other errors are raised)
+        """
+        logger.info(f"[GCS] Reading {filename} from bucket {self.bucket_name}")
+        with span('storage.download', **{'storage.backend': 'gcs', 'storage.bucket': self.bucket_name, 'file': filename}) as current:
+            blob = self.bucket.blob(filename)
+            content = b''
+            try:
+                content = blob.download_as_bytes()
+            except NotFound:
+                logger.warning(f"{filename} does not exist in GCS bucket {self.bucket_name}")
+                return None
+            except GoogleCloudError as e:
+                logger.error(f"GCS error reading {filename}: {e}")
+                raise
+            finally:
+                record_io('gcs', 'read', filename, downloaded=len(content))
+            current.set_attribute('bytes', len(content))
+        return content
+
     def write_csv(self, df: pd.DataFrame, filename: str) -> bool:
         """
         Write DataFrame to GCS as CSV.
@@ -110,9 +144,12 @@ class GCSManager:
             csv_buffer = StringIO()
             df.to_csv(csv_buffer, index=False)
 
+            body = csv_buffer.getvalue().encode('utf-8')
+
             blob = self.bucket.blob(filename)
+            record_io('gcs', 'write', filename, uploaded=len(body))
             blob.upload_from_string(
-                csv_buffer.getvalue(),
+                body,
                 content_type='text/csv'
             )
 
@@ -141,6 +178,7 @@ class GCSManager:
         """
         try:
             blob = self.bucket.blob(filename)
+            record_io('gcs', 'write', filename, uploaded=len(content))
             blob.upload_from_string(content, content_type=content_type)
             logger.info(f"Successfully uploaded {filename} to GCS bucket {self.bucket_name}")
             return True
@@ -148,10 +186,54 @@ class GCSManager:
             logger.error(f"Error uploading {filename} to GCS: {e}")
             return False
 
+    def read_versioned(self, filename: str) -> tuple:
+        """
+        Contents and generation of a file for write_if_generation(), in one request.
+
+        Returns:
+            (contents, generation), (None, None) if the file doesn't exist
+        """
+        blob = self.bucket.blob(filename)
+        content = b''
+        try:
+            content = blob.download_as_bytes()
+        except NotFound:
+            return None, None
+        finally:
+            record_io('gcs', 'read', filename, downloaded=len(content))
+        # Set from the download's x-goog-generation header
+        return content, blob.generation
+
+    def write_if_generation(self, content: bytes, filename: str, generation: Optional[int],
+                            content_type: str = 'application/json') -> bool:
+        """
+        Write raw bytes only if the object is still at a generation (if_generation_match).
+
+        Args:
+            generation: From read_versioned() (None: only if the object doesn't exist)
+
+        Returns:
+            True if written, False if the object changed in between or the write failed
+        """
+        try:
+            blob = self.bucket.blob(filename)
+            record_io('gcs', 'write', filename, uploaded=len(content))
+            blob.upload_from_string(content, content_type=content_type,
+                                    if_generation_match=generation if generation is not None else 0)
+            logger.info(f"Successfully uploaded {filename} to GCS bucket {self.bucket_name}")
+            return True
+        except PreconditionFailed:
+            logger.info(f"{filename} changed in GCS bucket {self.bucket_name} since it was read")
+            return False
+        except Exception as e:
+            logger.error(f"Error uploading {filename} to GCS: {e}")
+            return False
+
     def file_exists(self, filename: str) -> bool:
         """Check if a file exists in GCS"""
         try:
             blob = self.bucket.blob(filename)
+            record_io('gcs', 'exists', filename)
             return blob.exists()
         except Exception as e:
             logger.error(f"Error checking if {filename} exists: {e}")
@@ -161,16 +243,32 @@ class GCSManager:
         """List files in GCS bucket with optional prefix"""
         try:
             blobs = self.storage_client.list_blobs(self.bucket_name, prefix=prefix)
-            return [blob.name for blob in blobs]
+            names = [blob.name for blob in blobs]
+            # One request per page of up to 1000 objects
+            record_io('gcs', 'list', f'{prefix}*', requests=max(1, -(-len(names) // 1000)))
+            return names
         except Exception as e:
             logger.error(f"Error listing files in GCS: {e}")
             return []
 
+    def list_generations(self, prefix: str = '') -> dict:
+        """{name: generation} of the files under prefix, from one listing (no per-file metadata requests)"""
+        try:
+            blobs = self.storage_client.list_blobs(self.bucket_name, prefix=prefix)
+            generations = {blob.name: str(blob.generation) for blob in blobs}
+            record_io('gcs', 'list', f'{prefix}*', requests=max(1, -(-len(generations) // 1000)))
+            return generations
+        except Exception as e:
+            logger.error(f"Error listing file generations in GCS: {e}")
+            return {}
+
     def get_file_size(self, filename: str) -> int:
         """Get file size in bytes"""
         try:
             blob = self.bucket.blob(filename)
+            record_io('gcs', 'exists', filename)
             if blob.exists():
+                record_io('gcs', 'size', filename)
                 blob.reload()
                 return blob.size
             return 0
@@ -178,3 +276,15 @@ class GCSManager:
             logger.error(f"Error getting file size for {filename}: {e}")
             return 0
 
+    def delete_files(self, filenames: list) -> int:
+        """Delete files from GCS (missing ones are skipped); the number deleted"""
+        if not filenames:
+            return 0
+        missing = []
+        try:
+            record_io('gcs', 'delete', f'{filenames[0]}..', requests=len(filenames))
+            self.bucket.delete_blobs(filenames, on_error=missing.append)
+            return len(filenames) - len(missing)
+        except Exception as e:
+            logger.error(f"Error deleting files from GCS: {e}")
+            return 0
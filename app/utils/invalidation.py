@@ -0,0 +1,245 @@
+"""
+Cross-instance cache invalidation for Cloud Run.
+Whoever changes data (a refresh, set_frequencies, an exclusion) publishes a
+change event on a Redis channel: the new snapshot version
+(app.utils.snapshots) or, without snapshots, the datasets rewritten. Every
+worker of every instance listens in a background thread and applies the
+event to its own caches straight away, instead of serving the old data
+until its next pointer check or TTL. Delivery latency (publish to applied)
+is measured per worker, see /debug/invalidation.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Optional
+from app.config import Config
+from app.utils.lazy_import import lazy_import
+from app.utils.tracing import span
+
+redis = lazy_import('redis')
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'cache_invalidation'
+# Seconds to wait before retrying Redis after an error
+REDIS_RETRY_INTERVAL = 60
+# Latencies kept for the percentiles in stats()
+LATENCY_SAMPLES = 500
+
+
+def _percentiles(samples) -> dict:
+    values = sorted(samples)
+    if not values:
+        return {'count': 0}
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))], 2)
+    return {'count': len(values), 'p50': pick(0.5), 'p95': pick(0.95), 'max': round(values[-1], 2)}
+
+
+def apply_event(event: dict):
+    """
+    Bring this worker's caches up to date with a change event.
+
+    A snapshot event makes the worker read the pointer now (unless it is
+    already on that version or a newer one); without snapshots, the named
+    datasets (all of them if none are named) are dropped from the caches.
+    Exclusion changes are stored outside the snapshots, so an event naming
+    them always reloads the exclusions.
+    """
+    from app.utils.datasets import invalidate_dataset
+    from app.utils.exclusions import EXCLUSION_DATASETS, exclusion_store
+    from app.utils.snapshots import snapshot_store
+
+    version = event.get('version')
+    datasets = event.get('datasets')
+    if version is not None:
+        current = snapshot_store.current()
+        if current is None or current.version < version:
+            snapshot_store.check()
+        if datasets and set(EXCLUSION_DATASETS) & set(datasets):
+            exclusion_store.invalidate()
+        return
+    if datasets is None:
+        invalidate_dataset()
+        exclusion_store.invalidate()
+        return
+    for filename in datasets:
+        invalidate_dataset(filename)
+    if set(EXCLUSION_DATASETS) & set(datasets):
+        exclusion_store.invalidate()
+
+
+class InvalidationBus:
+    """
+    Change events over Redis pub/sub (CACHE_INVALIDATION_REDIS).
+
+    Events from this worker itself are ignored by its listener - the
+    writer has already updated its own caches. Without Redis nothing is
+    sent and the other instances catch up on their pointer check or TTL.
+    """
+
+    def __init__(self):
+        self.origin = f'{socket.gethostname()}:{os.getpid()}'
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_failed_at = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+        self._listening_since = None
+        self._counts = {'published': 0, 'received': 0, 'applied': 0, 'failed': 0}
+        self._delivery_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._applied_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._last_event = None
+
+    def _client(self):
+        if not Config.CACHE_INVALIDATION_REDIS or time.time() - self._redis_failed_at < REDIS_RETRY_INTERVAL:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=Config.REDIS_HOST, port=Config.REDIS_PORT, password=Config.REDIS_PASSWORD or None,
+                socket_timeout=2, socket_connect_timeout=2
+            )
+        return self._redis
+
+    def announce(self, datasets: Optional[list] = None) -> bool:
+        """
+        Tell the other workers and instances that data changed.
+
+        Args:
+            datasets: Datasets rewritten (None for all, e.g. after a refresh);
+                with snapshots the event carries the current version instead
+
+        Returns:
+            True if the event was published
+        """
+        client = self._client()
+        if client is None:
+            return False
+        from app.utils.snapshots import snapshot_store
+
+        snapshot = snapshot_store.current()
+        event = {
+            'id': uuid.uuid4().hex[:12],
+            'origin': self.origin,
+            'sent_at': time.time(),
+            'version': snapshot.version if snapshot is not None else None,
+            'datasets': list(datasets) if datasets is not None else None,
+        }
+        try:
+            receivers = client.publish(CHANNEL, json.dumps(event))
+        except Exception as e:
+            logger.warning(f"Could not publish cache invalidation, other instances catch up on their own: {e}")
+            self._redis_failed_at = time.time()
+            return False
+        with self._lock:
+            self._counts['published'] += 1
+        logger.info(f"Published cache invalidation {event['id']} (version {event['version']}, "
+                    f"datasets {event['datasets']}) to {receivers} listeners")
+        return True
+
+    def receive(self, data: bytes):
+        """Apply an event received from the channel and record its latency"""
+        received_at = time.time()
+        try:
+            event = json.loads(data)
+        except ValueError:
+            logger.warning(f"Ignoring malformed cache invalidation event: {data[:100]!r}")
+            return
+        if event.get('origin') == self.origin:
+            return
+        delivery_ms = (received_at - event.get('sent_at', received_at)) * 1000
+        with self._lock:
+            self._counts['received'] += 1
+            self._delivery_ms.append(delivery_ms)
+        try:
+            with span('invalidation.apply', event=event.get('id'), version=event.get('version')):
+                apply_event(event)
+        except Exception as e:
+            logger.error(f"Error applying cache invalidation {event.get('id')}: {e}", exc_info=True)
+            with self._lock:
+                self._counts['failed'] += 1
+            return
+        applied_ms = (time.time() - event.get('sent_at', received_at)) * 1000
+        with self._lock:
+            self._counts['applied'] += 1
+            self._applied_ms.append(applied_ms)
+            self._last_event = {**event, 'delivery_ms': round(delivery_ms, 2), 'applied_ms': round(applied_ms, 2)}
+        logger.info(f"Applied cache invalidation {event.get('id')} from {event.get('origin')} "
+                    f"({delivery_ms:.1f} ms delivery, {applied_ms:.1f} ms to applied)")
+
+    def _listen(self):
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                # Own connection without a read timeout; health checks notice a dead link
+                client = redis.Redis(
+                    host=Config.REDIS_HOST, port=Config.REDIS_PORT, password=Config.REDIS_PASSWORD or None,
+                    socket_connect_timeout=2, health_check_interval=30
+                )
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                self._listening_since = time.time()
+                logger.info(f"Listening for cache invalidations on Redis channel {CHANNEL}")
+                # Catch up on snapshots published while not subscribed (plain files expire by TTL)
+                from app.utils.snapshots import snapshot_store
+                snapshot_store.check()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None and message.get('type') == 'message':
+                        self.receive(message['data'])
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener lost Redis, retrying in {REDIS_RETRY_INTERVAL}s: {e}")
+                self._listening_since = None
+                self._stop.wait(REDIS_RETRY_INTERVAL)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+        self._listening_since = None
+
+    def start(self):
+        """Start the listener thread (once per process; no-op without CACHE_INVALIDATION_REDIS)"""
+        if not Config.CACHE_INVALIDATION_REDIS:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._listen, name='cache-invalidation', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the listener thread"""
+        self._stop.set()
+
+    def stats(self) -> dict:
+        """Event counts and latencies (ms from publish to received and to applied) of this worker"""
+        with self._lock:
+            return {
+                'enabled': Config.CACHE_INVALIDATION_REDIS,
+                'origin': self.origin,
+                'listening_since': self._listening_since,
+                **self._counts,
+                'delivery_ms': _percentiles(self._delivery_ms),
+                'applied_ms': _percentiles(self._applied_ms),
+                'last_event': self._last_event,
+            }
+
+    def after_fork(self):
+        """Forget the master's client and listener (threads don't survive fork); start() again"""
+        self.origin = f'{socket.gethostname()}:{os.getpid()}'
+        self._lock = threading.Lock()
+        self._redis = None
+        self._thread = None
+        self._listening_since = None
+
+
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,84 @@
+"""
+Prebuilt environment inventory for Cloud Run.
+The env versions page shows the VCF and non-VCF inventories combined,
+with dates normalized and duplicates removed. That is built once per data
+refresh and stored as its own dataset (env_inventory.csv), so page views
+load one typed, deduplicated file instead of concatenating both sources.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Optional
+from app.utils.datasets import load_dataset
+from app.utils.lazy_import import lazy_import
+from app.utils.tracing import span
+
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+ENV_INVENTORY = 'env_inventory.csv'
+INVENTORY_SOURCES = ('combined_non_vcf_inventory.csv', 'combined_vcf_inventory.csv')
+# A row is the same inventory entry when these match
+DEDUP_COLUMNS = ['Customer', 'Location', 'Report Date', 'VM', 'Name']
+
+
+def build_env_inventory(frames: list) -> pd.DataFrame:
+    """
+    Combine the inventories into the env versions table.
+
+    Args:
+        frames: DataFrames of INVENTORY_SOURCES (empty ones are skipped)
+
+    Returns:
+        Concatenated inventory with 'Report Date' as YYYY-MM-DD, deduplicated
+    """
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    with span('transform.env_inventory', rows=sum(len(df) for df in frames)):
+        # Categories differ between the files - concatenate as plain values
+        inventory = pd.concat([df.astype({
+            col: object for col, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)
+        }) for df in frames], ignore_index=True)
+        if 'Report Date' in inventory.columns:
+            inventory['Report Date'] = pd.to_datetime(inventory['Report Date'], errors='coerce').dt.strftime('%Y-%m-%d')
+        dedup_cols = [col for col in DEDUP_COLUMNS if col in inventory.columns]
+        if dedup_cols:
+            inventory = inventory.drop_duplicates(subset=dedup_cols, ignore_index=True)
+    return inventory
+
+
+def publish_env_inventory(storage, frames: Optional[list] = None) -> bool:
+    """
+    Build the env inventory and write it to a storage backend.
+
+    Args:
+        storage: Backend to read the sources from (unless given) and write to
+        frames: Already loaded source DataFrames, e.g. from a refresh copy
+
+    Returns:
+        True if written
+    """
+    try:
+        if frames is None:
+            frames = [storage.read_csv(filename) for filename in INVENTORY_SOURCES]
+        inventory = build_env_inventory(frames)
+    except Exception as e:
+        # The page falls back to building it on the fly
+        logger.error(f"Error building {ENV_INVENTORY}: {e}", exc_info=True)
+        return False
+    if inventory.empty:
+        logger.warning(f"No inventory data, {ENV_INVENTORY} not written")
+        return False
+    logger.info(f"Publishing {ENV_INVENTORY} ({len(inventory)} rows)")
+    return storage.write_csv(inventory, ENV_INVENTORY)
+
+
+def load_env_inventory() -> pd.DataFrame:
+    """The env inventory, built from the sources if it hasn't been published yet"""
+    inventory = load_dataset(ENV_INVENTORY)
+    if inventory.empty:
+        logger.info(f"{ENV_INVENTORY} not published yet, building it from the inventories")
+        inventory = build_env_inventory([load_dataset(filename) for filename in INVENTORY_SOURCES])
+    return inventory
@@ -0,0 +1,350 @@
+"""
+Storage I/O accounting for Cloud Run.
+Counts requests and bytes per storage backend, operation and object, plus
+hit/miss counts of the dataset caches, so egress and operation costs can be
+computed from what the app actually does instead of assumed read rates.
+Counters are kept per worker and (optionally) summed across workers and
+instances in Redis by a background thread. See /debug/io.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from app.config import Config
+from app.utils.lazy_import import lazy_import
+from app.utils.snapshots import dataset_name
+
+redis = lazy_import('redis')
+
+logger = logging.getLogger(__name__)
+
+# Billing class per operation: GCS Class A / Class B; for S3 the same split is
+# PUT/LIST (A) versus GET/HEAD (B)
+OPERATION_CLASSES = {
+    'write': 'A',
+    'list': 'A',
+    'read': 'B',
+    'exists': 'B',
+    'size': 'B',
+    'delete': None,  # Free
+}
+
+# List prices (USD) as of 2024
+PRICES = {
+    's3_egress_per_gb': 0.09,          # Internet egress, first 10TB
+    's3_class_a_per_10k': 0.05,        # PUT, COPY, POST, LIST ($0.005/1k)
+    's3_class_b_per_10k': 0.004,       # GET, HEAD ($0.0004/1k)
+    'gcs_class_a_per_10k': 0.05,
+    'gcs_class_b_per_10k': 0.004,
+    'gcs_storage_per_gb_month': 0.020,
+}
+
+REDIS_PREFIX = 'io_metrics'
+# Seconds to wait before retrying Redis after a failed flush
+REDIS_RETRY_INTERVAL = 60
+# Objects counted individually per worker; the rest are summed under OTHER_OBJECTS
+MAX_OBJECTS = 500
+OTHER_OBJECTS = '(other)'
+# Seconds of counts needed before they are projected to a month
+MIN_PROJECTION_WINDOW = 3600
+
+# Counter fields per (backend, operation) and per (backend, object)
+FIELDS = ('requests', 'bytes_downloaded', 'bytes_uploaded')
+
+
+def _add(counters: dict, key: tuple, values: tuple):
+    current = counters.get(key)
+    counters[key] = values if current is None else tuple(a + b for a, b in zip(current, values))
+
+
+class IOMetrics:
+    """
+    Thread-safe I/O and cache counters for this worker.
+
+    Every record also goes into a pending delta that a background thread
+    (start()) adds to the Redis totals every IO_METRICS_FLUSH_INTERVAL seconds.
+    Objects are counted by dataset name, so every snapshot version of a file
+    adds to the same counters.
+    """
+
+    def __init__(self, flush_interval: float = 10):
+        self.flush_interval = flush_interval
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._operations = {}  # (backend, operation) -> (requests, bytes_downloaded, bytes_uploaded)
+        self._objects = {}     # (backend, object) -> (requests, bytes_downloaded, bytes_uploaded)
+        self._cache = {}       # layer -> (hits, misses)
+        self._pending = ({}, {}, {})
+        self._redis = None
+        self._redis_failed_at = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def record(self, backend: str, operation: str, obj: str, downloaded: int = 0, uploaded: int = 0, requests: int = 1):
+        """
+        Count one storage request.
+
+        Args:
+            backend: 's3', 'gcs', 'local' or 'memory'
+            operation: 'read', 'write', 'exists', 'size', 'list' or 'delete'
+            obj: Object name (or 'prefix*' for listings); counted by dataset name
+            downloaded: Bytes received
+            uploaded: Bytes sent
+            requests: Billable requests made (e.g. pages of a listing)
+        """
+        values = (requests, downloaded, uploaded)
+        key = (backend, dataset_name(obj))
+        with self._lock:
+            if key not in self._objects and len(self._objects) >= MAX_OBJECTS:
+                key = (backend, OTHER_OBJECTS)
+            _add(self._operations, (backend, operation), values)
+            _add(self._objects, key, values)
+            if Config.IO_METRICS_REDIS:
+                _add(self._pending[0], (backend, operation), values)
+                _add(self._pending[1], key, values)
+        for scope in getattr(self._local, 'scopes', ()):
+            _add(scope, (backend, operation), values)
+
+    def record_cache(self, layer: str, hit: bool):
+        """Count a hit or miss of a cache layer ('dataset' per worker, 'shared_dataset' per instance)"""
+        values = (1, 0) if hit else (0, 1)
+        with self._lock:
+            _add(self._cache, layer, values)
+            if Config.IO_METRICS_REDIS:
+                _add(self._pending[2], layer, values)
+
+    @contextmanager
+    def scope(self):
+        """
+        Collect the storage requests made by the current thread inside the block.
+
+        Usage:
+            with io_metrics.scope() as usage:
+                copy_files()
+            summarize_backends(usage)
+        """
+        usage = {}
+        scopes = self._local.__dict__.setdefault('scopes', [])
+        scopes.append(usage)
+        try:
+            yield usage
+        finally:
+            scopes.remove(usage)
+
+    def snapshot(self, limit: int = 20) -> dict:
+        """Counters of this worker"""
+        with self._lock:
+            operations, objects, cache = dict(self._operations), dict(self._objects), dict(self._cache)
+        return build_report(operations, objects, cache, self.started_at, limit)
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self._objects.clear()
+            self._cache.clear()
+            self._pending = ({}, {}, {})
+        self.started_at = time.time()
+
+    def after_fork(self):
+        """Start from zero in a forked worker (the master flushes its own counters before forking); start() again"""
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._redis = None
+        self._thread = None
+        self.reset()
+
+    # Redis aggregation
+
+    def _client(self):
+        if not Config.IO_METRICS_REDIS or time.time() - self._redis_failed_at < REDIS_RETRY_INTERVAL:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=Config.REDIS_HOST, port=Config.REDIS_PORT, password=Config.REDIS_PASSWORD or None,
+                socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+        return self._redis
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """Start the flush thread (once per process; no-op without IO_METRICS_REDIS)"""
+        if not Config.IO_METRICS_REDIS:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='io-metrics-flush', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread"""
+        self._stop.set()
+
+    def flush(self):
+        """Add the counts recorded since the last flush to the Redis totals"""
+        if not Config.IO_METRICS_REDIS:
+            return
+        client = self._client()
+        if client is None:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, ({}, {}, {})
+        operations, objects, cache = pending
+        if not (operations or objects or cache):
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.setnx(f'{REDIS_PREFIX}:since', self.started_at)
+            for name, counters in (('operations', operations), ('objects', objects)):
+                for (backend, key), values in counters.items():
+                    for field, value in zip(FIELDS, values):
+                        if value:
+                            pipe.hincrby(f'{REDIS_PREFIX}:{name}', f'{backend}|{key}|{field}', value)
+            for layer, (hits, misses) in cache.items():
+                pipe.hincrby(f'{REDIS_PREFIX}:cache', f'{layer}|hits', hits)
+                pipe.hincrby(f'{REDIS_PREFIX}:cache', f'{layer}|misses', misses)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not flush I/O metrics to Redis: {e}")
+            self._redis_failed_at = time.time()
+            # Keep the counts for the next flush
+            with self._lock:
+                for merged, failed in zip(self._pending, pending):
+                    for key, values in failed.items():
+                        _add(merged, key, values)
+
+    def global_snapshot(self, limit: int = 20) -> Optional[dict]:
+        """Counters summed over all workers and instances (None if Redis is not in use)"""
+        client = self._client()
+        if client is None:
+            return None
+        self.flush()
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.get(f'{REDIS_PREFIX}:since')
+            for name in ('operations', 'objects', 'cache'):
+                pipe.hgetall(f'{REDIS_PREFIX}:{name}')
+            since, *hashes = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not read I/O metrics from Redis: {e}")
+            self._redis_failed_at = time.time()
+            return None
+
+        operations, objects = {}, {}
+        for counters, raw in ((operations, hashes[0]), (objects, hashes[1])):
+            for field, value in raw.items():
+                backend, rest = field.decode().split('|', 1)
+                key, name = rest.rsplit('|', 1)
+                values = tuple(int(value) if name == f else 0 for f in FIELDS)
+                _add(counters, (backend, key), values)
+        cache = {}
+        for field, value in hashes[2].items():
+            layer, name = field.decode().rsplit('|', 1)
+            _add(cache, layer, (int(value), 0) if name == 'hits' else (0, int(value)))
+        return build_report(operations, objects, cache, float(since) if since else time.time(), limit)
+
+
+def summarize_backends(operations: dict) -> dict:
+    """
+    Totals per backend from (backend, operation) counters.
+
+    Returns:
+        {backend: {requests, class_a, class_b, bytes_downloaded, bytes_uploaded, operations}}
+    """
+    backends = {}
+    for (backend, operation), values in sorted(operations.items()):
+        entry = backends.setdefault(backend, {
+            'requests': 0, 'class_a': 0, 'class_b': 0, 'bytes_downloaded': 0, 'bytes_uploaded': 0, 'operations': {},
+        })
+        requests, downloaded, uploaded = values
+        entry['requests'] += requests
+        billing_class = OPERATION_CLASSES.get(operation, 'B')
+        if billing_class is not None:
+            entry[f"class_{billing_class.lower()}"] += requests
+        entry['bytes_downloaded'] += downloaded
+        entry['bytes_uploaded'] += uploaded
+        entry['operations'][operation] = dict(zip(FIELDS, values))
+    return backends
+
+
+def usage_costs(backends: dict) -> dict:
+    """
+    Cost of the counted usage at list prices.
+
+    Args:
+        backends: Output of summarize_backends()
+
+    Returns:
+        Dictionary with cost breakdown in USD
+    """
+    s3 = backends.get('s3', {})
+    gcs = backends.get('gcs', {})
+    costs = {
+        's3_egress_usd': s3.get('bytes_downloaded', 0) / 1024 ** 3 * PRICES['s3_egress_per_gb'],
+        's3_requests_usd': (s3.get('class_a', 0) * PRICES['s3_class_a_per_10k'] + s3.get('class_b', 0) * PRICES['s3_class_b_per_10k']) / 10000,
+        'gcs_class_a_usd': gcs.get('class_a', 0) * PRICES['gcs_class_a_per_10k'] / 10000,
+        'gcs_class_b_usd': gcs.get('class_b', 0) * PRICES['gcs_class_b_per_10k'] / 10000,
+    }
+    costs['total_usd'] = sum(costs.values())
+    # What the GCS reads would have cost had they gone to S3 instead
+    costs['s3_egress_avoided_usd'] = (
+        gcs.get('bytes_downloaded', 0) / 1024 ** 3 * PRICES['s3_egress_per_gb']
+        + gcs.get('class_b', 0) * PRICES['s3_class_b_per_10k'] / 10000
+    )
+    return costs
+
+
+def build_report(operations: dict, objects: dict, cache: dict, since: float, limit: int = 20) -> dict:
+    """
+    Counters as JSON-friendly dicts, with the top objects and a monthly cost
+    projection (None until MIN_PROJECTION_WINDOW seconds have been counted -
+    a few minutes after a cold start don't extrapolate to a month).
+    """
+    elapsed = max(time.time() - since, 1.0)
+    backends = summarize_backends(operations)
+
+    top_objects = {}
+    for (backend, obj), values in objects.items():
+        top_objects.setdefault(backend, []).append({'object': obj, **dict(zip(FIELDS, values))})
+    for backend, rows in top_objects.items():
+        rows.sort(key=lambda row: (row['bytes_downloaded'] + row['bytes_uploaded'], row['requests']), reverse=True)
+        top_objects[backend] = rows[:limit]
+
+    if elapsed >= MIN_PROJECTION_WINDOW:
+        month_factor = 30 * 86400 / elapsed
+        projected = {name: round(cost * month_factor, 4) for name, cost in usage_costs(backends).items()}
+    else:
+        projected = None
+    return {
+        'since': since,
+        'elapsed_s': round(elapsed),
+        'backends': backends,
+        'top_objects': top_objects,
+        'cache': {
+            layer: {'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None}
+            for layer, (hits, misses) in sorted(cache.items())
+        },
+        'costs_usd': {name: round(cost, 4) for name, cost in usage_costs(backends).items()},
+        'projected_monthly_usd': projected,
+    }
+
+
+io_metrics = IOMetrics(flush_interval=Config.IO_METRICS_FLUSH_INTERVAL)
+
+
+def record_io(backend: str, operation: str, obj: str, downloaded: int = 0, uploaded: int = 0, requests: int = 1):
+    """Count a storage request (see IOMetrics.record)"""
+    io_metrics.record(backend, operation, obj, downloaded, uploaded, requests)
+
+
+def record_cache(layer: str, hit: bool):
+    """Count a cache hit or miss (see IOMetrics.record_cache)"""
+    io_metrics.record_cache(layer, hit)
@@ -0,0 +1,48 @@
+"""
+Lazy module imports for Cloud Run cold starts.
+Heavy dependencies (pandas, boto3, google-cloud-storage, bs4, ...) are only
+imported when a route first touches them, not when the app module loads.
+"""
+import importlib
+import importlib.util
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module proxy that imports the real module on first attribute access.
+
+    After the first access the real module's namespace is copied onto the
+    proxy, so later attribute lookups are plain dict hits.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__['_lazy_target'] = name
+
+    def __getattr__(self, attr):
+        # importlib holds the per-module import lock, so concurrent first use is safe
+        module = importlib.import_module(self._lazy_target)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._lazy_target}'>"
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Get a module that is imported on first use.
+
+    Usage:
+        pd = lazy_import('pandas')
+    """
+    return LazyModule(name)
+
+
+def module_available(name: str) -> bool:
+    """Check if a module can be imported, without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ImportError:
+        return False
@@ -0,0 +1,99 @@
+"""
+Location-partitioned datasets for Cloud Run.
+Refresh publishes the files behind the location-filtered endpoints
+(/alerts_report, /get_vhosts_data, /get_vinfo_data) as one Parquet file
+per location, e.g. combined_vhosts_reports/LOC-001.parquet. A request for
+one location downloads and parses only that location's rows instead of
+the whole combined file.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+from typing import Optional
+from app.utils.datasets import load_dataset
+from app.utils.lazy_import import lazy_import, module_available
+from app.utils.partitions import PartitionedDataset
+
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+LOCATION_COLUMN = 'Location'
+LOCATION_DATASETS = (
+    'combined_vrops_list_of_alerts.csv',
+    'combined_vhosts_reports.csv',
+    'rvtools_vinfo.csv',
+)
+
+_SAFE_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$')
+
+
+def _location_key(df: pd.DataFrame) -> pd.Series:
+    return df[LOCATION_COLUMN]
+
+
+def _location_file(location: str) -> str:
+    """File name of a location's partition (names that aren't plain get a hashed suffix)"""
+    if _SAFE_NAME.match(location):
+        return location
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '_', location).strip('._')[:48]
+    return f"{slug}-{hashlib.sha1(location.encode('utf-8')).hexdigest()[:10]}"
+
+
+location_partitions = {
+    filename: PartitionedDataset(filename, _location_key, file_of=_location_file, file_format='parquet')
+    for filename in LOCATION_DATASETS
+}
+
+
+def publish_location_partitions(storage, frames: Optional[dict] = None, datasets: tuple = LOCATION_DATASETS) -> list:
+    """
+    Write the per-location partitions of LOCATION_DATASETS to a storage backend.
+
+    Args:
+        storage: Backend to read the datasets from (unless given) and write to
+        frames: Already loaded datasets by filename, e.g. from a refresh copy
+        datasets: Which of LOCATION_DATASETS to publish (e.g. only those that changed)
+
+    Returns:
+        Filenames of the datasets that were published
+    """
+    if not module_available('pyarrow'):
+        logger.warning("pyarrow not available. Location partitions will not be published.")
+        return []
+    published = []
+    for filename, partitions in location_partitions.items():
+        if filename not in datasets:
+            continue
+        try:
+            df = frames.get(filename) if frames is not None else storage.read_csv(filename)
+            if df is None or df.empty or LOCATION_COLUMN not in df.columns:
+                logger.warning(f"No {LOCATION_COLUMN} data in {filename}, partitions not written")
+                continue
+            if partitions.publish(storage, df):
+                published.append(filename)
+        except Exception as e:
+            # Routes fall back to filtering the whole file
+            logger.error(f"Error publishing {filename} partitions: {e}", exc_info=True)
+    return published
+
+
+def load_location(filename: str, location: str) -> pd.DataFrame:
+    """
+    Rows of one location of a dataset, in file order.
+
+    Reads the location's partition if published, otherwise the whole
+    dataset filtered on Location (unfiltered if it has no Location column).
+    """
+    partitions = location_partitions.get(filename)
+    if partitions is not None:
+        rows = partitions.load([location])
+        if rows is not None:
+            return rows
+    df = load_dataset(filename)
+    if df.empty or LOCATION_COLUMN not in df.columns:
+        return df
+    # A new frame, so callers can add columns to it
+    return df[df[LOCATION_COLUMN] == location].copy(deep=False)
@@ -0,0 +1,155 @@
+"""
+Memory accounting for Cloud Run instances.
+Records the RSS growth (and optionally the tracemalloc peak) of every
+request per route, and the in-memory footprint of every dataset loaded,
+so the route or dataset behind a memory-limit restart can be identified.
+See /debug/memory for the summary.
+"""
+from __future__ import annotations
+
+import logging
+import resource
+import threading
+import time
+import tracemalloc
+from typing import Optional
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Set by init_memory_tracking(): 'off', 'rss' or 'tracemalloc'
+_mode = 'off'
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+    except OSError:
+        # No /proc (macOS) - fall back to the peak
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RouteMemoryStats:
+    """Per-route memory growth, aggregated over requests (thread-safe)"""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, rss_delta_mb: float, traced_peak_mb: Optional[float]):
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                'requests': 0, 'rss_delta_max_mb': 0.0, 'rss_delta_total_mb': 0.0, 'traced_peak_max_mb': None,
+            })
+            stats['requests'] += 1
+            stats['rss_delta_max_mb'] = max(stats['rss_delta_max_mb'], rss_delta_mb)
+            stats['rss_delta_total_mb'] += rss_delta_mb
+            if traced_peak_mb is not None:
+                stats['traced_peak_max_mb'] = max(stats['traced_peak_max_mb'] or 0.0, traced_peak_mb)
+
+    def top(self, limit: int = 10) -> list:
+        """Routes ordered by the largest peak (tracemalloc) or RSS growth of a single request"""
+        with self._lock:
+            rows = [
+                {'route': route, **{key: round(value, 2) if isinstance(value, float) else value for key, value in stats.items()}}
+                for route, stats in self._routes.items()
+            ]
+        return sorted(rows, key=lambda row: row['traced_peak_max_mb'] or row['rss_delta_max_mb'], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+route_memory = RouteMemoryStats()
+
+# filename -> footprint of the last loaded copy
+dataset_footprints = {}
+
+
+def dataset_footprint(filename: str, df) -> dict:
+    """
+    Measure and log the in-memory size of a freshly loaded dataset.
+
+    Args:
+        filename: Dataset filename
+        df: Loaded DataFrame
+
+    Returns:
+        Footprint summary (also kept in dataset_footprints)
+    """
+    if _mode == 'off' or df.empty:
+        return {}
+    usage = df.memory_usage(deep=True, index=True)
+    largest = usage.drop('Index').nlargest(3)
+    footprint = {
+        'rows': len(df),
+        'columns': len(df.columns),
+        'mb': round(usage.sum() / 1024 ** 2, 2),
+        'largest_columns_mb': {str(col): round(size / 1024 ** 2, 2) for col, size in largest.items()},
+        'measured_at': time.time(),
+    }
+    dataset_footprints[filename] = footprint
+    logger.info(
+        f"Loaded {filename}: {footprint['rows']} rows, {footprint['mb']} MB in memory "
+        f"(largest columns: {footprint['largest_columns_mb']})"
+    )
+    return footprint
+
+
+def _start_request():
+    g.memory_rss_start = rss_mb()
+    if _mode == 'tracemalloc':
+        # Peak is process-wide: with concurrent requests it covers overlapping ones too
+        tracemalloc.reset_peak()
+        g.memory_traced_start = tracemalloc.get_traced_memory()[0]
+
+
+def _end_request(response):
+    rss_start = g.pop('memory_rss_start', None)
+    if rss_start is None:
+        return response
+    traced_peak_mb = None
+    if _mode == 'tracemalloc':
+        traced_peak_mb = (tracemalloc.get_traced_memory()[1] - g.pop('memory_traced_start', 0)) / 1024 ** 2
+    route = request.url_rule.rule if request.url_rule is not None else request.path
+    route_memory.record(route, rss_mb() - rss_start, traced_peak_mb)
+    return response
+
+
+def init_memory_tracking(app):
+    """Track memory per request according to MEMORY_TRACKING ('off', 'rss' or 'tracemalloc')"""
+    global _mode
+    _mode = app.config.get('MEMORY_TRACKING', 'rss')
+    if _mode == 'off':
+        return
+    if _mode == 'tracemalloc' and not tracemalloc.is_tracing():
+        tracemalloc.start(app.config.get('MEMORY_TRACEMALLOC_FRAMES', 1))
+    app.before_request(_start_request)
+    app.after_request(_end_request)
+
+
+def memory_summary(limit: int = 10) -> dict:
+    """Current process memory, top routes, dataset footprints and (with tracemalloc) top allocation sites"""
+    summary = {
+        'mode': _mode,
+        'rss_mb': round(rss_mb(), 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'top_routes': route_memory.top(limit),
+        'datasets': dict(sorted(dataset_footprints.items(), key=lambda item: item[1]['mb'], reverse=True)),
+    }
+    if _mode == 'tracemalloc' and tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        summary['traced_mb'] = round(current / 1024 ** 2, 1)
+        summary['top_allocations'] = [
+            {'site': str(stat.traceback), 'mb': round(stat.size / 1024 ** 2, 2), 'blocks': stat.count}
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:limit]
+        ]
+    return summary
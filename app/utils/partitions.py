@@ -0,0 +1,152 @@
+"""
+Partitioned dataset layout for Cloud Run.
+Large datasets are also published as one file per partition (e.g.
+report/2026/10.csv for a month of report.csv, or one Parquet file per
+location) plus a small index of the partitions. Routes that need a slice of the data load only the
+partitions covering it - each through the dataset cache like any other
+file - so their latency doesn't grow with the history.
+"""
+from __future__ import annotations
+
+import logging
+from io import BytesIO
+import threading
+import time
+from typing import Callable, Optional
+from app.config import Config
+from app.utils.datasets import dataset_path, load_dataset
+from app.utils.lazy_import import lazy_import
+from app.utils.schemas import get_schema
+from app.utils.snapshots import is_snapshot_path
+from app.utils.tracing import span
+
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+INDEX_COLUMNS = ['key', 'file', 'rows']
+
+
+class PartitionedDataset:
+    """
+    A dataset published as one file per partition key under '<source name>/'.
+
+    CSV partitions are parsed with the source's schema. Parquet partitions
+    keep the exact column types of the source (no re-inference per
+    partition), for datasets whose rows are returned as they are.
+
+    Args:
+        source: Dataset filename (e.g. 'report.csv')
+        partition_key: Function giving every row's partition key (str() of it is the index key; NaN leaves the row out)
+        file_of: Partition file of a key without extension, relative to the partition directory (default: the key)
+        file_format: 'csv' or 'parquet'
+    """
+
+    def __init__(self, source: str, partition_key: Callable[[pd.DataFrame], pd.Series],
+                 file_of: Optional[Callable[[str], str]] = None, file_format: str = 'csv'):
+        if file_format not in ('csv', 'parquet'):
+            raise ValueError(f"Unsupported partition format: {file_format}")
+        self.source = source
+        self.directory = source.rsplit('.', 1)[0]
+        self.index_file = f'{self.directory}/_index.csv'
+        self.partition_key = partition_key
+        self.file_of = file_of or str
+        self.file_format = file_format
+        self._lock = threading.Lock()
+        self._unpublished = None  # (index path, when) of the last lookup that found no index
+
+    def build(self, df: pd.DataFrame) -> tuple:
+        """
+        Split a dataset into its partitions.
+
+        Returns:
+            ({partition file: DataFrame}, index DataFrame with key, file and rows)
+        """
+        keys = self.partition_key(df)
+        out = df
+        if self.file_format == 'csv':
+            # Dates are written in the schema's format, so partitions parse like the source
+            schema = get_schema(self.source)
+            formats = {col: fmt for col, fmt in (schema.dates.items() if schema else ())
+                       if col in df.columns and pd.api.types.is_datetime64_any_dtype(df[col])}
+            if formats:
+                out = df.assign(**{col: df[col].dt.strftime(fmt) for col, fmt in formats.items()})
+
+        partitions, index = {}, []
+        for key, rows in out.groupby(keys, sort=True, observed=True).groups.items():
+            filename = f'{self.directory}/{self.file_of(str(key))}.{self.file_format}'
+            partitions[filename] = out.loc[rows]
+            index.append((str(key), filename, len(rows)))
+        return partitions, pd.DataFrame(index, columns=INDEX_COLUMNS)
+
+    def publish(self, storage, df: pd.DataFrame) -> bool:
+        """
+        Write the partitions of a dataset, then its index (readers only see partitions listed in it).
+
+        Args:
+            storage: Backend to write to
+            df: The full dataset
+
+        Returns:
+            True if every partition and the index were written
+        """
+        if df.empty:
+            logger.warning(f"No {self.source} data, partitions not written")
+            return False
+        with span('partitions.publish', file=self.source, rows=len(df)) as current:
+            partitions, index = self.build(df)
+            current.set_attribute('partitions', len(partitions))
+            failed = [filename for filename, part in partitions.items() if not self._write(storage, part, filename)]
+            if failed:
+                logger.error(f"Failed to write {len(failed)} partitions of {self.source}: {failed[:5]}")
+                return False
+            if not storage.write_csv(index, self.index_file):
+                return False
+        self._unpublished = None
+        logger.info(f"Published {self.source} as {len(partitions)} partitions under {self.directory}/")
+        return True
+
+    def _write(self, storage, part: pd.DataFrame, filename: str) -> bool:
+        if self.file_format == 'csv':
+            return storage.write_csv(part, filename)
+        buffer = BytesIO()
+        part.to_parquet(buffer, index=False)
+        return storage.write_from_bytes(buffer.getvalue(), filename, content_type='application/vnd.apache.parquet')
+
+    def index(self) -> Optional[dict]:
+        """Partition file of every key, or None if the partitions haven't been published"""
+        path = dataset_path(self.index_file)
+        unpublished = self._unpublished
+        if unpublished is not None and unpublished[0] == path and (
+                is_snapshot_path(path) or time.time() - unpublished[1] < Config.DATASET_CACHE_TTL):
+            return None
+        index = load_dataset(self.index_file)
+        if index.empty or not set(INDEX_COLUMNS) <= set(index.columns):
+            # Don't ask storage for a missing index on every request (never again for a snapshot)
+            with self._lock:
+                self._unpublished = (path, time.time())
+            logger.info(f"{self.index_file} not found, reading {self.source} in full")
+            return None
+        return dict(zip(index['key'].astype(str), index['file']))
+
+    def load(self, keys: list) -> Optional[pd.DataFrame]:
+        """
+        Rows of the given partitions.
+
+        Args:
+            keys: Partition keys (keys without a partition are skipped)
+
+        Returns:
+            The partitions concatenated (no rows, but the dataset's columns, if
+            none exist), or None if not published
+        """
+        index = self.index()
+        if index is None:
+            return None
+        files = [index[key] for key in keys if key in index]
+        with span('partitions.load', file=self.source, partitions=len(files)):
+            frames = [df for df in (load_dataset(filename) for filename in files) if not df.empty]
+            if not frames:
+                # Same columns and types as a matching partition would have
+                return load_dataset(next(iter(index.values()))).iloc[:0].copy(deep=False)
+            return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
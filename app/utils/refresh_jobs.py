@@ -0,0 +1,314 @@
+"""
+Background data refresh jobs for Cloud Run.
+/refresh_cache starts the S3 -> GCS copy in a background thread and
+returns a job id straight away. Job state (per-file progress, bytes,
+errors, result) is kept in Redis so any instance can answer
+/refresh_status/<id>, and a Redis lock lets only one refresh run at a time
+across instances. Without Redis, jobs and the lock are per process.
+Short data maintenance tasks (e.g. compacting the exclusion changes) take
+named locks the same way with task_lock().
+
+Cloud Run throttles CPU between requests unless CPU is always allocated,
+so a refresh started from an otherwise idle instance runs slowly until the
+status polls (or other traffic) arrive.
+"""
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Optional
+from app.config import Config
+from app.utils.lazy_import import lazy_import
+
+redis = lazy_import('redis')
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = 'refresh_job'
+# Seconds to wait before retrying Redis after an error
+REDIS_RETRY_INTERVAL = 60
+# Jobs kept per process (the source watcher starts them on its own), besides expiring after job_ttl
+MAX_LOCAL_JOBS = 50
+
+# Deletes the lock only if it still belongs to the job
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RefreshJob:
+    """
+    Progress of one refresh. Every update is saved to the job store.
+
+    Args:
+        job_id: Job id
+        jobs: Store the job is saved to
+    """
+
+    def __init__(self, job_id: str, jobs: 'RefreshJobs'):
+        self.id = job_id
+        self._jobs = jobs
+        self.state = {
+            'id': job_id,
+            'status': 'running',  # running | success | partial | error
+            'message': 'Refresh started',
+            'started_at': time.time(),
+            'updated_at': time.time(),
+            'finished_at': None,
+            'files_total': 0,
+            'files_done': 0,
+            'bytes_copied': 0,
+            'files': {},
+            'failed_files': [],
+            'result': None,
+        }
+
+    def _save(self):
+        self.state['updated_at'] = time.time()
+        self._jobs.save(self)
+
+    def set_files(self, filenames: list):
+        """Declare the files to copy"""
+        self.state['files_total'] = len(filenames)
+        self.state['files'] = {filename: {'status': 'pending'} for filename in filenames}
+        self._save()
+
+    def file_started(self, filename: str):
+        self.state['files'].setdefault(filename, {})['status'] = 'copying'
+        self.state['message'] = f'Copying {filename}'
+        self._save()
+
+    def file_done(self, filename: str, rows: int = 0, size_bytes: int = 0, status: str = 'done'):
+        """Record a copied (or skipped) file"""
+        self.state['files'][filename] = {'status': status, 'rows': rows, 'size_bytes': size_bytes}
+        self.state['files_done'] += 1
+        self.state['bytes_copied'] += size_bytes
+        self._save()
+
+    def file_failed(self, filename: str, error: str):
+        self.state['files'][filename] = {'status': 'failed', 'error': error}
+        self.state['files_done'] += 1
+        self.state['failed_files'].append(filename)
+        self._save()
+
+    def finish(self, result: dict):
+        """Record the outcome ({'status', 'message', ...} as /refresh_cache used to return)"""
+        self.state.update(
+            status=result.get('status', 'success'), message=result.get('message', ''),
+            result=result, finished_at=time.time(),
+        )
+        self._save()
+
+    def fail(self, error: str):
+        self.state.update(status='error', message=error, finished_at=time.time())
+        self._save()
+
+
+class RefreshJobs:
+    """
+    Job store and single-refresh lock, in Redis if enabled (REFRESH_JOBS_REDIS).
+
+    Args:
+        job_ttl: Seconds a finished job stays queryable
+        lock_ttl: Seconds the refresh lock is held without progress (a crashed instance releases it this way)
+    """
+
+    def __init__(self, job_ttl: int = 86400, lock_ttl: int = 600):
+        self.job_ttl = job_ttl
+        self.lock_ttl = lock_ttl
+        self._lock = threading.Lock()
+        self._local_jobs = {}  # id -> (saved at, state), for this process (and as a fallback without Redis), oldest first
+        self._local_running = None
+        self._redis = None
+        self._redis_failed_at = 0.0
+
+    def _client(self):
+        if not Config.REFRESH_JOBS_REDIS or time.time() - self._redis_failed_at < REDIS_RETRY_INTERVAL:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=Config.REDIS_HOST, port=Config.REDIS_PORT, password=Config.REDIS_PASSWORD or None,
+                socket_timeout=2, socket_connect_timeout=2
+            )
+        return self._redis
+
+    def _redis_error(self, action: str, e: Exception):
+        logger.warning(f"Could not {action} in Redis, using this process only: {e}")
+        self._redis_failed_at = time.time()
+
+    def _acquire(self, job_id: str) -> Optional[str]:
+        """Take the refresh lock for job_id; the id of the running job if another one holds it"""
+        with self._lock:
+            if self._local_running is not None:
+                return self._local_running
+            client = self._client()
+            if client is not None:
+                try:
+                    if not client.set(f'{REDIS_PREFIX}:lock', job_id, nx=True, ex=self.lock_ttl):
+                        running = client.get(f'{REDIS_PREFIX}:lock')
+                        if running is not None:
+                            return running.decode()
+                        # Released in between - take it
+                        client.set(f'{REDIS_PREFIX}:lock', job_id, ex=self.lock_ttl)
+                except Exception as e:
+                    self._redis_error('take the refresh lock', e)
+            self._local_running = job_id
+            return None
+
+    def _release(self, job_id: str):
+        with self._lock:
+            if self._local_running == job_id:
+                self._local_running = None
+        client = self._client()
+        if client is not None:
+            try:
+                client.eval(_RELEASE_SCRIPT, 1, f'{REDIS_PREFIX}:lock', job_id)
+            except Exception as e:
+                self._redis_error('release the refresh lock', e)
+
+    @contextmanager
+    def task_lock(self, name: str, ttl: int = 60, wait: float = 0):
+        """
+        Hold a named lock for a short task, across instances, waiting up to
+        `wait` seconds for it. Without Redis it only covers this instance (a
+        lock file shared by its workers).
+
+        Usage:
+            with refresh_jobs.task_lock('exclusions') as acquired:
+                if acquired:
+                    compact()
+        """
+        token = uuid.uuid4().hex
+        key = f'{REDIS_PREFIX}:task:{name}'
+        client = self._client()
+        lock_file = None
+        deadline = time.time() + wait
+        while True:
+            if client is not None:
+                try:
+                    acquired = bool(client.set(key, token, nx=True, ex=ttl))
+                except Exception as e:
+                    self._redis_error(f'take the {name} lock', e)
+                    client = None
+            if client is None:
+                if lock_file is None:
+                    os.makedirs(Config.SHARED_DATASET_DIR, exist_ok=True)
+                    lock_file = open(os.path.join(Config.SHARED_DATASET_DIR, f'{name}.task.lock'), 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    acquired = True
+                except OSError:
+                    acquired = False
+            if acquired or time.time() >= deadline:
+                break
+            time.sleep(0.1)
+        try:
+            yield acquired
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+            elif acquired:
+                try:
+                    client.eval(_RELEASE_SCRIPT, 1, key, token)
+                except Exception as e:
+                    self._redis_error(f'release the {name} lock', e)
+
+    def save(self, job: RefreshJob):
+        """Store the job state (and keep holding the lock while it makes progress)"""
+        payload = json.dumps(job.state, default=str)
+        with self._lock:
+            self._local_jobs[job.id] = (time.time(), payload)
+            self._expire_local_jobs()
+        client = self._client()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.set(f'{REDIS_PREFIX}:{job.id}', payload, ex=self.job_ttl)
+            pipe.set(f'{REDIS_PREFIX}:latest', job.id, ex=self.job_ttl)
+            if job.state['finished_at'] is None:
+                pipe.expire(f'{REDIS_PREFIX}:lock', self.lock_ttl)
+            pipe.execute()
+        except Exception as e:
+            self._redis_error('save the refresh job', e)
+
+    def _expire_local_jobs(self):
+        """Drop this process's jobs not saved for job_ttl seconds, like their Redis keys, and all but the newest MAX_LOCAL_JOBS"""
+        now = time.time()
+        for old_id in list(self._local_jobs):
+            saved_at = self._local_jobs[old_id][0]
+            if now - saved_at < self.job_ttl and len(self._local_jobs) <= MAX_LOCAL_JOBS:
+                break
+            if old_id != self._local_running:
+                del self._local_jobs[old_id]
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """State of a job started on any instance ('latest' for the most recent one), or None"""
+        client = self._client()
+        if client is not None:
+            try:
+                if job_id == 'latest':
+                    latest = client.get(f'{REDIS_PREFIX}:latest')
+                    job_id = latest.decode() if latest else job_id
+                payload = client.get(f'{REDIS_PREFIX}:{job_id}')
+                if payload is not None:
+                    return json.loads(payload)
+            except Exception as e:
+                self._redis_error('read the refresh job', e)
+        with self._lock:
+            self._expire_local_jobs()
+            if job_id == 'latest' and self._local_jobs:
+                job_id = next(reversed(self._local_jobs))
+            _, payload = self._local_jobs.get(job_id, (None, None))
+        return json.loads(payload) if payload is not None else None
+
+    def start(self, work: Callable[[RefreshJob], dict]) -> tuple:
+        """
+        Run `work(job)` in a background thread unless a refresh is already running.
+
+        Args:
+            work: Does the refresh, reporting progress on the job; returns the result dict
+
+        Returns:
+            (job state, True) if started, (state of the running job, False) otherwise
+        """
+        job_id = uuid.uuid4().hex[:16]
+        running = self._acquire(job_id)
+        if running is not None:
+            logger.info(f"Refresh {running} is already running")
+            return self.get(running) or {'id': running, 'status': 'running'}, False
+
+        job = RefreshJob(job_id, self)
+        self.save(job)
+        threading.Thread(target=self._run, args=(job, work), name=f'refresh-{job_id}', daemon=True).start()
+        logger.info(f"Started refresh {job_id}")
+        return dict(job.state), True
+
+    def _run(self, job: RefreshJob, work: Callable[[RefreshJob], dict]):
+        started = time.perf_counter()
+        try:
+            job.finish(work(job))
+            logger.info(f"Refresh {job.id} finished in {time.perf_counter() - started:.1f}s: {job.state['message']}")
+        except Exception as e:
+            logger.error(f"Refresh {job.id} failed: {e}", exc_info=True)
+            job.fail(f'Error refreshing data: {e}')
+        finally:
+            self._release(job.id)
+
+    def after_fork(self):
+        """Forget the master's client and lock (a running refresh thread is not inherited)"""
+        self._lock = threading.Lock()
+        self._local_running = None
+        self._redis = None
+
+
+refresh_jobs = RefreshJobs(job_ttl=Config.REFRESH_JOB_TTL, lock_ttl=Config.REFRESH_LOCK_TTL)
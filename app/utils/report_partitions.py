@@ -0,0 +1,154 @@
+"""
+Month-partitioned report.csv for Cloud Run.
+Refresh publishes report.csv as one partition per month (report/YYYY/MM.csv)
+plus report/_groups.csv, the per (customer, location, report name) totals
+over all of history that the monthly view needs for its rows, filters and
+delivery counts. The monthly view then reads the totals and only the
+months around the selected one, instead of the whole delivery history.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Optional
+from app.utils.datasets import load_dataset, load_derived
+from app.utils.lazy_import import lazy_import
+from app.utils.partitions import PartitionedDataset
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+REPORT_FILE = 'report.csv'
+REPORT_GROUPS = 'report/_groups.csv'
+GROUP_COLUMNS = ['customer', 'location', 'report name']
+GROUP_COUNTS = ['rows', 'delivered', 'clean_rows', 'clean_delivered']
+
+
+def _month_key(df: pd.DataFrame) -> pd.Series:
+    """Month of every row as a period ('YYYY-MM' as a string; NaT for rows without a date)"""
+    return df['date'].dt.to_period('M')
+
+
+# report/YYYY/MM.csv
+report_partitions = PartitionedDataset(REPORT_FILE, _month_key, file_of=lambda key: key.replace('-', '/'))
+
+
+def missing_rows(df: pd.DataFrame) -> pd.Series:
+    """Rows with 'Missing' in any text value (the monthly view's exclude_missing filter)"""
+    found = pd.Series(False, index=df.index)
+    for col in df.columns:
+        values = df[col]
+        if values.dtype != object and not isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        try:
+            found |= values.astype(object).str.contains('Missing', regex=False, na=False).astype(bool)
+        except AttributeError:
+            # No text in this column
+            continue
+    return found
+
+
+def report_groups(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Row and delivery counts of every (customer, location, report name) in report.csv.
+
+    Returns:
+        DataFrame with GROUP_COLUMNS and GROUP_COUNTS; the clean_ counts leave
+        out rows matched by missing_rows()
+    """
+    if df.empty or not set(GROUP_COLUMNS) <= set(df.columns):
+        if not df.empty:
+            logger.error(f"Missing required columns in {REPORT_FILE}. Available: {df.columns.tolist()}")
+        return pd.DataFrame(columns=GROUP_COLUMNS + GROUP_COUNTS)
+    if {'date', 'attachment'} <= set(df.columns):
+        delivered = (df['attachment'] == 'Yes').to_numpy()
+    else:
+        delivered = np.zeros(len(df), dtype=bool)
+    clean = ~missing_rows(df).to_numpy()
+    counts = pd.DataFrame({
+        'rows': 1, 'delivered': delivered, 'clean_rows': clean, 'clean_delivered': delivered & clean,
+    }, index=df.index).astype('int64')
+    keys = [df[col] for col in GROUP_COLUMNS]
+    return counts.groupby(keys, observed=True, sort=False, dropna=False).sum().reset_index()
+
+
+def publish_report_partitions(storage, df: Optional[pd.DataFrame] = None) -> bool:
+    """
+    Write report.csv's month partitions and group totals to a storage backend.
+
+    Args:
+        storage: Backend to read report.csv from (unless given) and write to
+        df: Already loaded report.csv, e.g. from a refresh copy
+
+    Returns:
+        True if written
+    """
+    try:
+        if df is None:
+            df = storage.read_csv(REPORT_FILE)
+        if df.empty or 'date' not in df.columns or not pd.api.types.is_datetime64_any_dtype(df['date']):
+            # The monthly view falls back to reading report.csv in full
+            logger.warning(f"{REPORT_FILE} has no typed 'date' column, partitions not written")
+            return False
+        groups = report_groups(df)
+        if groups.empty:
+            return False
+        # Totals first: readers only use them together with the partition index, written last
+        if not storage.write_csv(groups, REPORT_GROUPS):
+            return False
+        return report_partitions.publish(storage, df)
+    except Exception as e:
+        logger.error(f"Error publishing {REPORT_FILE} partitions: {e}", exc_info=True)
+        return False
+
+
+def window_months(year: int, month: int) -> list:
+    """
+    Partition keys the monthly view of year/month needs: the month's
+    quarter (quarterly reports) and the months before and after it (weeks
+    crossing the month boundary).
+    """
+    quarter_start = (month - 1) // 3 * 3 + 1
+    months = {(year, m) for m in range(quarter_start, quarter_start + 3)}
+    months.add((year - 1, 12) if month == 1 else (year, month - 1))
+    months.add((year + 1, 1) if month == 12 else (year, month + 1))
+    return [f'{y:04}-{m:02}' for y, m in sorted(months)]
+
+
+def load_report_month(year: int, month: int) -> tuple:
+    """
+    Data for the monthly view of year/month.
+
+    Returns:
+        (report_groups() of all of report.csv, report.csv rows of window_months());
+        without published partitions, the rows are all of report.csv
+    """
+    rows = report_partitions.load(window_months(year, month))
+    if rows is not None:
+        groups = load_dataset(REPORT_GROUPS)
+        if not groups.empty:
+            return groups, rows
+    return load_derived(REPORT_FILE, 'groups', report_groups), load_dataset(REPORT_FILE)
+
+
+def report_mask(df: pd.DataFrame, customer: Optional[str] = None, location: Optional[str] = None,
+                report: Optional[str] = None) -> pd.Series:
+    """Rows of the given customer, location and report name (None matches all)"""
+    mask = pd.Series(True, index=df.index)
+    for col, value in zip(GROUP_COLUMNS, (customer, location, report)):
+        if value is not None:
+            mask &= df[col] == value
+    return mask
+
+
+def delivered_dates(rows: pd.DataFrame) -> dict:
+    """{(report name, location): set of dates delivered with an attachment}"""
+    if rows.empty or not {'report name', 'location', 'date', 'attachment'} <= set(rows.columns):
+        return {}
+    delivered = rows[rows['attachment'] == 'Yes']
+    dates = {}
+    for key_report, key_location, date in zip(delivered['report name'].tolist(), delivered['location'].tolist(),
+                                              delivered['date'].dt.date.tolist()):
+        dates.setdefault((key_report, key_location), set()).add(date)
+    return dates
@@ -2,12 +2,20 @@
 S3 client utilities for Cloud Run.
 Implements caching and lazy loading for optimal cold start performance.
 """
+from __future__ import annotations
+
 import logging
 from typing import Optional
-import pandas as pd
-import boto3
-from botocore.exceptions import ClientError
 from io import StringIO
+from app.utils.io_metrics import record_io
+from app.utils.lazy_import import lazy_import
+from app.utils.storage_backends import parse_csv
+from app.utils.tracing import span
+
+pd = lazy_import('pandas')
+boto3 = lazy_import('boto3')
+# Only needed (and imported) when an S3 call has failed
+botocore_exceptions = lazy_import('botocore.exceptions')
 
 logger = logging.getLogger(__name__)
 
@@ -46,31 +54,16 @@ class S3Manager:
             filename: Name of the CSV file in S3
 
         Returns:
-            DataFrame with CSV contents
+            DataFrame with CSV contents (empty if missing or unreadable)
         """
         try:
-            logger.info(f"[S3] Reading {filename} from bucket {self.bucket_name}")
-            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=filename)
-            content = response['Body'].read().decode('utf-8')
-
-            if not content.strip():
-                logger.warning(f"{filename} is empty")
+            content = self.read_bytes(filename)
+            if content is None:
                 return pd.DataFrame()
+            return parse_csv(content, filename)
 
-            df = pd.read_csv(StringIO(content), quotechar='"')
-            logger.info(f"Successfully read {len(df)} rows and {len(df.columns)} columns from {filename}")
-            if len(df) > 0:
-                logger.debug(f"Columns in {filename}: {df.columns.tolist()[:10]}")  # Log first 10 columns
-            return df
-
-        except ClientError as e:
-            error_code = e.response['Error']['Code']
-            if error_code == 'NoSuchKey':
-                logger.error(f"{filename} does not exist in bucket {self.bucket_name}. Available files: {self.list_files()[:10]}")
-            elif error_code == 'AllAccessDisabled':
-                logger.error(f"Access to bucket {self.bucket_name} is disabled")
-            else:
-                logger.error(f"Unexpected S3 error: {e}")
+        except botocore_exceptions.ClientError:
+            # Logged by read_bytes
             return pd.DataFrame()
 
         except pd.errors.EmptyDataError:
@@ -81,6 +74,38 @@ class S3Manager:
             logger.error(f"Error reading {filename} from S3: {e}", exc_info=True)
             return pd.DataFrame()
 
+    def read_bytes(self, filename: str) -> Optional[bytes]:
+        """
+        Raw file contents from S3.
+
+        Args:
+            filename: Name of the file in S3
+
+        Returns:
+            File contents, or None if the file doesn't exist (other errors are raised)
+        """
+        logger.info(f"[S3] Reading {filename} from bucket {self.bucket_name}")
+        with span('storage.download', **{'storage.backend': 's3', 'storage.bucket': self.bucket_name, 'file': filename}) as current:
+            content = b''
+            try:
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=filename)
+                content = response['Body'].read()
+            except botocore_exceptions.ClientError as e:
+                error_code = e.response['Error']['Code']
+                if error_code in ('NoSuchKey', '404'):
+                    logger.warning(f"{filename} does not exist in bucket {self.bucket_name}")
+                    return None
+                if error_code == 'AllAccessDisabled':
+                    logger.error(f"Access to bucket {self.bucket_name} is disabled")
+                else:
+                    logger.error(f"S3 error reading {filename}: {e}")
+                raise
+            finally:
+                # Failed GETs are billed too
+                record_io('s3', 'read', filename, downloaded=len(content))
+            current.set_attribute('bytes', len(content))
+        return content
+
     def write_csv(self, df: pd.DataFrame, filename: str) -> bool:
         """
         Write DataFrame to S3 as CSV.
@@ -95,17 +120,19 @@ class S3Manager:
         try:
             csv_buffer = StringIO()
             df.to_csv(csv_buffer, index=False)
+            body = csv_buffer.getvalue().encode('utf-8')
 
+            record_io('s3', 'write', filename, uploaded=len(body))
             self.s3_client.put_object(
                 Bucket=self.bucket_name,
                 Key=filename,
-                Body=csv_buffer.getvalue()
+                Body=body
             )
 
             logger.info(f"Successfully uploaded {filename} to S3 bucket {self.bucket_name}")
             return True
 
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error uploading {filename} to S3: {e}")
             return False
 
@@ -113,12 +140,34 @@ class S3Manager:
             logger.error(f"Unexpected error uploading {filename}: {e}")
             return False
 
+    def write_from_bytes(self, content: bytes, filename: str, content_type: str = 'text/csv') -> bool:
+        """
+        Write raw bytes to S3.
+
+        Args:
+            content: Bytes to write
+            filename: Target filename in S3
+            content_type: MIME type
+
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            record_io('s3', 'write', filename, uploaded=len(content))
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=filename, Body=content, ContentType=content_type)
+            logger.info(f"Successfully uploaded {filename} to S3 bucket {self.bucket_name}")
+            return True
+        except Exception as e:
+            logger.error(f"Error uploading {filename} to S3: {e}")
+            return False
+
     def file_exists(self, filename: str) -> bool:
         """Check if a file exists in S3"""
         try:
+            record_io('s3', 'exists', filename)
             self.s3_client.head_object(Bucket=self.bucket_name, Key=filename)
             return True
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             if e.response['Error']['Code'] == '404':
                 return False
             logger.error(f"Error checking if {filename} exists: {e}")
@@ -127,6 +176,7 @@ class S3Manager:
     def list_files(self, prefix: str = '') -> list:
         """List files in S3 bucket with optional prefix"""
         try:
+            record_io('s3', 'list', f'{prefix}*')
             response = self.s3_client.list_objects_v2(
                 Bucket=self.bucket_name,
                 Prefix=prefix
@@ -137,6 +187,50 @@ class S3Manager:
 
             return [obj['Key'] for obj in response['Contents']]
 
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error listing files in S3: {e}")
             return []
+
+    def list_generations(self, prefix: str = '') -> dict:
+        """{name: ETag} of the files under prefix, from one listing (no per-file HEAD requests)"""
+        try:
+            generations = {}
+            pages = self.s3_client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket_name, Prefix=prefix)
+            for page in pages:
+                record_io('s3', 'list', f'{prefix}*')
+                for obj in page.get('Contents', []):
+                    generations[obj['Key']] = obj['ETag'].strip('"')
+            return generations
+        except botocore_exceptions.ClientError as e:
+            logger.error(f"Error listing file generations in S3: {e}")
+            return {}
+
+    def get_file_size(self, filename: str) -> int:
+        """Get file size in bytes"""
+        try:
+            record_io('s3', 'size', filename)
+            response = self.s3_client.head_object(Bucket=self.bucket_name, Key=filename)
+            return response['ContentLength']
+        except botocore_exceptions.ClientError as e:
+            if e.response['Error']['Code'] != '404':
+                logger.error(f"Error getting file size for {filename}: {e}")
+            return 0
+
+    def delete_files(self, filenames: list) -> int:
+        """Delete files from S3 (up to 1000 per request); the number deleted"""
+        deleted = 0
+        for start in range(0, len(filenames), 1000):
+            batch = filenames[start:start + 1000]
+            try:
+                record_io('s3', 'delete', f'{batch[0]}..', requests=1)
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={'Objects': [{'Key': name} for name in batch], 'Quiet': True}
+                )
+                errors = response.get('Errors', [])
+                for error in errors[:5]:
+                    logger.error(f"Error deleting {error.get('Key')} from S3: {error.get('Message')}")
+                deleted += len(batch) - len(errors)
+            except botocore_exceptions.ClientError as e:
+                logger.error(f"Error deleting files from S3: {e}")
+        return deleted
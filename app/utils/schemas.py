@@ -0,0 +1,195 @@
+"""
+Dataset schemas for Cloud Run.
+Declares the canonical column names and types of every CSV file -
+categories for repetitive dimension columns, nullable integers for
+counters and dates with explicit formats. Applied once when a file is
+parsed (and cached with it), so routes use canonical columns directly
+instead of probing for 'location'/'Location'/'LOCATION' on every request.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Optional
+from app.utils.lazy_import import lazy_import
+from app.utils.snapshots import dataset_name
+
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+# Columns with more distinct values than this share of rows stay strings -
+# a category would be larger than the strings it replaces
+MAX_CATEGORY_RATIO = 0.5
+
+
+def column_key(name) -> str:
+    """Spelling-insensitive column key: 'Report_Name', 'REPORT NAME' and 'report name' match"""
+    return ' '.join(str(name).replace('_', ' ').lower().split())
+
+
+class DatasetSchema:
+    """
+    Canonical columns and column types of one dataset.
+
+    Source columns are renamed to the canonical spelling of any declared
+    column they match ignoring case, underscores and spacing.
+
+    Args:
+        categories: Dimension columns stored as pandas categoricals
+        integers: Counter columns stored as nullable Int64
+        dates: Column -> strptime format; values in another format are parsed by inference
+        columns: Other columns the routes use, renamed but not converted
+        aliases: Canonical column -> other source names for it (used if the canonical one is missing)
+    """
+
+    def __init__(self, categories: tuple = (), integers: tuple = (), dates: Optional[dict] = None,
+                 columns: tuple = (), aliases: Optional[dict] = None):
+        self.categories = tuple(categories)
+        self.integers = tuple(integers)
+        self.dates = dict(dates or {})
+        self.columns = tuple(columns)
+        self.aliases = dict(aliases or {})
+
+    @property
+    def canonical(self) -> tuple:
+        return self.categories + self.integers + tuple(self.dates) + self.columns
+
+    def normalize(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Rename source columns to their canonical names (in place) and return df"""
+        present = set(df.columns)
+        keys = {}
+        for col in df.columns:
+            keys.setdefault(column_key(col), col)
+        renames = {}
+        for name in self.canonical:
+            if name in present:
+                continue
+            candidates = [name] + list(self.aliases.get(name, ()))
+            source = next((keys[column_key(c)] for c in candidates if column_key(c) in keys), None)
+            # A source column already claimed by another canonical name keeps that one
+            if source is not None and source not in renames and source not in self.canonical:
+                renames[source] = name
+        if renames:
+            logger.debug(f"Renaming columns to canonical names: {renames}")
+            df.rename(columns=renames, inplace=True)
+        return df
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Normalize column names, convert the declared columns (in place) and return df"""
+        self.normalize(df)
+
+        for col in self.categories:
+            if col not in df.columns:
+                continue
+            values = df[col]
+            if values.dtype == object and values.nunique() <= MAX_CATEGORY_RATIO * len(values):
+                df[col] = values.astype('category')
+
+        for col in self.integers:
+            if col not in df.columns:
+                continue
+            values = pd.to_numeric(df[col], errors='coerce')
+            if (values.dropna() % 1 == 0).all():
+                df[col] = values.astype('Int64')
+            else:
+                logger.warning(f"Column {col} has non-integer values, keeping it as float")
+                df[col] = values
+
+        for col, fmt in self.dates.items():
+            if col not in df.columns or pd.api.types.is_datetime64_any_dtype(df[col]):
+                continue
+            raw = df[col]
+            parsed = pd.to_datetime(raw, format=fmt, errors='coerce')
+            failed = parsed.isna() & raw.notna()
+            if failed.any():
+                logger.debug(f"{failed.sum()} values of {col} don't match {fmt}, inferring their format")
+                parsed[failed] = pd.to_datetime(raw[failed], format='mixed', errors='coerce')
+            df[col] = parsed
+        return df
+
+
+# Most report files share these dimensions
+SITE = ('Customer', 'Location')
+
+SCHEMAS = {
+    'report.csv': DatasetSchema(
+        categories=('customer', 'location', 'report name', 'attachment'),
+        dates={'date': '%Y-%m-%d %H:%M:%S'},
+    ),
+    # Per (customer, location, report name) totals over all of report.csv (app.utils.report_partitions)
+    'report/_groups.csv': DatasetSchema(
+        categories=('customer', 'location', 'report name'),
+        integers=('rows', 'delivered', 'clean_rows', 'clean_delivered'),
+    ),
+    'frequencies.csv': DatasetSchema(columns=('reportName', 'location', 'frequency', 'specificDays')),
+    'customer_locations.csv': DatasetSchema(categories=('location', 'Customer')),
+    'vrops_alerts_historical.csv': DatasetSchema(
+        categories=('location', 'customer'),
+        integers=('critical', 'immediate', 'warning', 'total'),
+        dates={'date': '%Y-%m-%d'},
+    ),
+    'vrops_list_of_alerts.csv': DatasetSchema(categories=SITE + ('Name', 'Criticality Level', 'Status')),
+    'combined_vrops_list_of_alerts.csv': DatasetSchema(categories=SITE + ('Name', 'Criticality Level', 'Status')),
+    'combined_non_vcf_inventory.csv': DatasetSchema(
+        categories=SITE + ('Name', 'Service', 'Description', 'Installed Version', 'DHCVer', 'devEnv', 'reportType'),
+        dates={'Report Date': '%Y-%m-%d'},
+        columns=('VM',),
+        aliases={'Report Date': ('Date',)},
+    ),
+    'combined_vcf_inventory.csv': DatasetSchema(
+        categories=SITE + ('Name', 'Service', 'Description', 'Installed Version', 'DHCVer', 'devEnv', 'reportType'),
+        dates={'Report Date': '%Y-%m-%d'},
+        columns=('VM',),
+        aliases={'Report Date': ('Date',)},
+    ),
+    'env_inventory.csv': DatasetSchema(
+        categories=SITE + ('Name', 'Service', 'Description', 'Installed Version', 'DHCVer', 'devEnv', 'reportType'),
+        columns=('VM', 'Report Date'),
+    ),
+    'excluded_networks.csv': DatasetSchema(categories=('Location',), columns=('Network',)),
+    'excluded_networks_changes.csv': DatasetSchema(columns=('Network', 'Location', 'Action', 'Changed At')),
+    'combined_snapshot_reports.csv': DatasetSchema(categories=SITE + ('Parent Cluster', 'Parent vCenter')),
+    'combined_vhealth_reports.csv': DatasetSchema(categories=SITE + ('Type', 'Message')),
+    'combined_firmware_reports.csv': DatasetSchema(categories=(
+        'Location', 'Cluster', 'Hardware-Model', 'NIC', 'Network-Driver', 'Adapter-Firmware',
+        'HBA-Module', 'HBA-Version', 'FC-Driver', 'Description',
+    )),
+    'rvtools_vinfo.csv': DatasetSchema(
+        categories=SITE + ('Powerstate', 'Cluster', 'RVTools Type', 'backupPolicy'),
+        columns=('VM', 'VI SDK Server type'),
+    ),
+    'combined_vdisk_reports.csv': DatasetSchema(categories=SITE + ('Disk', 'Folder', 'Cluster', 'RVTools Type')),
+    'combined_vhosts_reports.csv': DatasetSchema(
+        categories=SITE + (
+            'Cluster', 'CPU Model', 'Model', 'Vendor', 'Domain', 'Current EVC', 'in Maintenance Mode', 'RVTools Type',
+        ),
+        columns=('Host', 'ESX Version'),
+    ),
+    'combined_network_utilization_report.csv': DatasetSchema(categories=SITE + ('Network view',), columns=('Network',)),
+    'combined_certificate_expiry_reports.csv': DatasetSchema(categories=SITE),
+    'combined_password_expiration_reports.csv': DatasetSchema(
+        categories=SITE + ('Username', 'Rotation needed', 'Customer agreed rotation'),
+    ),
+    'combined_antivirus_asset_reports.csv': DatasetSchema(categories=SITE + (
+        'IsOnline', 'ProductVersion', 'EngineVersion', 'Pattern', 'LastReleasedPattern',
+    )),
+}
+
+
+def get_schema(filename: str) -> Optional[DatasetSchema]:
+    """Schema registered for a dataset file (partitions under 'report/' use report.csv's), or None"""
+    filename = dataset_name(filename)
+    schema = SCHEMAS.get(filename)
+    directory, _, name = filename.rpartition('/')
+    if schema is None and directory and not name.startswith('_'):
+        # Partition files (app.utils.partitions); '_' files are indexes and summaries
+        schema = SCHEMAS.get(directory.split('/', 1)[0] + '.csv')
+    return schema
+
+
+def apply_schema(df: pd.DataFrame, filename: str) -> pd.DataFrame:
+    """Type a freshly parsed dataset according to its schema (unchanged if none is registered)"""
+    schema = get_schema(filename)
+    if schema is None or df.empty:
+        return df
+    return schema.apply(df)
@@ -0,0 +1,89 @@
+"""
+Server-Timing header for Cloud Run responses.
+Each request gets a lightweight timer that the tracing spans report into;
+the time spent per stage (storage, parse, transform, cache, render, ...) is
+returned as a `Server-Timing` header, visible in the browser devtools
+without any tracing backend.
+"""
+import time
+from typing import Optional
+from flask import g, has_request_context
+
+# Span name prefix -> Server-Timing metric
+STAGES = {
+    'storage': 'storage',
+    'csv': 'parse',
+    'transform': 'transform',
+    'dataframe': 'transform',
+    'dataset': 'cache',
+    'shared_dataset': 'cache',
+    'cache': 'cache',
+    'render_template': 'render',
+    'scrape': 'scrape',
+    'db': 'db',
+}
+
+# Order of the metrics in the header
+METRIC_ORDER = ('cache', 'storage', 'parse', 'transform', 'scrape', 'db', 'render')
+
+
+class RequestTimer:
+    """
+    Per-request accumulator of stage durations.
+
+    Stages are measured as self time: a span's nested spans are subtracted
+    from it, so e.g. a dataset load that downloads and parses a file counts
+    only the cache overhead under 'cache'.
+    """
+
+    __slots__ = ('started', 'totals', '_stack')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.totals = {}
+        self._stack = []  # [started, children duration] per open span
+
+    def start(self):
+        self._stack.append([time.perf_counter(), 0.0])
+
+    def stop(self, name: str):
+        started, children = self._stack.pop()
+        duration = time.perf_counter() - started
+        if self._stack:
+            self._stack[-1][1] += duration
+        metric = STAGES.get(name.split('.', 1)[0])
+        if metric is not None:
+            self.totals[metric] = self.totals.get(metric, 0.0) + duration - children
+
+    def header(self) -> str:
+        """Server-Timing header value (durations in milliseconds)"""
+        metrics = [f"{metric};dur={self.totals[metric] * 1000:.1f}" for metric in METRIC_ORDER if metric in self.totals]
+        metrics.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ', '.join(metrics)
+
+
+def start_request_timer():
+    """Start timing the current request"""
+    g.request_timer = RequestTimer()
+
+
+def current_timer() -> Optional[RequestTimer]:
+    """Timer of the current request, or None outside a timed request"""
+    if not has_request_context():
+        return None
+    return g.get('request_timer')
+
+
+def init_server_timing(app):
+    """Add the Server-Timing header to every response if SERVER_TIMING is enabled"""
+    if not app.config.get('SERVER_TIMING', False):
+        return
+
+    app.before_request(start_request_timer)
+
+    @app.after_request
+    def add_server_timing(response):
+        timer = current_timer()
+        if timer is not None:
+            response.headers['Server-Timing'] = timer.header()
+        return response
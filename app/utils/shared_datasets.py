@@ -0,0 +1,168 @@
+"""
+Instance-wide dataset store shared by all gunicorn workers.
+The first worker to need a dataset downloads and parses it, then writes it
+as an Arrow IPC file to a local directory; the other workers read that file
+instead of downloading and parsing the CSV again. A cross-process file lock
+ensures one download and parse per instance.
+
+This saves storage requests and CPU, not memory: every worker still
+converts the file into its own DataFrame, and on Cloud Run the directory is
+in-memory (tmpfs), so the file counts against the instance's memory too.
+To share the parsed frames themselves, preload the app in the gunicorn
+master (GUNICORN_PRELOAD with WARMUP_MODE=blocking) instead.
+"""
+from __future__ import annotations
+
+import fcntl
+import logging
+import os
+import time
+from typing import Callable, Optional
+from app.utils.io_metrics import record_cache
+from app.utils.lazy_import import lazy_import, module_available
+from app.utils.snapshots import SNAPSHOT_DIR, is_snapshot_path
+from app.utils.tracing import span
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+pa = lazy_import('pyarrow')
+
+logger = logging.getLogger(__name__)
+
+PYARROW_AVAILABLE = module_available('pyarrow')
+
+
+class SharedDatasetStore:
+    """
+    Arrow IPC files in a directory shared by the workers of one instance.
+
+    Args:
+        directory: Local directory for the .arrow files (tmpfs/in-memory preferred)
+        ttl: Seconds a shared plain file stays fresh before the next reader
+            re-downloads it (snapshot files never change and are kept until retain() drops them)
+    """
+
+    def __init__(self, directory: str, ttl: int = 300):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, filename: str, suffix: str) -> str:
+        return os.path.join(self.directory, filename.replace('/', '__') + suffix)
+
+    def _fresh_mtime(self, filename: str, path: str) -> Optional[float]:
+        """Modification time of the shared file if it is still fresh"""
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        return mtime if is_snapshot_path(filename) or time.time() - mtime < self.ttl else None
+
+    def _read(self, path: str, mtime: float) -> Optional[pd.DataFrame]:
+        """The shared dataset, or None if it was removed in the meantime (e.g. by invalidate())"""
+        with span('shared_dataset.read', path=path) as current:
+            try:
+                with pa.memory_map(path) as source:
+                    table = pa.ipc.open_file(source).read_all()
+            except FileNotFoundError:
+                return None
+            df = table.to_pandas()
+            del table
+            current.set_attribute('rows', len(df))
+        # Arrow nulls come back as None - restore the NaN that read_csv produces,
+        # a column at a time so only one extra column is alive at once
+        for column in df.columns[df.dtypes == object]:
+            values = df[column]
+            if values.hasnans:
+                df[column] = values.where(values.notna(), np.nan)
+        df.attrs['loaded_at'] = mtime
+        return df
+
+    def _write(self, path: str, df: pd.DataFrame) -> bool:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            # Mixed-type object columns can't be stored as Arrow - serve this worker only
+            logger.debug(f"Dataset not shareable as Arrow ({path}): {e}")
+            return False
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        return True
+
+    def load(self, filename: str, loader: Callable[[str], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Get a dataset from the shared store, or load and publish it.
+
+        Args:
+            filename: Dataset filename (e.g. 'report.csv')
+            loader: Function that reads and parses the file from storage
+
+        Returns:
+            DataFrame (attrs['loaded_at'] holds when the data was fetched)
+        """
+        data_path = self._path(filename, '.arrow')
+
+        mtime = self._fresh_mtime(filename, data_path)
+        if mtime is not None:
+            df = self._read(data_path, mtime)
+            if df is not None:
+                record_cache('shared_dataset', hit=True)
+                return df
+
+        with open(self._path(filename, '.lock'), 'w') as lock_file:
+            # Other workers wait here and then map what the first one wrote
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                mtime = self._fresh_mtime(filename, data_path)
+                df = self._read(data_path, mtime) if mtime is not None else None
+                if df is not None:
+                    record_cache('shared_dataset', hit=True)
+                    return df
+
+                record_cache('shared_dataset', hit=False)
+                started = time.perf_counter()
+                df = loader(filename)
+                if not df.empty and self._write(data_path, df):
+                    logger.info(f"Shared {filename} with other workers ({len(df)} rows, {time.perf_counter() - started:.2f}s)")
+                df.attrs['loaded_at'] = time.time()
+                return df
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def files(self) -> dict:
+        """Shared dataset files and their sizes in MB"""
+        sizes = {}
+        for name in os.listdir(self.directory):
+            if name.endswith('.arrow'):
+                try:
+                    sizes[name] = round(os.path.getsize(os.path.join(self.directory, name)) / 1024 ** 2, 2)
+                except FileNotFoundError:
+                    pass
+        return sizes
+
+    def invalidate(self, filename: Optional[str] = None):
+        """Remove one shared dataset, or all of them"""
+        if filename is not None:
+            paths = [self._path(filename, '.arrow')]
+        else:
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.arrow')]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def retain(self, paths: set):
+        """Remove shared snapshot files (and their locks) that aren't in `paths` (the current snapshot's)"""
+        keep = {self._path(path, suffix) for path in paths for suffix in ('.arrow', '.lock')}
+        prefix = self._path(f'{SNAPSHOT_DIR}/', '')
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path.startswith(prefix) and name.endswith(('.arrow', '.lock')) and path not in keep:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,377 @@
+"""
+Versioned dataset snapshots for Cloud Run.
+A refresh writes its files under a new prefix (snapshots/<version>/...) and
+then publishes them all at once by replacing one small pointer object,
+snapshots/current.json, which maps every dataset to the version holding it.
+Readers resolve dataset names through the pointer, so they see either the
+old or the new data, never a mix of both, and anything cached under a
+resolved path (or keyed on the version) never goes stale.
+
+Publishers replace the pointer conditionally (GCS if_generation_match) on
+top of the latest one, so concurrent publishes don't drop each other's
+files, and files a pointer stopped using are kept for RETIRE_GRACE
+seconds, while workers and requests may still be reading the old one.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = 'snapshots'
+POINTER_FILE = f'{SNAPSHOT_DIR}/current.json'
+# Tries to replace the pointer while other publishers keep replacing it first
+PUBLISH_ATTEMPTS = 5
+# Seconds the files an earlier pointer used are kept after a new one stops using them
+# (workers read the pointer every SNAPSHOT_CHECK_INTERVAL seconds and requests keep theirs)
+RETIRE_GRACE = max(600, 4 * Config.SNAPSHOT_CHECK_INTERVAL)
+
+
+def new_version() -> str:
+    """A new snapshot version: UTC time (so versions sort by age) plus a random suffix"""
+    return f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{uuid.uuid4().hex[:6]}"
+
+
+def is_snapshot_path(path: str) -> bool:
+    """Whether a storage path is a file of a snapshot (whose contents never change)"""
+    return path.startswith(f'{SNAPSHOT_DIR}/') and path.count('/') >= 2
+
+
+def dataset_name(path: str) -> str:
+    """Dataset name of a storage path ('snapshots/<version>/report.csv' -> 'report.csv')"""
+    return path.split('/', 2)[2] if is_snapshot_path(path) else path
+
+
+class Snapshot:
+    """
+    A published set of datasets.
+
+    Args:
+        version: Version of the snapshot
+        files: {dataset name: version whose prefix holds it} (files not
+            rewritten since an earlier snapshot keep that snapshot's version)
+        created_at: Unix time it was published
+        sources: {dataset name: generation of the source object it was copied
+            from}, to tell which datasets changed upstream (app.utils.source_watcher)
+        retired: {storage path: Unix time}, files earlier pointers used and
+            this one doesn't, kept by prune() for RETIRE_GRACE seconds
+    """
+
+    def __init__(self, version: str, files: dict, created_at: Optional[float] = None, sources: Optional[dict] = None,
+                 retired: Optional[dict] = None):
+        self.version = version
+        self.files = files
+        self.created_at = created_at
+        self.sources = sources or {}
+        self.retired = retired or {}
+
+    def path(self, filename: str) -> str:
+        """Storage path of a dataset (a path that doesn't exist if the snapshot hasn't got it)"""
+        return f'{SNAPSHOT_DIR}/{self.files.get(filename, self.version)}/{filename}'
+
+    def paths(self) -> set:
+        """Storage paths of all datasets of the snapshot"""
+        return {self.path(filename) for filename in self.files}
+
+    def to_json(self) -> bytes:
+        return json.dumps({'version': self.version, 'created_at': self.created_at, 'files': self.files,
+                           'sources': self.sources, 'retired': self.retired}, sort_keys=True).encode('utf-8')
+
+    @classmethod
+    def from_json(cls, content: bytes) -> 'Snapshot':
+        data = json.loads(content)
+        return cls(data['version'], dict(data['files']), data.get('created_at'), dict(data.get('sources') or {}),
+                   dict(data.get('retired') or {}))
+
+
+class SnapshotWriter:
+    """
+    Storage backend writing into a new snapshot version, made visible by
+    SnapshotStore.publish(). Reads see the files written so far on top of
+    the base snapshot; nothing readers can see is ever overwritten.
+
+    Args:
+        storage: Backend holding the snapshots
+        base: Snapshot the new one starts from (None for an empty one)
+        origin: Snapshot current when writing began (the base, if any)
+    """
+
+    def __init__(self, storage, base: Optional[Snapshot] = None, origin: Optional[Snapshot] = None):
+        self.storage = storage
+        self.bucket_name = storage.bucket_name
+        self.base = base
+        self.origin = origin if origin is not None else base
+        self.version = new_version()
+        self.written = {}  # dataset name -> version holding it
+        self.sources = {}  # dataset name -> generation of its source object
+
+    def path(self, filename: str) -> str:
+        """Storage path of a dataset in the snapshot being written"""
+        if filename in self.written:
+            return f'{SNAPSHOT_DIR}/{self.written[filename]}/{filename}'
+        if self.base is not None:
+            return self.base.path(filename)
+        return f'{SNAPSHOT_DIR}/{self.version}/{filename}'
+
+    def snapshot(self) -> Snapshot:
+        """The snapshot as written so far"""
+        files = dict(self.base.files) if self.base is not None else {}
+        files.update(self.written)
+        sources = dict(self.base.sources) if self.base is not None else {}
+        sources.update(self.sources)
+        return Snapshot(self.version, files, time.time(), sources)
+
+    def rebase(self, latest: Optional[Snapshot], keep: tuple = ()) -> Snapshot:
+        """
+        The snapshot to publish over `latest`, the pointer now. Datasets
+        written here replace those of `latest`. A full rewrite (no base)
+        carries over only `keep` and the datasets other publishers changed
+        since it began - their copies are newer than the ones read here.
+        """
+        if latest is None:
+            return self.snapshot()
+        if self.base is not None:
+            files = {**latest.files, **self.written}
+            sources = {**latest.sources, **self.sources}
+        else:
+            origin = self.origin.files if self.origin is not None else {}
+            carried = [name for name, version in latest.files.items()
+                       if origin.get(name) != version or (name in keep and name not in self.written)]
+            files = {**self.written, **{name: latest.files[name] for name in carried}}
+            sources = {**self.sources, **{name: latest.sources[name] for name in carried if name in latest.sources}}
+        # Versions only go up, or announcements of this one would be ignored (app.utils.invalidation)
+        version = self.version if self.version > latest.version else new_version()
+        snapshot = Snapshot(version, files, time.time(), sources)
+        now = time.time()
+        in_use = snapshot.paths()
+        retired = {path: at for path, at in latest.retired.items() if now - at < RETIRE_GRACE}
+        retired.update((path, now) for path in latest.paths() - in_use)
+        snapshot.retired = {path: at for path, at in retired.items() if path not in in_use}
+        return snapshot
+
+    def read_csv(self, filename: str):
+        return self.storage.read_csv(self.path(filename))
+
+    def read_bytes(self, filename: str) -> Optional[bytes]:
+        return self.storage.read_bytes(self.path(filename))
+
+    def write_csv(self, df, filename: str) -> bool:
+        if not self.storage.write_csv(df, f'{SNAPSHOT_DIR}/{self.version}/{filename}'):
+            return False
+        self.written[filename] = self.version
+        return True
+
+    def write_from_bytes(self, content: bytes, filename: str, content_type: str = 'text/csv') -> bool:
+        if not self.storage.write_from_bytes(content, f'{SNAPSHOT_DIR}/{self.version}/{filename}', content_type):
+            return False
+        self.written[filename] = self.version
+        return True
+
+    def file_exists(self, filename: str) -> bool:
+        return self.storage.file_exists(self.path(filename))
+
+    def list_files(self, prefix: str = '') -> list:
+        return sorted(name for name in self.snapshot().files if name.startswith(prefix))
+
+    def get_file_size(self, filename: str) -> int:
+        return self.storage.get_file_size(self.path(filename))
+
+
+class SnapshotStore:
+    """
+    The current snapshot as seen by this worker.
+
+    The pointer is read again at most every SNAPSHOT_CHECK_INTERVAL seconds,
+    and a request keeps the snapshot it started with, so all the files it
+    reads belong together. Listeners are called with the new snapshot when
+    the version changes (e.g. to drop cached files of the old one).
+    """
+
+    def __init__(self, check_interval: float = 30):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def subscribe(self, listener: Callable[[Optional[Snapshot]], None]):
+        """Call listener(snapshot) whenever this worker switches to another snapshot"""
+        self._listeners.append(listener)
+
+    @staticmethod
+    def _pin(snapshot: Optional[Snapshot]) -> Optional[Snapshot]:
+        from flask import g, has_request_context
+        if has_request_context():
+            g.data_snapshot = snapshot
+        return snapshot
+
+    def current(self) -> Optional[Snapshot]:
+        """
+        The snapshot to read from, or None if none has been published (or
+        DATA_SNAPSHOTS is off) and datasets are plain files.
+        """
+        if not Config.DATA_SNAPSHOTS:
+            return None
+        from flask import g, has_request_context
+        if has_request_context() and 'data_snapshot' in g:
+            return g.data_snapshot
+        if time.time() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.time() - self._checked_at >= self.check_interval:
+                    self._read_pointer()
+        return self._pin(self._snapshot)
+
+    def check(self, storage=None) -> Optional[Snapshot]:
+        """Read the pointer now, e.g. before changing a dataset; the current snapshot"""
+        if not Config.DATA_SNAPSHOTS:
+            return None
+        with self._lock:
+            self._read_pointer(storage)
+        return self._pin(self._snapshot)
+
+    def _read_pointer(self, storage=None):
+        try:
+            if storage is None:
+                from app.utils.storage import get_storage_manager
+                storage = get_storage_manager()
+            # Before the first snapshot, probe instead of logging a failed read every time
+            if self._snapshot is None and not storage.file_exists(POINTER_FILE):
+                content = None
+            else:
+                content = storage.read_bytes(POINTER_FILE)
+            if content is not None:
+                self._set(Snapshot.from_json(content))
+            elif self._snapshot is not None:
+                # The pointer is never deleted - keep reading the last snapshot seen
+                logger.warning(f"Could not read {POINTER_FILE}, staying on snapshot {self._snapshot.version}")
+        except Exception as e:
+            logger.error(f"Error reading {POINTER_FILE}: {e}", exc_info=True)
+        self._checked_at = time.time()
+
+    def _set(self, snapshot: Optional[Snapshot]):
+        previous, self._snapshot = self._snapshot, snapshot
+        if (previous and previous.version) == (snapshot and snapshot.version):
+            return
+        logger.info(f"Reading data snapshot {snapshot.version if snapshot else None} "
+                    f"(was {previous.version if previous else None})")
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Error in snapshot listener {listener}: {e}", exc_info=True)
+
+    def begin(self, storage, incremental: bool = True):
+        """
+        Storage to write a set of dataset changes to before publish(): a
+        SnapshotWriter, or storage itself if DATA_SNAPSHOTS is off or nothing
+        has been published as a snapshot yet (files are then overwritten in place).
+
+        Args:
+            storage: Backend the snapshots live in
+            incremental: Start from the current snapshot (True) or from an empty one (a full refresh)
+        """
+        if not Config.DATA_SNAPSHOTS:
+            return storage
+        current = self.check(storage)
+        if not incremental:
+            return SnapshotWriter(storage, origin=current)
+        # Before the first snapshot the plain files are what readers see
+        return storage if current is None else SnapshotWriter(storage, current)
+
+    @staticmethod
+    def _read_latest(storage) -> tuple:
+        """The pointer in storage and its generation (None where the backend can't replace it conditionally)"""
+        if hasattr(storage, 'read_versioned'):
+            content, generation = storage.read_versioned(POINTER_FILE)
+        else:
+            content, generation = storage.read_bytes(POINTER_FILE), None
+        return (Snapshot.from_json(content) if content else None), generation
+
+    def publish(self, target, keep: tuple = (), sources: Optional[dict] = None) -> bool:
+        """
+        Make everything written to a begin() target visible by replacing the
+        pointer (a single object write - readers switch over at once).
+
+        The new pointer is built on the latest one and written only if that
+        is still the latest (if_generation_match), or built again; without
+        conditional writes (S3) publishes take a lock (RefreshJobs.task_lock).
+
+        Args:
+            target: What begin() returned
+            keep: Datasets to carry over from the current snapshot if they weren't written
+            sources: {dataset name: generation of the source object} of the datasets copied
+
+        Returns:
+            True if published
+        """
+        if not isinstance(target, SnapshotWriter):
+            return True
+        target.sources.update(sources or {})
+        storage = target.storage
+        if not hasattr(storage, 'write_if_generation'):
+            from app.utils.refresh_jobs import refresh_jobs
+            with refresh_jobs.task_lock('snapshot-publish', wait=30) as acquired:
+                if not acquired:
+                    logger.warning(f"Publishing snapshot {target.version} without the publish lock")
+                latest, _ = self._read_latest(storage)
+                snapshot = target.rebase(latest, keep)
+                published = storage.write_from_bytes(snapshot.to_json(), POINTER_FILE, content_type='application/json')
+        else:
+            published = False
+            for attempt in range(PUBLISH_ATTEMPTS):
+                latest, generation = self._read_latest(storage)
+                snapshot = target.rebase(latest, keep)
+                if storage.write_if_generation(snapshot.to_json(), POINTER_FILE, generation, content_type='application/json'):
+                    published = True
+                    break
+                logger.info(f"Snapshot {latest.version if latest else None} was replaced while publishing "
+                            f"{snapshot.version}, publishing again on top of the new one")
+        if not published:
+            logger.error(f"Failed to publish snapshot {snapshot.version}")
+            return False
+        logger.info(f"Published snapshot {snapshot.version} ({len(target.written)} of {len(snapshot.files)} files new)")
+        with self._lock:
+            self._set(snapshot)
+            self._checked_at = time.time()
+        self._pin(snapshot)
+        return True
+
+    def prune(self, storage, keep: int) -> int:
+        """
+        Delete the files of snapshot versions older than the newest `keep`,
+        except those the latest pointer uses or retired less than
+        RETIRE_GRACE seconds ago.
+
+        Returns:
+            Number of files deleted
+        """
+        snapshot, _ = self._read_latest(storage)
+        if snapshot is None:
+            return 0
+        by_version = {}
+        for name in storage.list_files(f'{SNAPSHOT_DIR}/'):
+            if is_snapshot_path(name):
+                by_version.setdefault(name.split('/', 2)[1], []).append(name)
+        now = time.time()
+        in_use = snapshot.paths() | {path for path, at in snapshot.retired.items() if now - at < RETIRE_GRACE}
+        versions = sorted(by_version)
+        stale = [name for version in versions[:-max(keep, 1)] for name in by_version[version] if name not in in_use]
+        if not stale:
+            return 0
+        deleted = storage.delete_files(stale)
+        logger.info(f"Deleted {deleted} files of {len(versions) - max(keep, 1)} old snapshots")
+        return deleted
+
+    def after_fork(self):
+        """Recreate the lock in a forked worker and read the pointer again"""
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+
+
+snapshot_store = SnapshotStore(check_interval=Config.SNAPSHOT_CHECK_INTERVAL)
@@ -0,0 +1,202 @@
+"""
+Source bucket watcher for Cloud Run.
+When the upstream pipeline rewrites CSVs in S3 (or in the offline backend),
+the app would only notice on the next "Refresh Data" or TTL expiry. With
+SOURCE_WATCH_INTERVAL set, one worker per instance lists the source objects'
+generations (GCS generation, S3 ETag - a single listing, no per-file HEAD
+requests) on that interval and brings just the changed datasets up to date:
+
+- with snapshots, the generations are compared with those the current
+  snapshot was copied from, and the changed files are copied into a new
+  snapshot by a refresh job (one at a time across instances);
+- without, the changed datasets are dropped from the caches, and those that
+  were cached are loaded again straight away.
+"""
+from __future__ import annotations
+
+import fcntl
+import logging
+import os
+import threading
+import time
+from typing import Callable
+from app.config import Config
+from app.utils.snapshots import SNAPSHOT_DIR, snapshot_store
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE = 'source_watcher.lock'
+
+
+def source_storage():
+    """Backend the upstream pipeline writes to: the offline backend's plain files, or S3"""
+    from app.utils.storage import OFFLINE_DATA_SOURCES, get_offline_storage, get_s3_manager
+    return get_offline_storage() if Config.DATA_SOURCE in OFFLINE_DATA_SOURCES else get_s3_manager()
+
+
+def source_datasets(generations: dict) -> dict:
+    """The CSV datasets of a listing, without snapshot files (or offline partition files)"""
+    from app.utils.storage import OFFLINE_DATA_SOURCES
+    offline = Config.DATA_SOURCE in OFFLINE_DATA_SOURCES
+    return {
+        name: generation for name, generation in generations.items()
+        if name.endswith('.csv') and not name.startswith(f'{SNAPSHOT_DIR}/') and not (offline and '/' in name)
+    }
+
+
+class SourceWatcher:
+    """
+    Polls the source objects' generations and updates the datasets that changed.
+
+    Args:
+        interval: Seconds between polls (0 disables the watcher)
+    """
+
+    def __init__(self, interval: float = 0):
+        self.interval = interval
+        self._handlers = []
+        self._seen = None  # (bucket, {name: generation}) of the last poll, without snapshots
+        self._attempted = {}  # name -> source generation last handed to the handlers, with snapshots
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._stats = {'polls': 0, 'changes': 0, 'failed': 0, 'last_poll_at': None, 'last_changed': []}
+
+    def on_change(self, handler: Callable[[list], bool]):
+        """
+        Call handler(filenames) with the datasets changed upstream since the
+        current snapshot; it returns True if it started updating them.
+        """
+        self._handlers.append(handler)
+
+    def _leader(self) -> bool:
+        """Whether this worker polls for the instance (the one holding the lock file)"""
+        if self._lock_file is not None:
+            return True
+        os.makedirs(Config.SHARED_DATASET_DIR, exist_ok=True)
+        lock_file = open(os.path.join(Config.SHARED_DATASET_DIR, LOCK_FILE), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info(f"Watching the source bucket for changes every {self.interval:g}s")
+        return True
+
+    def poll(self) -> list:
+        """
+        List the source generations once and act on the datasets that changed.
+
+        Returns:
+            Names of the changed datasets
+        """
+        snapshot = snapshot_store.current()
+        if snapshot is not None:
+            changed = self._changed_sources(snapshot)
+        else:
+            changed = self._changed_files()
+        with self._lock:
+            self._stats['polls'] += 1
+            self._stats['last_poll_at'] = time.time()
+            if changed:
+                self._stats['changes'] += 1
+                self._stats['last_changed'] = changed
+        return changed
+
+    def _changed_sources(self, snapshot) -> list:
+        """
+        Snapshot mode: datasets whose source generation differs from the one
+        they were copied from. A generation is handed to the handlers once -
+        if copying it fails, the file is tried again when it changes upstream
+        (or on the next "Refresh Data"), not on every poll.
+        """
+        if not snapshot.sources:
+            # Published before generations were recorded; the next refresh records them
+            logger.debug(f"Snapshot {snapshot.version} has no source generations, waiting for a refresh")
+            return []
+        generations = source_datasets(source_storage().list_generations())
+        changed = sorted(name for name, generation in generations.items()
+                         if snapshot.sources.get(name) != generation and self._attempted.get(name) != generation)
+        if changed:
+            # Another instance may have copied them already
+            snapshot = snapshot_store.check() or snapshot
+            changed = [name for name in changed if snapshot.sources.get(name) != generations[name]]
+        if changed:
+            logger.info(f"Source files changed since snapshot {snapshot.version}: {', '.join(changed)}")
+            started = [handler(changed) for handler in self._handlers]
+            if any(started):
+                self._attempted.update((name, generations[name]) for name in changed)
+        return changed
+
+    def _changed_files(self) -> list:
+        """Without snapshots: datasets rewritten in the storage read from since the last poll"""
+        from app.utils.storage import get_storage_manager
+        storage = get_storage_manager()
+        generations = source_datasets(storage.list_generations())
+        seen, self._seen = self._seen, (storage.bucket_name, generations)
+        if seen is None or seen[0] != storage.bucket_name:
+            return []
+        changed = sorted(name for name, generation in generations.items() if seen[1].get(name) != generation)
+        if changed:
+            logger.info(f"Files changed in {storage.bucket_name}: {', '.join(changed)}")
+            self._refresh(changed)
+        return changed
+
+    @staticmethod
+    def _refresh(filenames: list):
+        """Drop changed datasets from the caches (here and, via the bus, elsewhere) and reload the hot ones"""
+        from app.utils.datasets import dataset_cache, load_dataset
+        from app.utils.invalidation import apply_event, invalidation_bus
+
+        cached = set(dataset_cache.cached_files())
+        apply_event({'datasets': filenames})
+        invalidation_bus.announce(filenames)
+        for filename in filenames:
+            if filename in cached:
+                try:
+                    load_dataset(filename)
+                except Exception as e:
+                    logger.warning(f"Could not reload {filename}: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self._leader():
+                    self.poll()
+            except Exception as e:
+                logger.error(f"Error watching the source bucket: {e}", exc_info=True)
+                with self._lock:
+                    self._stats['failed'] += 1
+
+    def start(self):
+        """Start the polling thread (once per process; no-op without SOURCE_WATCH_INTERVAL)"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='source-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the polling thread"""
+        self._stop.set()
+
+    def stats(self) -> dict:
+        """Poll counts and the last change seen by this worker"""
+        with self._lock:
+            return {'interval': self.interval, 'leader': self._lock_file is not None, **self._stats}
+
+    def after_fork(self):
+        """Forget the master's thread and lock file (the lock is taken per worker); start() again"""
+        self._lock = threading.Lock()
+        self._thread = None
+        self._lock_file = None
+        self._seen = None
+        self._attempted = {}
+
+
+source_watcher = SourceWatcher(interval=Config.SOURCE_WATCH_INTERVAL)
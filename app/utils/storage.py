@@ -0,0 +1,216 @@
+"""
+Storage manager selection for Cloud Run.
+Managers are created once per process so S3/GCS clients (and their
+connection pools) are reused across requests. All managers implement
+app.utils.storage_backends.StorageBackend.
+"""
+import logging
+import os
+import threading
+from typing import Optional
+from app.config import Config
+from app.utils.s3_client import S3Manager
+from app.utils.gcs_client import GCSManager
+from app.utils.invalidation import invalidation_bus
+from app.utils.snapshots import POINTER_FILE, snapshot_store
+
+logger = logging.getLogger(__name__)
+
+OFFLINE_DATA_SOURCES = ('local', 'memory')
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+# Set once GCS is known to hold data, so the report.csv probe isn't repeated on every request
+_gcs_has_data = False
+
+
+def get_s3_manager():
+    """Get S3 manager instance"""
+    with _managers_lock:
+        if 's3' not in _managers:
+            _managers['s3'] = S3Manager(
+                bucket_name=Config.S3_BUCKET_NAME,
+                aws_access_key=Config.AWS_ACCESS_KEY_ID,
+                aws_secret_key=Config.AWS_SECRET_ACCESS_KEY,
+                region=Config.AWS_DEFAULT_REGION
+            )
+        return _managers['s3']
+
+
+def get_gcs_manager():
+    """Get GCS manager instance"""
+    try:
+        with _managers_lock:
+            if 'gcs' not in _managers:
+                _managers['gcs'] = GCSManager(
+                    bucket_name=Config.GCS_BUCKET_NAME,
+                    project_id=Config.GCP_PROJECT_ID
+                )
+            return _managers['gcs']
+    except ImportError as e:
+        logger.warning(f"GCS not available: {e}. Falling back to S3.")
+        return None
+
+
+def get_offline_storage():
+    """Get the local-directory or in-memory backend (DATA_SOURCE 'local' or 'memory')"""
+    from app.utils.storage_backends import LocalStorage, MemoryStorage
+
+    with _managers_lock:
+        if Config.DATA_SOURCE not in _managers:
+            simulation = {'latency_ms': Config.STORAGE_LATENCY_MS, 'bandwidth_mbps': Config.STORAGE_BANDWIDTH_MBPS}
+            if Config.DATA_SOURCE == 'memory':
+                if os.path.isdir(Config.LOCAL_STORAGE_DIR):
+                    _managers['memory'] = MemoryStorage.from_directory(Config.LOCAL_STORAGE_DIR, **simulation)
+                else:
+                    _managers['memory'] = MemoryStorage(**simulation)
+            else:
+                _managers['local'] = LocalStorage(Config.LOCAL_STORAGE_DIR, **simulation)
+            logger.info(f"Using {Config.DATA_SOURCE} storage backend ({Config.LOCAL_STORAGE_DIR})")
+        return _managers[Config.DATA_SOURCE]
+
+
+def reset_storage_managers():
+    """Drop cached managers and the GCS data probe (e.g. after a refresh or fork)"""
+    global _gcs_has_data
+    with _managers_lock:
+        _managers.clear()
+    _gcs_has_data = False
+
+
+def gcs_has_data(gcs_manager) -> bool:
+    """Check (once per process) whether the GCS cache has been populated"""
+    global _gcs_has_data
+    if not _gcs_has_data:
+        _gcs_has_data = gcs_manager.file_exists(POINTER_FILE) or gcs_manager.file_exists('report.csv')
+    return _gcs_has_data
+
+
+def get_storage_manager():
+    """
+    Get storage manager - prefers GCS if available, falls back to S3.
+    This reduces AWS egress costs by using GCS as cache.
+
+    If FORCE_GCS_ONLY is True, will raise an error if GCS is not available.
+    DATA_SOURCE 'local' or 'memory' uses an offline backend instead of any bucket.
+    """
+    if Config.DATA_SOURCE in OFFLINE_DATA_SOURCES:
+        return get_offline_storage()
+
+    # Force GCS only mode - fail if GCS is not available
+    if Config.FORCE_GCS_ONLY:
+        gcs_manager = get_gcs_manager()
+        if gcs_manager is None:
+            raise RuntimeError("FORCE_GCS_ONLY is enabled but GCS is not available. Install google-cloud-storage package.")
+        if not gcs_has_data(gcs_manager):
+            raise RuntimeError(f"FORCE_GCS_ONLY is enabled but GCS bucket {Config.GCS_BUCKET_NAME} is empty. Please run 'Refresh Data' first.")
+        logger.debug(f"[FORCED] Using GCS as data source (bucket: {Config.GCS_BUCKET_NAME})")
+        return gcs_manager
+
+    # Normal mode - prefer GCS, fallback to S3
+    if Config.DATA_SOURCE == 'gcs' or Config.DATA_SOURCE == 'gcs-only':
+        gcs_manager = get_gcs_manager()
+        if gcs_manager is not None:
+            try:
+                # Check if GCS has data, if not fallback to S3 (unless gcs-only)
+                if gcs_has_data(gcs_manager):
+                    logger.debug(f"Using GCS as data source (bucket: {Config.GCS_BUCKET_NAME})")
+                    return gcs_manager
+                else:
+                    if Config.DATA_SOURCE == 'gcs-only':
+                        raise RuntimeError(f"GCS-only mode enabled but bucket {Config.GCS_BUCKET_NAME} is empty. Please run 'Refresh Data' first.")
+                    logger.warning(f"GCS cache empty (bucket: {Config.GCS_BUCKET_NAME}), falling back to S3")
+            except Exception as e:
+                if Config.DATA_SOURCE == 'gcs-only':
+                    raise RuntimeError(f"GCS-only mode enabled but error occurred: {e}")
+                logger.warning(f"GCS error: {e}. Falling back to S3.")
+        else:
+            if Config.DATA_SOURCE == 'gcs-only':
+                raise RuntimeError("GCS-only mode enabled but GCS is not available. Install google-cloud-storage package.")
+        # Fallback to S3 if GCS is not available or has no data
+        logger.info(f"Using S3 as data source (bucket: {Config.S3_BUCKET_NAME})")
+        return get_s3_manager()
+    else:
+        logger.debug(f"Using S3 as data source (DATA_SOURCE={Config.DATA_SOURCE}, bucket: {Config.S3_BUCKET_NAME})")
+        return get_s3_manager()
+
+
+def write_dataset(df, filename: str) -> bool:
+    """
+    Write a dataset to its source: S3 (plus the GCS cache copy), or the offline backend.
+    Other instances are told about the change (app.utils.invalidation).
+
+    Returns:
+        True if the source was written
+    """
+    if Config.DATA_SOURCE in OFFLINE_DATA_SOURCES:
+        # Local/in-memory backend - the plain files are the source, snapshots (once published) the copy
+        storage = get_offline_storage()
+        success = storage.write_csv(df, filename)
+        if success and snapshot_store.current() is not None:
+            publish_dataset(storage, df, filename, sources=_source_generation(storage, filename))
+    else:
+        s3_manager = get_s3_manager()
+        success = s3_manager.write_csv(df, filename)
+        gcs_manager = get_gcs_manager()
+        if gcs_manager is not None:
+            sources = _source_generation(s3_manager, filename) if success and snapshot_store.current() is not None else None
+            publish_dataset(gcs_manager, df, filename, sources=sources)
+    if success:
+        invalidation_bus.announce([filename])
+    return success
+
+
+def _source_generation(source, filename: str) -> Optional[dict]:
+    """
+    {filename: generation} of a source file just written, recorded in the
+    snapshot so the source watcher doesn't take the app's own write for an
+    upstream change (app.utils.source_watcher)
+    """
+    generation = source.list_generations(filename).get(filename)
+    return {filename: generation} if generation is not None else None
+
+
+def write_object(content: bytes, filename: str, content_type: str = 'application/json') -> bool:
+    """
+    Write a small object outside the snapshots, where every reader sees it at
+    once: to the offline backend, or to S3 plus the GCS copy.
+
+    Returns:
+        True if written to the source and the copy readers list
+    """
+    if Config.DATA_SOURCE in OFFLINE_DATA_SOURCES:
+        return get_offline_storage().write_from_bytes(content, filename, content_type)
+    success = get_s3_manager().write_from_bytes(content, filename, content_type)
+    gcs_manager = get_gcs_manager()
+    if success and gcs_manager is not None:
+        success = gcs_manager.write_from_bytes(content, filename, content_type)
+    return success
+
+
+def delete_objects(filenames: list) -> int:
+    """Delete objects written with write_object() from the source and the copy; the number deleted from the source"""
+    if not filenames:
+        return 0
+    if Config.DATA_SOURCE in OFFLINE_DATA_SOURCES:
+        return get_offline_storage().delete_files(filenames)
+    gcs_manager = get_gcs_manager()
+    if gcs_manager is not None:
+        gcs_manager.delete_files(filenames)
+    return get_s3_manager().delete_files(filenames)
+
+
+def publish_dataset(storage, df, filename: str, sources: Optional[dict] = None) -> bool:
+    """
+    Write a dataset to the copy readers use: as a new snapshot on top of the
+    current one (app.utils.snapshots), or in place before the first snapshot.
+
+    Args:
+        sources: {dataset name: generation of the source object} to record in the snapshot
+
+    Returns:
+        True if written and published
+    """
+    target = snapshot_store.begin(storage)
+    return target.write_csv(df, filename) and snapshot_store.publish(target, sources=sources)
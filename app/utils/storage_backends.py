@@ -0,0 +1,395 @@
+"""
+Storage interface and offline backends for Cloud Run.
+S3Manager and GCSManager implement StorageBackend; LocalStorage (a directory)
+and MemoryStorage (a dict) implement it without any cloud bucket, so the app
+can be run, profiled and load-tested offline. Both offline backends can
+simulate a remote bucket with injected per-request latency and bandwidth.
+"""
+from __future__ import annotations
+
+import fcntl
+import itertools
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Optional, Protocol, runtime_checkable
+from app.utils.io_metrics import record_io
+from app.utils.lazy_import import lazy_import
+from app.utils.schemas import apply_schema
+from app.utils.tracing import span
+
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    """Operations the routes and the dataset cache need from a storage backend"""
+
+    bucket_name: str
+
+    def read_csv(self, filename: str) -> pd.DataFrame: ...
+
+    def read_bytes(self, filename: str) -> Optional[bytes]: ...
+
+    def write_csv(self, df: pd.DataFrame, filename: str) -> bool: ...
+
+    def write_from_bytes(self, content: bytes, filename: str, content_type: str = 'text/csv') -> bool: ...
+
+    def file_exists(self, filename: str) -> bool: ...
+
+    def list_files(self, prefix: str = '') -> list: ...
+
+    def list_generations(self, prefix: str = '') -> dict: ...
+
+    def get_file_size(self, filename: str) -> int: ...
+
+    def delete_files(self, filenames: list) -> int: ...
+
+    # Optional, for objects several writers replace (the snapshot pointer):
+    # read_versioned(filename) -> (bytes, generation) and
+    # write_if_generation(content, filename, generation, content_type) -> bool
+
+
+def parse_csv(content: bytes, filename: str) -> pd.DataFrame:
+    """
+    Parse CSV bytes downloaded from storage and apply the file's schema (app.utils.schemas).
+
+    Args:
+        content: Raw file contents
+        filename: Name of the file (for logging and tracing)
+
+    Returns:
+        DataFrame (empty if the file is empty)
+    """
+    if not content.strip():
+        logger.warning(f"{filename} is empty")
+        return pd.DataFrame()
+
+    with span('csv.parse', file=filename) as current:
+        df = pd.read_csv(BytesIO(content), quotechar='"')
+        current.set_attributes({'rows': len(df), 'columns': len(df.columns)})
+    with span('csv.schema', file=filename):
+        df = apply_schema(df, filename)
+    logger.info(f"Successfully read {len(df)} rows and {len(df.columns)} columns from {filename}")
+    if len(df) > 0:
+        logger.debug(f"Columns in {filename}: {df.columns.tolist()[:10]}")
+    return df
+
+
+def parse_parquet(content: bytes, filename: str) -> pd.DataFrame:
+    """Parse Parquet bytes downloaded from storage (typed when written, so no schema is applied)"""
+    with span('parquet.parse', file=filename) as current:
+        df = pd.read_parquet(BytesIO(content))
+        current.set_attributes({'rows': len(df), 'columns': len(df.columns)})
+    logger.info(f"Successfully read {len(df)} rows and {len(df.columns)} columns from {filename}")
+    return df
+
+
+class SimulatedStorage(ABC):
+    """
+    Base for the offline backends: CSV handling on top of raw byte storage,
+    with optional injected latency and bandwidth to mimic a remote bucket.
+    Subclasses implement the abstract _ hooks (a missing one fails on creation).
+
+    Args:
+        latency_ms: Added to every request (read, write, exists, list)
+        bandwidth_mbps: Transfer rate for file contents in megabits/s (0 = unlimited)
+    """
+
+    backend_name = 'simulated'
+
+    def __init__(self, bucket_name: str, latency_ms: float = 0, bandwidth_mbps: float = 0):
+        self.bucket_name = bucket_name
+        self.latency_ms = latency_ms
+        self.bandwidth_mbps = bandwidth_mbps
+
+    def _simulate_request(self, nbytes: int = 0):
+        """Sleep for the configured round trip plus transfer time"""
+        delay = self.latency_ms / 1000
+        if self.bandwidth_mbps > 0:
+            delay += nbytes * 8 / (self.bandwidth_mbps * 1_000_000)
+        if delay > 0:
+            time.sleep(delay)
+
+    @abstractmethod
+    def _read_bytes(self, filename: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _write_bytes(self, filename: str, content: bytes):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _size(self, filename: str) -> Optional[int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _names(self) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _generation(self, filename: str) -> Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _delete(self, filename: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _exclusive(self, filename: str):
+        """Context manager holding off other writers of a file (all processes using the backend)"""
+        raise NotImplementedError
+
+    def _version(self, filename: str) -> Optional[str]:
+        """Token that changes whenever the file is written, for write_if_generation()"""
+        return self._generation(filename)
+
+    def read_csv(self, filename: str) -> pd.DataFrame:
+        """
+        Read CSV file from the backend.
+
+        Args:
+            filename: Name of the CSV file
+
+        Returns:
+            DataFrame with CSV contents (empty if missing or unreadable)
+        """
+        try:
+            content = self.read_bytes(filename)
+            if content is None:
+                return pd.DataFrame()
+            return parse_csv(content, filename)
+
+        except pd.errors.EmptyDataError:
+            logger.error(f"{filename} is empty or has no columns to parse")
+            return pd.DataFrame()
+
+        except Exception as e:
+            logger.error(f"Error reading {filename} from {self.bucket_name}: {e}", exc_info=True)
+            return pd.DataFrame()
+
+    def read_bytes(self, filename: str) -> Optional[bytes]:
+        """Raw file contents, or None if the file doesn't exist"""
+        logger.info(f"[{self.backend_name}] Reading {filename} from {self.bucket_name}")
+        with span('storage.download', **{'storage.backend': self.backend_name, 'storage.bucket': self.bucket_name, 'file': filename}) as current:
+            content = self._read_bytes(filename)
+            self._simulate_request(len(content or b''))
+            record_io(self.backend_name, 'read', filename, downloaded=len(content or b''))
+            current.set_attribute('bytes', len(content or b''))
+        if content is None:
+            logger.warning(f"{filename} does not exist in {self.bucket_name}")
+        return content
+
+    def write_csv(self, df: pd.DataFrame, filename: str) -> bool:
+        """Write DataFrame as CSV; True if successful"""
+        return self.write_from_bytes(df.to_csv(index=False).encode('utf-8'), filename)
+
+    def write_from_bytes(self, content: bytes, filename: str, content_type: str = 'text/csv') -> bool:
+        """Write raw bytes; True if successful"""
+        try:
+            self._simulate_request(len(content))
+            record_io(self.backend_name, 'write', filename, uploaded=len(content))
+            self._write_bytes(filename, content)
+            logger.info(f"Successfully wrote {filename} to {self.bucket_name}")
+            return True
+        except Exception as e:
+            logger.error(f"Error writing {filename} to {self.bucket_name}: {e}")
+            return False
+
+    def file_exists(self, filename: str) -> bool:
+        self._simulate_request()
+        record_io(self.backend_name, 'exists', filename)
+        return self._size(filename) is not None
+
+    def list_files(self, prefix: str = '') -> list:
+        self._simulate_request()
+        record_io(self.backend_name, 'list', f'{prefix}*')
+        return sorted(name for name in self._names() if name.startswith(prefix))
+
+    def list_generations(self, prefix: str = '') -> dict:
+        """{name: generation} of the files under prefix, from a single listing; a file's generation changes whenever it is rewritten"""
+        self._simulate_request()
+        record_io(self.backend_name, 'list', f'{prefix}*')
+        generations = {}
+        for name in self._names():
+            if name.startswith(prefix):
+                generation = self._generation(name)
+                if generation is not None:
+                    generations[name] = generation
+        return generations
+
+    def get_file_size(self, filename: str) -> int:
+        self._simulate_request()
+        record_io(self.backend_name, 'size', filename)
+        return self._size(filename) or 0
+
+    def read_versioned(self, filename: str) -> tuple:
+        """Contents and generation of a file for write_if_generation(); (None, None) if it doesn't exist"""
+        with self._exclusive(filename):
+            generation = self._version(filename)
+            content = self.read_bytes(filename) if generation is not None else None
+        return content, generation
+
+    def write_if_generation(self, content: bytes, filename: str, generation: Optional[str],
+                            content_type: str = 'application/json') -> bool:
+        """
+        Write raw bytes only if the file is still at a generation.
+
+        Args:
+            generation: From read_versioned() (None: only if the file doesn't exist)
+
+        Returns:
+            True if written, False if the file changed in between or the write failed
+        """
+        with self._exclusive(filename):
+            if self._version(filename) != generation:
+                return False
+            return self.write_from_bytes(content, filename, content_type)
+
+    def delete_files(self, filenames: list) -> int:
+        """Delete files (missing ones are skipped); the number deleted"""
+        deleted = 0
+        for filename in filenames:
+            self._simulate_request()
+            record_io(self.backend_name, 'delete', filename)
+            try:
+                self._delete(filename)
+                deleted += 1
+            except (FileNotFoundError, KeyError):
+                pass
+        return deleted
+
+
+class LocalStorage(SimulatedStorage):
+    """Backend reading and writing files in a local directory"""
+
+    backend_name = 'local'
+
+    def __init__(self, directory: str, latency_ms: float = 0, bandwidth_mbps: float = 0):
+        super().__init__(directory, latency_ms, bandwidth_mbps)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, filename: str) -> str:
+        path = os.path.abspath(os.path.join(self.directory, filename))
+        if not path.startswith(os.path.abspath(self.directory) + os.sep):
+            raise ValueError(f"Invalid filename: {filename}")
+        return path
+
+    def _read_bytes(self, filename: str) -> Optional[bytes]:
+        try:
+            with open(self._path(filename), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_bytes(self, filename: str, content: bytes):
+        path = self._path(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _size(self, filename: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._path(filename))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _names(self) -> list:
+        names = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(('.tmp', '.lock')):
+                    names.append(os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, '/'))
+        return names
+
+    def _generation(self, filename: str) -> Optional[str]:
+        try:
+            stat = os.stat(self._path(filename))
+        except (FileNotFoundError, ValueError):
+            return None
+        return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+    def _version(self, filename: str) -> Optional[str]:
+        # Every write replaces the file, so the inode tells writes within one mtime tick apart
+        try:
+            stat = os.stat(self._path(filename))
+        except (FileNotFoundError, ValueError):
+            return None
+        return f'{stat.st_ino}-{stat.st_mtime_ns}-{stat.st_size}'
+
+    @contextmanager
+    def _exclusive(self, filename: str):
+        path = self._path(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f'{path}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _delete(self, filename: str):
+        path = self._path(filename)
+        os.remove(path)
+        # Drop directories left empty (like object storage prefixes)
+        root, parent = os.path.abspath(self.directory), os.path.dirname(path)
+        while parent != root:
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+
+class MemoryStorage(SimulatedStorage):
+    """Backend holding files in memory (per process), e.g. for benchmarks and load tests"""
+
+    backend_name = 'memory'
+
+    def __init__(self, files: Optional[dict] = None, bucket_name: str = 'memory',
+                 latency_ms: float = 0, bandwidth_mbps: float = 0):
+        super().__init__(bucket_name, latency_ms, bandwidth_mbps)
+        self.files = dict(files or {})
+        # Never reused, so a deleted and rewritten file gets a new generation too
+        self._counter = itertools.count(1)
+        self._generations = {name: next(self._counter) for name in self.files}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_directory(cls, directory: str, **kwargs) -> 'MemoryStorage':
+        """Create a memory backend preloaded with the files of a local directory"""
+        local = LocalStorage(directory)
+        return cls({name: local._read_bytes(name) for name in local._names()}, bucket_name=f'memory:{directory}', **kwargs)
+
+    def _read_bytes(self, filename: str) -> Optional[bytes]:
+        return self.files.get(filename)
+
+    def _write_bytes(self, filename: str, content: bytes):
+        with self._lock:
+            self.files[filename] = content
+            self._generations[filename] = next(self._counter)
+
+    def _size(self, filename: str) -> Optional[int]:
+        content = self.files.get(filename)
+        return None if content is None else len(content)
+
+    def _names(self) -> list:
+        return list(self.files)
+
+    def _generation(self, filename: str) -> Optional[str]:
+        generation = self._generations.get(filename)
+        return None if generation is None else str(generation)
+
+    def _exclusive(self, filename: str):
+        return self._lock
+
+    def _delete(self, filename: str):
+        with self._lock:
+            del self.files[filename]
+            self._generations.pop(filename, None)
@@ -0,0 +1,176 @@
+"""
+OpenTelemetry tracing for Cloud Run.
+Spans cover the stages of a report request - storage download, CSV parse,
+DataFrame transforms, scrapes, database queries and template rendering - so
+a slow page can be attributed to the stage that is actually slow.
+
+Tracing is off unless TRACING_EXPORTER is set; while off, `span()` only
+feeds the Server-Timing header and the OpenTelemetry SDK is never imported.
+"""
+import functools
+import importlib
+import logging
+import os
+from contextlib import contextmanager
+from typing import Callable, Optional
+from app.utils.server_timing import current_timer
+
+logger = logging.getLogger(__name__)
+
+# Set by init_tracing() when an exporter is configured
+_tracer = None
+
+
+class _NoopSpan:
+    """Stands in for a span while tracing is disabled"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def record_exception(self, exception, attributes=None):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+# Exporter factories by name: factory(app) -> SpanExporter
+EXPORTERS = {}
+
+
+def register_exporter(name: str):
+    """Register a span exporter factory under a TRACING_EXPORTER name"""
+    def decorator(factory: Callable):
+        EXPORTERS[name] = factory
+        return factory
+    return decorator
+
+
+@register_exporter('console')
+def _console_exporter(app):
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+    return ConsoleSpanExporter()
+
+
+@register_exporter('file')
+def _file_exporter(app):
+    """One JSON span per line, appended to TRACING_FILE"""
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+    path = app.config.get('TRACING_FILE', 'traces.jsonl')
+    return ConsoleSpanExporter(
+        out=open(path, 'a', buffering=1),
+        formatter=lambda span_data: span_data.to_json(indent=None) + os.linesep
+    )
+
+
+@register_exporter('otlp')
+def _otlp_exporter(app):
+    """OTLP over HTTP (endpoint from OTEL_EXPORTER_OTLP_ENDPOINT) - needs opentelemetry-exporter-otlp-proto-http"""
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    return OTLPSpanExporter()
+
+
+@register_exporter('gcp')
+def _cloud_trace_exporter(app):
+    """Google Cloud Trace - needs opentelemetry-exporter-gcp-trace"""
+    from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
+    return CloudTraceSpanExporter(project_id=app.config.get('GCP_PROJECT_ID'))
+
+
+def _create_exporter(app, name: str):
+    """Build the exporter for a registered name or a 'module:factory' path"""
+    if name in EXPORTERS:
+        return EXPORTERS[name](app)
+    if ':' in name:
+        module_name, factory_name = name.split(':', 1)
+        return getattr(importlib.import_module(module_name), factory_name)(app)
+    raise ValueError(f"Unknown TRACING_EXPORTER '{name}'. Available: {', '.join(sorted(EXPORTERS))}")
+
+
+def init_tracing(app) -> bool:
+    """
+    Set up the tracer provider and Flask request spans from TRACING_* config.
+
+    Returns:
+        True if tracing is enabled
+    """
+    global _tracer
+    exporter_name = app.config.get('TRACING_EXPORTER', 'none')
+    if not exporter_name or exporter_name == 'none':
+        return False
+
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+        exporter = _create_exporter(app, exporter_name)
+    except Exception as e:
+        logger.warning(f"Tracing disabled - could not set up exporter '{exporter_name}': {e}")
+        return False
+
+    provider = TracerProvider(
+        resource=Resource.create({'service.name': app.config.get('TRACING_SERVICE_NAME', 'reports-app')}),
+        sampler=ParentBased(TraceIdRatioBased(app.config.get('TRACING_SAMPLE_RATIO', 1.0)))
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer('app')
+
+    try:
+        from opentelemetry.instrumentation.flask import FlaskInstrumentor
+        FlaskInstrumentor().instrument_app(app, excluded_urls='health,ready,static')
+    except ImportError as e:
+        logger.warning(f"Flask instrumentation not available ({e}) - only stage spans will be recorded")
+
+    logger.info(f"Tracing enabled (exporter: {exporter_name}, sample ratio: {app.config.get('TRACING_SAMPLE_RATIO', 1.0)})")
+    return True
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Record a span around a block; attributes with a None value are skipped.
+    The block's duration also goes into the request's Server-Timing header.
+
+    Usage:
+        with span('storage.read_csv', file=filename) as current:
+            ...
+            current.set_attribute('rows', len(df))
+    """
+    timer = current_timer()
+    if timer is not None:
+        timer.start()
+    try:
+        if _tracer is None:
+            yield _NOOP_SPAN
+            return
+        with _tracer.start_as_current_span(name) as current:
+            for key, value in attributes.items():
+                if value is not None:
+                    current.set_attribute(key, value)
+            yield current
+    finally:
+        if timer is not None:
+            timer.stop(name)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator recording a span around every call of a function"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
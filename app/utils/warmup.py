@@ -0,0 +1,135 @@
+"""
+Startup warmup for freshly started Cloud Run instances.
+Initializes the storage client and database pool and preloads the small,
+hot datasets, so the first user after a scale-from-zero doesn't pay for it.
+/ready reports the instance as ready only once warmup has finished.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupState:
+    """Progress and timings of the warmup phase for this process"""
+
+    def __init__(self):
+        self.status = 'pending'  # pending | running | done | disabled
+        self.duration_ms = None
+        self.steps_ms = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ('done', 'disabled')
+
+    def begin(self) -> bool:
+        """Mark warmup as running; False if it already ran or is running"""
+        with self._lock:
+            if self.status != 'pending':
+                return False
+            self.status = 'running'
+            return True
+
+    def to_dict(self) -> dict:
+        return {
+            'status': self.status,
+            'duration_ms': self.duration_ms,
+            'steps_ms': dict(self.steps_ms),
+            'errors': dict(self.errors),
+        }
+
+
+warmup_state = WarmupState()
+
+
+def _timed_step(name: str, func):
+    """Run one warmup step, recording its duration and any error"""
+    started = time.perf_counter()
+    try:
+        func()
+    except Exception as e:
+        warmup_state.errors[name] = str(e)
+        logger.warning(f"Warmup step {name} failed: {e}")
+    finally:
+        warmup_state.steps_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def _warm_storage():
+    """Create the storage client (and probe which backend to use)"""
+    from app.utils.gcs_client import GCSManager
+    from app.utils.s3_client import S3Manager
+    from app.utils.storage import get_storage_manager
+
+    storage_manager = get_storage_manager()
+    if isinstance(storage_manager, GCSManager):
+        storage_manager.bucket
+    elif isinstance(storage_manager, S3Manager):
+        storage_manager.s3_client
+
+
+def _warm_database():
+    """Open a pooled database connection"""
+    from app.utils.database import db_manager, text
+
+    with db_manager.engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+def _warm_dataset(filename: str):
+    """Download and parse a dataset into the in-process cache"""
+    from app.utils.datasets import dataset_cache, dataset_path, read_shared
+
+    df = dataset_cache.get(dataset_path(filename), read_shared)
+    if df.empty:
+        raise ValueError(f"{filename} is empty or missing")
+
+
+def run_warmup(app):
+    """Run all warmup steps in the current thread"""
+    from app.utils.database import get_configured_database_url
+
+    started = time.perf_counter()
+    logger.info("Starting warmup")
+    with app.app_context():
+        _timed_step('storage_client', _warm_storage)
+        if get_configured_database_url():
+            _timed_step('database', _warm_database)
+        for filename in app.config.get('WARMUP_DATASETS', []):
+            _timed_step(filename, lambda: _warm_dataset(filename))
+
+    warmup_state.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    warmup_state.status = 'done'
+    logger.info(
+        f"Warmup finished in {warmup_state.duration_ms} ms: {warmup_state.steps_ms}"
+        + (f" (errors: {warmup_state.errors})" if warmup_state.errors else "")
+    )
+
+
+def start_warmup(app, allow_threads: bool = True):
+    """
+    Start warmup according to WARMUP_MODE:
+    'off' - no warmup, ready immediately
+    'background' - warm in a daemon thread while the server starts
+    'blocking' - warm before returning (the worker serves only once warm)
+
+    With allow_threads=False (gunicorn preload, before fork) a background
+    warmup stays pending until the worker calls this again after fork.
+    """
+    mode = app.config.get('WARMUP_MODE', 'off')
+    if mode not in ('background', 'blocking'):
+        warmup_state.status = 'disabled'
+        return
+
+    if mode == 'background' and not allow_threads:
+        return
+
+    if not warmup_state.begin():
+        return
+
+    if mode == 'blocking':
+        run_warmup(app)
+    else:
+        threading.Thread(target=run_warmup, args=(app,), name='warmup', daemon=True).start()
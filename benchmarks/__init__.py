@@ -0,0 +1,4 @@
+"""
+Local benchmarks for the Reports App.
+Run individual suites with `python -m benchmarks.<name>` from the repository root.
+"""
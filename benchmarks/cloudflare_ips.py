@@ -0,0 +1,77 @@
+"""
+Benchmark Cloudflare IP lookups: bisect matcher vs the previous linear scan.
+
+Usage:
+    python -m benchmarks.cloudflare_ips [--iterations 200000]
+"""
+import argparse
+import ipaddress
+import json
+import random
+import timeit
+
+from app.utils.cloudflare_ips import (
+    BUNDLED_CLOUDFLARE_IPV4,
+    BUNDLED_CLOUDFLARE_IPV6,
+    IPRangeMatcher,
+)
+
+
+def linear_lookup(networks, client_ip: str) -> bool:
+    """Previous implementation - any() over ipaddress networks"""
+    try:
+        client_ip_obj = ipaddress.ip_address(client_ip)
+        return any(client_ip_obj in network for network in networks)
+    except ValueError:
+        return False
+
+
+def sample_ips(count: int, seed: int = 42) -> list:
+    """Mix of Cloudflare hits, IPv4 misses and IPv6 addresses"""
+    rng = random.Random(seed)
+    hits = [ipaddress.ip_network(cidr) for cidr in BUNDLED_CLOUDFLARE_IPV4 + BUNDLED_CLOUDFLARE_IPV6]
+    ips = []
+    for i in range(count):
+        if i % 3 == 0:
+            network = rng.choice(hits)
+            offset = rng.randrange(network.num_addresses)
+            ips.append(str(network.network_address + offset))
+        elif i % 3 == 1:
+            ips.append(str(ipaddress.IPv4Address(rng.getrandbits(32))))
+        else:
+            ips.append(str(ipaddress.IPv6Address(rng.getrandbits(128))))
+    return ips
+
+
+def run(iterations: int) -> dict:
+    cidrs = BUNDLED_CLOUDFLARE_IPV4 + BUNDLED_CLOUDFLARE_IPV6
+    matcher = IPRangeMatcher(cidrs)
+    networks = [ipaddress.ip_network(cidr) for cidr in cidrs]
+    ips = sample_ips(1000)
+
+    for ip in ips:
+        assert matcher.contains(ip) == linear_lookup(networks, ip), ip
+
+    rounds = max(iterations // len(ips), 1)
+    bisect_seconds = timeit.timeit(lambda: [matcher.contains(ip) for ip in ips], number=rounds)
+    linear_seconds = timeit.timeit(lambda: [linear_lookup(networks, ip) for ip in ips], number=rounds)
+    lookups = rounds * len(ips)
+
+    return {
+        'ranges': len(cidrs),
+        'lookups': lookups,
+        'bisect_us_per_lookup': round(bisect_seconds / lookups * 1e6, 3),
+        'linear_us_per_lookup': round(linear_seconds / lookups * 1e6, 3),
+        'speedup': round(linear_seconds / bisect_seconds, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.iterations), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Startup profiler: import-time breakdown for `app.main` (import + create_app).
+
+Runs the import in a fresh interpreter with `-X importtime`, reports the
+slowest modules and the per-package breakdown, and exits non-zero if the
+import exceeds the time budget or pulls in a heavy dependency that should
+only load on first use. Use it as a cold-start gate in CI.
+
+Usage:
+    python -m benchmarks.import_time [--budget-ms 800] [--runs 3] [--json]
+
+The budget can also be set with the IMPORT_TIME_BUDGET_MS environment variable.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+DEFAULT_BUDGET_MS = 800
+
+# Must not be imported at startup - they load on first use of the routes that need them
+DEFERRED_MODULES = [
+    'pandas',
+    'numpy',
+    'boto3',
+    'botocore',
+    'google.cloud.storage',
+    'bs4',
+    'sqlalchemy',
+    'psycopg2',
+    'opentelemetry.sdk',
+]
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+PROBE = (
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import app.main\n"
+    "elapsed = time.perf_counter() - started\n"
+    "print(json.dumps([elapsed, sorted(sys.modules)]))\n"
+)
+
+
+def profile_once(env: dict) -> dict:
+    """Import app.main in a fresh interpreter and collect timings"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        capture_output=True, text=True, env=env, check=True
+    )
+    elapsed, loaded = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    modules = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules.append({
+                'module': name,
+                'self_ms': int(self_us) / 1000,
+                'cumulative_ms': int(cumulative_us) / 1000,
+            })
+    return {'elapsed_ms': elapsed * 1000, 'modules': modules, 'loaded': set(loaded)}
+
+
+def breakdown(modules: list) -> dict:
+    """Self time aggregated by top-level package"""
+    packages = defaultdict(float)
+    for module in modules:
+        packages[module['module'].split('.')[0]] += module['self_ms']
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def run(runs: int, top: int) -> dict:
+    env = dict(os.environ)
+    env.setdefault('ENABLE_CACHE', 'false')
+    env.setdefault('LOG_LEVEL', 'ERROR')
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    profiles = [profile_once(env) for _ in range(runs)]
+    best = min(profiles, key=lambda profile: profile['elapsed_ms'])
+    slowest = sorted(best['modules'], key=lambda module: module['self_ms'], reverse=True)[:top]
+
+    return {
+        'elapsed_ms': round(best['elapsed_ms'], 1),
+        'runs_ms': [round(profile['elapsed_ms'], 1) for profile in profiles],
+        'packages_ms': {name: round(ms, 1) for name, ms in list(breakdown(best['modules']).items())[:top]},
+        'slowest_modules_ms': {module['module']: round(module['self_ms'], 1) for module in slowest},
+        'deferred_loaded': [name for name in DEFERRED_MODULES if name in best['loaded']],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float,
+                        default=float(os.getenv('IMPORT_TIME_BUDGET_MS', DEFAULT_BUDGET_MS)))
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    report = run(args.runs, args.top)
+    report['budget_ms'] = args.budget_ms
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"app.main import: {report['elapsed_ms']} ms (budget {args.budget_ms} ms, runs {report['runs_ms']})")
+        print("\nSelf time by package:")
+        for name, ms in report['packages_ms'].items():
+            print(f"  {name:<30} {ms:>8.1f} ms")
+        print("\nSlowest modules:")
+        for name, ms in report['slowest_modules_ms'].items():
+            print(f"  {name:<50} {ms:>8.1f} ms")
+
+    failures = []
+    if report['elapsed_ms'] > args.budget_ms:
+        failures.append(f"import took {report['elapsed_ms']} ms, budget is {args.budget_ms} ms")
+    if report['deferred_loaded']:
+        failures.append(f"deferred modules imported at startup: {', '.join(report['deferred_loaded'])}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
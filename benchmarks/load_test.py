@@ -0,0 +1,300 @@
+"""
+Concurrent load test against gunicorn, simulating Cloud Run request concurrency.
+
+For every workers x threads configuration, starts the app under gunicorn
+(gunicorn.conf.py) on synthetic data served from the offline storage
+backend (DATA_SOURCE=memory or local, with simulated bucket latency), then
+drives it with `--concurrency` parallel clients - Cloud Run sends up to
+containerConcurrency (80) requests to one instance at once.
+
+Scenarios:
+    mixed   - weighted mix of report pages on a warm instance
+    refresh - the same mix while /refresh_cache runs every few seconds
+    cold    - the mix fired at a freshly started instance (empty caches)
+
+Reported per configuration and scenario: p50/p95/p99 latency, throughput,
+errors, queueing (client latency minus the app time from Server-Timing, i.e.
+time waiting for a free gunicorn thread) and peak RSS per worker.
+
+Usage:
+    python -m benchmarks.load_test [--configs 1x8,2x4,4x2] [--concurrency 80]
+                                   [--duration 20] [--scenarios mixed,refresh,cold]
+                                   [--rows 10000] [--latency-ms 30] [--output results.json]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.synthetic import generate_csv
+
+# (route, weight) - roughly how often each page is opened
+PAGE_MIX = [
+    ('/monthly_report', 6),
+    ('/monthly_report?location=LOC-001', 2),
+    ('/vinfo_report', 3),
+    ('/vhosts_report', 2),
+    ('/statistics_report', 2),
+    ('/alerts_report', 2),
+    ('/snapshot_report', 1),
+    ('/vhealth_report', 1),
+    ('/firmware_report', 1),
+    ('/vdisk_report', 1),
+    ('/network_utilization_report', 1),
+    ('/certificate_expiry_report', 1),
+    ('/password_expiration_report', 1),
+    ('/antivirus_asset_report', 1),
+    ('/env_versions_report', 1),
+]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def worker_pids(master_pid: int) -> list:
+    """PIDs of the gunicorn workers (children of the master)"""
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def rss_mb(pid: int) -> float:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class Server:
+    """gunicorn running the app on a free local port"""
+
+    def __init__(self, workers: int, threads: int, data_dir: str, storage: str, latency_ms: float, log_path: str):
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.shared_dir = tempfile.mkdtemp(prefix='reports-load-shared-')
+        env = dict(os.environ)
+        env.update({
+            'PORT': str(self.port), 'WORKERS': str(workers), 'THREADS': str(threads),
+            'DATA_SOURCE': storage, 'LOCAL_STORAGE_DIR': data_dir, 'STORAGE_LATENCY_MS': str(latency_ms),
+            'REQUIRE_CLOUDFLARE': 'false', 'ENABLE_CACHE': 'false', 'LOG_LEVEL': 'WARNING',
+            # App time per request is read from the header
+            'SERVER_TIMING': 'true',
+            # Fresh shared-dataset directory, so every server starts cold
+            'SHARED_DATASET_DIR': self.shared_dir,
+        })
+        self._log = open(log_path, 'ab')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'app.main:app'],
+            cwd=REPO_ROOT, env=env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        self.peak_rss = {}
+        self._sampling = False
+
+    def wait_healthy(self, timeout: float = 60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with code {self.process.returncode} (see {self._log.name})")
+            try:
+                if requests.get(f'{self.url}/health', timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"gunicorn did not become healthy in {timeout}s")
+
+    def start_rss_sampling(self, interval: float = 0.5):
+        self._sampling = True
+
+        def sample():
+            while self._sampling:
+                for index, pid in enumerate(sorted(worker_pids(self.process.pid))):
+                    self.peak_rss[index] = max(self.peak_rss.get(index, 0.0), rss_mb(pid))
+                time.sleep(interval)
+        threading.Thread(target=sample, daemon=True).start()
+
+    def stop(self):
+        self._sampling = False
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._log.close()
+        shutil.rmtree(self.shared_dir, ignore_errors=True)
+
+
+def server_total_ms(response) -> float:
+    """App time from the Server-Timing header (None if missing)"""
+    for metric in response.headers.get('Server-Timing', '').split(','):
+        name, _, duration = metric.strip().partition(';dur=')
+        if name == 'total' and duration:
+            return float(duration)
+    return None
+
+
+def client_loop(url: str, deadline: float, seed: int, samples: list, lock: threading.Lock):
+    """One simulated user: request pages from the mix until the deadline"""
+    rng = random.Random(seed)
+    routes, weights = zip(*PAGE_MIX)
+    session = requests.Session()
+    while time.time() < deadline:
+        route = rng.choices(routes, weights)[0]
+        started = time.perf_counter()
+        try:
+            response = session.get(url + route, timeout=120)
+            latency_ms = (time.perf_counter() - started) * 1000
+            sample = (route, latency_ms, response.status_code, server_total_ms(response))
+        except requests.RequestException:
+            sample = (route, (time.perf_counter() - started) * 1000, None, None)
+        with lock:
+            samples.append(sample)
+
+
+def refresh_loop(url: str, deadline: float, interval: float, results: list):
+    """Trigger a data refresh every `interval` seconds and poll it until it finishes"""
+    while time.time() + interval < deadline:
+        time.sleep(interval)
+        started = time.perf_counter()
+        try:
+            response = requests.post(f'{url}/refresh_cache', headers={'Accept': 'application/json'}, timeout=30)
+            status = response.status_code
+            job = response.json() if status == 202 else {}
+            while job.get('status') in ('started', 'running') and time.time() < deadline + 300:
+                time.sleep(0.5)
+                job = requests.get(f"{url}{job['status_url']}", timeout=30).json()
+            if job:
+                status = job['status']
+        except requests.RequestException:
+            status = None
+        results.append({'status': status, 'ms': round((time.perf_counter() - started) * 1000, 1)})
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))], 1) if ordered else None
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    latencies = [latency for _, latency, status, _ in samples if status == 200]
+    queueing = [latency - total for _, latency, status, total in samples if status == 200 and total is not None]
+    per_route = {}
+    for route, latency, status, _ in samples:
+        if status == 200:
+            per_route.setdefault(route, []).append(latency)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, status, _ in samples if status != 200),
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': round(max(latencies), 1) if latencies else None,
+        'queue_p50_ms': percentile(queueing, 50),
+        'queue_p95_ms': percentile(queueing, 95),
+        'routes_p50_ms': {route: round(statistics.median(values), 1) for route, values in sorted(per_route.items())},
+    }
+
+
+def run_scenario(scenario: str, workers: int, threads: int, args, data_dir: str, log_path: str) -> dict:
+    server = Server(workers, threads, data_dir, args.storage, args.latency_ms, log_path)
+    try:
+        server.wait_healthy()
+        if scenario != 'cold':
+            # Warm every worker's caches before measuring
+            for route, _ in PAGE_MIX:
+                for _ in range(workers * 2):
+                    requests.get(server.url + route, timeout=300)
+        server.start_rss_sampling()
+
+        samples, lock, refreshes = [], threading.Lock(), []
+        deadline = time.time() + args.duration
+        clients = [
+            threading.Thread(target=client_loop, args=(server.url, deadline, seed, samples, lock))
+            for seed in range(args.concurrency)
+        ]
+        if scenario == 'refresh':
+            clients.append(threading.Thread(target=refresh_loop, args=(server.url, deadline, args.refresh_interval, refreshes)))
+
+        started = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - started
+
+        result = summarize(samples, elapsed)
+        result['peak_rss_mb_per_worker'] = {str(index): round(mb, 1) for index, mb in sorted(server.peak_rss.items())}
+        result['peak_rss_mb_total'] = round(sum(server.peak_rss.values()), 1)
+        if scenario == 'refresh':
+            result['refreshes'] = refreshes
+        return result
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', default='1x8,2x4,4x2', help='Comma-separated WORKERSxTHREADS')
+    parser.add_argument('--concurrency', type=int, default=80, help='Parallel clients (Cloud Run containerConcurrency)')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per scenario')
+    parser.add_argument('--scenarios', default='mixed,refresh,cold')
+    parser.add_argument('--rows', type=int, default=10000, help='Rows per synthetic dataset')
+    parser.add_argument('--storage', choices=['memory', 'local'], default='memory')
+    parser.add_argument('--latency-ms', type=float, default=30, help='Simulated storage round trip')
+    parser.add_argument('--refresh-interval', type=float, default=5, help='Seconds between refreshes (refresh scenario)')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = {
+        'concurrency': args.concurrency, 'duration_s': args.duration, 'rows': args.rows,
+        'storage': args.storage, 'latency_ms': args.latency_ms, 'configs': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='reports-load-') as data_dir:
+        for filename, content in generate_csv(args.rows).items():
+            with open(os.path.join(data_dir, filename), 'wb') as f:
+                f.write(content)
+        log_path = os.path.join(tempfile.gettempdir(), 'reports-load-test.log')
+
+        for config in args.configs.split(','):
+            workers, threads = (int(value) for value in config.lower().split('x'))
+            results['configs'][config] = {}
+            for scenario in args.scenarios.split(','):
+                print(f"[{config}] {scenario}: {args.concurrency} clients for {args.duration}s", file=sys.stderr)
+                result = run_scenario(scenario, workers, threads, args, data_dir, log_path)
+                results['configs'][config][scenario] = result
+                print(f"  {result['throughput_rps']} req/s, p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+                      f"p99 {result['p99_ms']} ms, queue p95 {result['queue_p95_ms']} ms, errors {result['errors']}, "
+                      f"RSS {result['peak_rss_mb_total']} MB", file=sys.stderr)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Microbenchmarks for the before_request/after_request stack.
+
+Reports per-request overhead in microseconds for the Cloudflare protection
+middleware (each verdict path), the security-header hook, and a full
+test-client round trip with and without the hooks installed.
+
+Usage:
+    python -m benchmarks.middleware [--iterations 20000]
+"""
+import argparse
+import json
+import logging
+import os
+import timeit
+
+os.environ.setdefault('ENABLE_CACHE', 'false')
+os.environ.setdefault('REQUIRE_CLOUDFLARE', 'true')
+
+from werkzeug.exceptions import Forbidden  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.config import Config  # noqa: E402
+from app.utils.cloudflare_ips import stop_background_refresh  # noqa: E402
+from app.utils.cloudflare_protection import cloudflare_protection_middleware  # noqa: E402
+
+ALLOWED_HOST = Config.ALLOWED_HOSTS[0]
+
+# name -> (path, headers, remote_addr)
+SCENARIOS = {
+    'cloudflare_headers': ('/', {'Host': ALLOWED_HOST, 'CF-Connecting-IP': '203.0.113.7', 'CF-Ray': 'abc'}, '104.16.0.1'),
+    'worker_cloud_run_host': ('/', {'Host': 'reports-app-abc.a.run.app', 'CF-Ray': 'abc'}, '104.16.0.1'),
+    'ip_range_fallback': ('/', {'Host': ALLOWED_HOST}, '104.16.0.1'),
+    'blocked_direct': ('/', {'Host': 'reports-app-abc.a.run.app'}, '203.0.113.7'),
+    'static_asset': ('/static/style.css', {'Host': 'reports-app-abc.a.run.app'}, '203.0.113.7'),
+}
+
+
+def time_per_call(func, iterations: int) -> float:
+    """Best-of-3 time per call in microseconds"""
+    func()
+    return round(min(timeit.repeat(func, number=iterations, repeat=3)) / iterations * 1e6, 3)
+
+
+def bench_middleware(app, iterations: int) -> dict:
+    results = {}
+    for name, (path, headers, remote_addr) in SCENARIOS.items():
+        with app.test_request_context(path, headers=headers, environ_base={'REMOTE_ADDR': remote_addr}):
+            def call():
+                try:
+                    cloudflare_protection_middleware()
+                except Forbidden:
+                    pass
+            results[name] = time_per_call(call, iterations)
+    return results
+
+
+def bench_security_headers(app, iterations: int) -> float:
+    with app.test_request_context('/'):
+        response = app.response_class('')
+        return time_per_call(lambda: app.process_response(response), iterations)
+
+
+def add_bench_route(app):
+    app.add_url_rule('/_bench', 'bench', lambda: '')
+    return app
+
+
+def bench_round_trip(app, iterations: int) -> dict:
+    bare = add_bench_route(create_app())
+    bare.before_request_funcs.clear()
+    bare.after_request_funcs.clear()
+
+    headers = SCENARIOS['cloudflare_headers'][1]
+    with_hooks_client = app.test_client()
+    without_hooks_client = bare.test_client()
+    with_hooks = time_per_call(lambda: with_hooks_client.get('/_bench', headers=headers), iterations)
+    without_hooks = time_per_call(lambda: without_hooks_client.get('/_bench', headers=headers), iterations)
+    return {
+        'with_hooks_us': with_hooks,
+        'without_hooks_us': without_hooks,
+        'hook_overhead_us': round(with_hooks - without_hooks, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    app = add_bench_route(create_app())
+    stop_background_refresh()
+    logging.disable(logging.CRITICAL)
+
+    results = {
+        'middleware_us': bench_middleware(app, args.iterations),
+        'security_headers_us': bench_security_headers(app, args.iterations),
+        'round_trip': bench_round_trip(app, max(args.iterations // 20, 100)),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""
+End-to-end benchmark of every report route on synthetic data.
+
+Generates the datasets at each scale (benchmarks.synthetic), serves them
+from the in-memory storage backend (optionally with simulated bucket
+latency/bandwidth) and times each route with the Flask test client. The web scrapes behind the VMware version pages
+are replaced with fixed version tables so no network access is needed.
+
+Two modes per route:
+    cold - dataset caches cleared before every request (download + parse + transform + render)
+    warm - datasets already cached in the worker (transform + render only)
+
+Each result carries latency stats, response size, logged errors and the
+median Server-Timing breakdown per stage, as JSON.
+
+Usage:
+    python -m benchmarks.routes [--scales 1000,10000,100000] [--repeat 5]
+                                [--mode cold,warm] [--routes /vinfo_report,...] [--output results.json]
+                                [--latency-ms 30] [--bandwidth-mbps 400]
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from unittest import mock
+
+os.environ.setdefault('ENABLE_CACHE', 'false')
+os.environ.setdefault('REQUIRE_CLOUDFLARE', 'false')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+os.environ.setdefault('WARMUP_MODE', 'off')
+os.environ.setdefault('SHARED_DATASETS', 'false')
+os.environ.setdefault('SERVER_TIMING', 'true')
+
+import pandas as pd  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.utils.datasets import invalidate_dataset  # noqa: E402
+from app.utils.storage_backends import MemoryStorage  # noqa: E402
+from benchmarks.synthetic import ESXI_VERSIONS, VCENTER_VERSIONS, generate_csv  # noqa: E402
+
+ROUTES = [
+    '/monthly_report',
+    '/monthly_report?location=LOC-001',
+    '/snapshot_report',
+    '/vhealth_report',
+    '/firmware_report',
+    '/vinfo_report',
+    '/vdisk_report',
+    '/vhosts_report',
+    '/statistics_report',
+    '/network_utilization_report',
+    '/certificate_expiry_report',
+    '/password_expiration_report',
+    '/antivirus_asset_report',
+    '/env_versions_report',
+    '/alerts_report',
+    '/vmware_versions_report',
+    '/get_vhosts_data',
+    '/get_vinfo_data',
+    '/get_trend_data?location=LOC-001',
+]
+
+
+def fake_esxi_versions(url=None) -> pd.DataFrame:
+    """Stand-in for scrape_vmware_versions"""
+    rows = [
+        [f'ESXi {version[:3]} build {build}', build, '2023-01-01', 'ISO', f'N-{i}' if i else 'N']
+        for i, (version, build) in enumerate(ESXI_VERSIONS)
+    ]
+    return pd.DataFrame(rows, columns=['Version', 'Build Number', 'Release Date', 'Available As', 'Label'])
+
+
+def fake_vcenter_versions() -> list:
+    """Stand-in for scrape_vcenter_versions"""
+    return [
+        {'Release Name': f'vCenter {version}', 'Version': version, 'Date': '2023-01-01',
+         'Build Version': build, 'Label': f'N-{i}' if i else 'N'}
+        for i, (version, build) in enumerate(VCENTER_VERSIONS)
+    ]
+
+
+class ErrorCounter(logging.Handler):
+    """Counts ERROR records (routes catch exceptions and render an empty page)"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def parse_server_timing(header: str) -> dict:
+    timings = {}
+    for metric in filter(None, (part.strip() for part in (header or '').split(','))):
+        name, _, duration = metric.partition(';dur=')
+        if duration:
+            timings[name] = float(duration)
+    return timings
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def time_route(client, route: str, repeat: int, cold: bool, errors: ErrorCounter) -> dict:
+    """Request a route `repeat` times and summarize latency and stage timings"""
+    if not cold:
+        client.get(route)
+
+    durations, stages, size = [], [], 0
+    errors.count = 0
+    status = None
+    for _ in range(repeat):
+        if cold:
+            invalidate_dataset()
+        started = time.perf_counter()
+        response = client.get(route)
+        durations.append((time.perf_counter() - started) * 1000)
+        stages.append(parse_server_timing(response.headers.get('Server-Timing')))
+        status, size = response.status_code, len(response.data)
+
+    stage_names = sorted({name for timing in stages for name in timing if name != 'total'})
+    return {
+        'status': status,
+        'errors': errors.count,
+        'response_kb': round(size / 1024, 1),
+        'min_ms': round(min(durations), 2),
+        'median_ms': round(statistics.median(durations), 2),
+        'p95_ms': round(percentile(durations, 95), 2),
+        'max_ms': round(max(durations), 2),
+        'stages_ms': {
+            name: round(statistics.median(timing.get(name, 0.0) for timing in stages), 2)
+            for name in stage_names
+        },
+    }
+
+
+def run(scales: list, repeat: int, modes: list, routes: list, latency_ms: float = 0, bandwidth_mbps: float = 0) -> dict:
+    app = create_app()
+    client = app.test_client()
+    errors = ErrorCounter()
+    logging.getLogger('app').addHandler(errors)
+
+    results = {'repeat': repeat, 'latency_ms': latency_ms, 'bandwidth_mbps': bandwidth_mbps, 'scales': {}}
+    with mock.patch('app.blueprints.main.scrape_vmware_versions', fake_esxi_versions), \
+            mock.patch('app.blueprints.main.scrape_vcenter_versions', fake_vcenter_versions):
+        for rows in scales:
+            started = time.perf_counter()
+            files = generate_csv(rows)
+            storage = MemoryStorage(files, latency_ms=latency_ms, bandwidth_mbps=bandwidth_mbps)
+            scale_result = {
+                'generate_s': round(time.perf_counter() - started, 2),
+                'dataset_mb': round(sum(len(content) for content in files.values()) / 1024 ** 2, 2),
+                'routes': {},
+            }
+            print(f"[{rows} rows] generated {scale_result['dataset_mb']} MB in {scale_result['generate_s']}s", file=sys.stderr)
+
+            with mock.patch('app.utils.storage.get_storage_manager', return_value=storage):
+                invalidate_dataset()
+                for route in routes:
+                    scale_result['routes'][route] = {}
+                    for mode in modes:
+                        result = time_route(client, route, repeat, mode == 'cold', errors)
+                        scale_result['routes'][route][mode] = result
+                        print(f"  {route:<40} {mode:<5} median {result['median_ms']:>9.1f} ms  "
+                              f"p95 {result['p95_ms']:>9.1f} ms  errors {result['errors']}", file=sys.stderr)
+            invalidate_dataset()
+            results['scales'][str(rows)] = scale_result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='1000,10000', help='Comma-separated rows per dataset (e.g. 1000,100000,1000000)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mode', default='cold,warm', help="'cold', 'warm' or both")
+    parser.add_argument('--routes', default=','.join(ROUTES), help='Comma-separated routes to run')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Simulated storage round trip per request')
+    parser.add_argument('--bandwidth-mbps', type=float, default=0, help='Simulated storage bandwidth (0 = unlimited)')
+    args = parser.parse_args()
+
+    results = run(
+        scales=[int(scale) for scale in args.scales.split(',')],
+        repeat=args.repeat,
+        modes=args.mode.split(','),
+        routes=args.routes.split(','),
+        latency_ms=args.latency_ms,
+        bandwidth_mbps=args.bandwidth_mbps,
+    )
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""
+Synthetic versions of every CSV the app reads (the `refresh_cache` file list).
+
+Column names and value formats follow what the routes and templates expect
+(e.g. 'VMware ESXi 7.0.3 build-21424296' versions, 'vcs00' vCenter VMs,
+report/frequency/location keys that join), so each route exercises its real
+code path. Data is generated from a fixed seed, so runs are reproducible.
+
+Usage:
+    python -m benchmarks.synthetic --rows 10000 --output /tmp/datasets
+"""
+import argparse
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+SEED = 1234
+
+ESXI_VERSIONS = [
+    ('7.0.3', '21424296'), ('7.0.3', '20842708'), ('8.0.1', '21495797'),
+    ('8.0.2', '22380479'), ('6.7.0', '17700523'),
+]
+VCENTER_VERSIONS = [
+    ('7.0.3', '21477706'), ('8.0.1', '21560480'), ('8.0.2', '22385739'), ('6.7.0', '19299595'),
+]
+REPORT_NAMES = [f'Report {i:02}' for i in range(1, 21)]
+FREQUENCIES = ['daily', 'weekly', 'monthly', 'quarterly', 'custom', '2', 'none']
+
+
+class Dimensions:
+    """Shared customers/locations so datasets join the way production data does"""
+
+    def __init__(self, rows: int, rng: np.random.Generator):
+        self.rng = rng
+        n_locations = int(np.clip(rows // 1000, 5, 200))
+        n_customers = max(2, n_locations // 4)
+        self.locations = np.array([f'LOC-{i:03}' for i in range(n_locations)])
+        self.location_customer = np.array([f'Customer {i % n_customers:02}' for i in range(n_locations)])
+        self.today = date.today()
+
+    def sites(self, n: int):
+        """Random (location, customer) columns"""
+        index = self.rng.integers(0, len(self.locations), n)
+        return self.locations[index], self.location_customer[index]
+
+    def dates(self, n: int, days: int = 90, fmt: str = '%Y-%m-%d') -> np.ndarray:
+        """Random dates within the last `days` days"""
+        offsets = self.rng.integers(0, days, n)
+        return np.array([(self.today - timedelta(days=int(offset))).strftime(fmt) for offset in range(days)])[offsets]
+
+    def choice(self, values, n: int) -> np.ndarray:
+        return np.asarray(values)[self.rng.integers(0, len(values), n)]
+
+    def names(self, prefix: str, n: int, distinct: int = None) -> np.ndarray:
+        """Names like 'vm-000123' (at most `distinct` different ones)"""
+        ids = self.rng.integers(0, distinct or n, n)
+        return np.char.add(prefix, np.char.zfill(ids.astype(str), 6))
+
+
+def customer_locations(dims: Dimensions, rows: int) -> pd.DataFrame:
+    return pd.DataFrame({'location': dims.locations, 'Customer': dims.location_customer})
+
+
+def frequencies(dims: Dimensions, rows: int) -> pd.DataFrame:
+    n = len(REPORT_NAMES)
+    frequency = dims.choice(FREQUENCIES, n)
+    return pd.DataFrame({
+        'reportName': REPORT_NAMES,
+        'location': np.where(dims.rng.random(n) < 0.8, 'All Locations', dims.choice(dims.locations, n)),
+        'frequency': frequency,
+        'specificDays': np.where(frequency == 'custom', '1,15', None),
+    })
+
+
+def report(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    return pd.DataFrame({
+        'customer': customer,
+        'location': location,
+        'report name': dims.choice(REPORT_NAMES, rows),
+        'date': dims.dates(rows, days=62, fmt='%Y-%m-%d %H:%M:%S'),
+        'attachment': np.where(dims.rng.random(rows) < 0.9, 'Yes', 'No'),
+        'subject': dims.names('Report delivery #', rows),
+    })
+
+
+def vrops_alerts_historical(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    critical = dims.rng.integers(0, 20, rows)
+    immediate = dims.rng.integers(0, 40, rows)
+    warning = dims.rng.integers(0, 100, rows)
+    return pd.DataFrame({
+        'date': dims.dates(rows, days=365), 'location': location, 'customer': customer,
+        'critical': critical, 'immediate': immediate, 'warning': warning,
+        'total': critical + immediate + warning,
+    })
+
+
+def vrops_list_of_alerts(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    return pd.DataFrame({
+        'Customer': customer, 'Location': location,
+        'Name': dims.choice(['Host has lost redundant uplinks', 'Datastore is running out of space',
+                             'VM has CPU contention', 'vSAN health check failed'], rows),
+        'Object Name': dims.names('esx-', rows, 5000),
+        'Criticality Level': dims.choice(['Critical', 'Immediate', 'Warning', 'Info'], rows),
+        'Status': dims.choice(['Active', 'Canceled'], rows),
+        'Start Time': dims.dates(rows, days=30, fmt='%Y-%m-%d %H:%M:%S'),
+        'Report Date': dims.dates(rows, days=7),
+    })
+
+
+def inventory(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    return pd.DataFrame({
+        'Customer': customer, 'Location': location, 'Report Date': dims.dates(rows, days=30),
+        'VM': dims.names('vm-', rows, max(rows // 4, 1)),
+        'Name': dims.choice(['vCenter', 'NSX Manager', 'SDDC Manager', 'vROps', 'Log Insight'], rows),
+        'Service': dims.choice(['vpxd', 'nsx', 'sddc', 'vrops', 'loginsight'], rows),
+        'Description': dims.choice(['Management', 'Monitoring', 'Networking'], rows),
+        'Installed Version': dims.choice(['7.0.3', '8.0.1', '8.0.2', '4.1.0'], rows),
+        'DHCVer': dims.choice(['1.4', '1.5', '2.0'], rows),
+        'devEnv': dims.choice(['prod', 'test'], rows),
+        'reportType': dims.choice(['VCF', 'Non-VCF'], rows),
+        'timeStamp': dims.dates(rows, days=30, fmt='%Y-%m-%d %H:%M:%S'),
+    })
+
+
+def excluded_networks(dims: Dimensions, rows: int) -> pd.DataFrame:
+    n = max(rows // 100, 1)
+    return pd.DataFrame({'Network': dims.names('10.0.', n, max(rows, 1)), 'Location': dims.choice(dims.locations, n)})
+
+
+def snapshot_reports(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    return pd.DataFrame({
+        'Customer': customer, 'Location': location, 'Date': dims.dates(rows, days=7),
+        'Name': dims.names('snap-', rows), 'VM': dims.names('vm-', rows, max(rows // 2, 1)),
+        'Parent Cluster': dims.names('cl-', rows, 50), 'Parent vCenter': dims.names('vcs00', rows, 9),
+        'Snapshot Age (Days)': dims.rng.integers(0, 400, rows),
+        'Snapshot Space (GB)': dims.rng.random(rows).round(4) * 500,
+    })
+
+
+def vhealth_reports(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    return pd.DataFrame({
+        'Customer': customer, 'Location': location, 'Date': dims.dates(rows, days=7),
+        'Type': dims.choice(['Error', 'Warning', 'Info'], rows), 'Name': dims.names('check-', rows, 300),
+        'Message': dims.choice(['Configuration drift detected', 'NTP not configured', 'Certificate expires soon'], rows),
+    })
+
+
+def firmware_reports(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, _ = dims.sites(rows)
+    return pd.DataFrame({
+        'Location': location, 'Cluster': dims.names('cl-', rows, 50), 'Hostname': dims.names('esx-', rows),
+        'Hardware-Model': dims.choice(['PowerEdge R650', 'ProLiant DL380 Gen10', 'UCSC-C240-M5'], rows),
+        'NIC': dims.choice(['vmnic0', 'vmnic1', 'vmnic2'], rows),
+        'Network-Driver': dims.choice(['i40en 1.14.1', 'bnxtnet 224.0', 'nmlx5_core 4.23'], rows),
+        'Adapter-Firmware': dims.choice(['22.31.6', '8.50', '16.35.2000'], rows),
+        'HBA-Module': dims.choice(['lpfc', 'qlnativefc'], rows),
+        'HBA-Version': dims.choice(['14.0.326.12', '5.3.81'], rows),
+        'FC-Driver': dims.choice(['14.0.326.12', '5.3.81.0'], rows),
+        'Description': dims.choice(['Intel Ethernet X710', 'Broadcom 57414', 'Mellanox ConnectX-5'], rows),
+        'Report Date': dims.dates(rows, days=7),
+    })
+
+
+def rvtools_vinfo(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    vm = dims.names('vm-', rows)
+    # About one VM in 200 is a vCenter appliance, as the vCenter version report expects
+    vcenter = dims.rng.random(rows) < 0.005
+    vm = np.where(vcenter, np.char.add('vcs00', np.char.zfill((np.arange(rows) % 10).astype(str), 1)), vm)
+    versions = [f'VMware vCenter Server {version} build-{build}' for version, build in VCENTER_VERSIONS]
+    return pd.DataFrame({
+        'VM': vm, 'Powerstate': dims.choice(['poweredOn', 'poweredOff'], rows),
+        'CPUs': dims.rng.integers(1, 32, rows), 'Memory': dims.rng.integers(1, 256, rows) * 1024,
+        'Cluster': dims.names('cl-', rows, 50), 'Primary IP Address': dims.names('10.1.', rows),
+        'Network #1': dims.names('pg-', rows, 200), 'Network #2': dims.names('pg-', rows, 200),
+        'Network #3': np.where(dims.rng.random(rows) < 0.8, None, dims.names('pg-', rows, 200)),
+        'RVTools Type': 'vInfo', 'Location': location, 'Customer': customer, 'Date': dims.dates(rows, days=7),
+        'VI SDK Server type': dims.choice(versions, rows), 'backupPolicy': dims.choice(['Gold', 'Silver', 'None'], rows),
+    })
+
+
+def vdisk_reports(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    return pd.DataFrame({
+        'VM': dims.names('vm-', rows), 'Disk': dims.choice(['Hard disk 1', 'Hard disk 2', 'Hard disk 3'], rows),
+        'Capacity MiB': dims.rng.integers(1, 4096, rows) * 1024, 'Path': dims.names('[ds-01] vm-', rows),
+        'Folder': dims.names('folder-', rows, 100), 'Cluster': dims.names('cl-', rows, 50),
+        'RVTools Type': 'vDisk', 'Location': location, 'Customer': customer, 'Report Date': dims.dates(rows, days=7),
+    })
+
+
+def vhosts_reports(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    versions = [f'VMware ESXi {version} build-{build}' for version, build in ESXI_VERSIONS]
+    cpus = dims.rng.integers(1, 5, rows)
+    cores = dims.choice([8, 16, 24, 32], rows)
+    return pd.DataFrame({
+        'Host': dims.names('esx-', rows), 'Cluster': dims.names('cl-', rows, 50),
+        'Customer': customer, 'Location': location, 'ESX Version': dims.choice(versions, rows),
+        'CPU Model': dims.choice(['Intel(R) Xeon(R) Gold 6338', 'AMD EPYC 7543'], rows),
+        '# CPU': cpus, 'Cores per CPU': cores, '# Cores': cpus * cores,
+        '# Memory': dims.rng.integers(128, 2048, rows) * 1024, '# NICs': dims.rng.integers(2, 8, rows),
+        '# HBAs': dims.rng.integers(0, 4, rows), 'Model': dims.choice(['PowerEdge R650', 'ProLiant DL380'], rows),
+        'Vendor': dims.choice(['Dell Inc.', 'HPE'], rows), 'Serial number': dims.names('SN', rows),
+        'Domain': 'example.local', 'Current EVC': dims.choice(['intel-icelake', 'amd-zen2', ''], rows),
+        'in Maintenance Mode': dims.choice(['False', 'True'], rows), 'RVTools Type': 'vHost',
+        'Report Date': dims.dates(rows, days=7),
+    })
+
+
+def network_utilization(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    total = dims.choice([254, 510, 1022], rows)
+    used = (dims.rng.random(rows) * total).astype(int)
+    return pd.DataFrame({
+        'Network': dims.names('10.0.', rows, max(rows, 1)), 'Network view': dims.choice(['default', 'mgmt'], rows),
+        'Location': location, 'Customer': customer, 'Total range': total, 'Total used': used,
+        'Available IP addresses': total - used, 'Used %': (used / total * 100).round(2),
+        'Report Date': dims.dates(rows, days=7),
+    })
+
+
+def certificate_expiry(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    days = dims.rng.integers(-30, 720, rows)
+    return pd.DataFrame({
+        'Customer': customer, 'Location': location, 'Common Name': dims.names('host-', rows),
+        'Serial Number': dims.names('0x', rows), 'Thumbprint': dims.names('AB:CD:', rows),
+        'Issued Date': dims.dates(rows, days=720), 'Expiration Date': dims.dates(rows, days=720),
+        'Days to expire': days, 'Report Date': dims.dates(rows, days=7),
+    })
+
+
+def password_expiration(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    return pd.DataFrame({
+        'Customer': customer, 'Location': location, 'Host name': dims.names('host-', rows),
+        'Username': dims.choice(['root', 'admin', 'administrator@vsphere.local'], rows),
+        'Last password rotation': dims.dates(rows, days=365), 'Password expiration date': dims.dates(rows, days=365),
+        'Rotation needed': dims.choice(['Yes', 'No'], rows), 'Customer agreed rotation': dims.choice(['90', '180', '365'], rows),
+        'Report Date': dims.dates(rows, days=7),
+    })
+
+
+def antivirus_assets(dims: Dimensions, rows: int) -> pd.DataFrame:
+    location, customer = dims.sites(rows)
+    return pd.DataFrame({
+        'Customer': customer, 'Location': location, 'Computername': dims.names('srv-', rows),
+        'IPAddress': dims.names('10.2.', rows), 'IsOnline': dims.choice(['True', 'False'], rows),
+        'ProductVersion': dims.choice(['14.0.12980', '14.0.13140'], rows),
+        'EngineVersion': dims.choice(['23.0.1005', '23.0.1010'], rows),
+        'Pattern': dims.choice(['19.421.00', '19.423.00'], rows), 'LastReleasedPattern': '19.423.00',
+        'EndpointPatternReleaseTime': dims.dates(rows, days=30, fmt='%Y-%m-%d %H:%M:%S'),
+        'LastCommunicationTime': dims.dates(rows, days=30, fmt='%Y-%m-%d %H:%M:%S'),
+        'Report Date': dims.dates(rows, days=7),
+    })
+
+
+# filename -> generator(dims, rows), covering the refresh_cache file list
+GENERATORS = {
+    'report.csv': report,
+    'frequencies.csv': frequencies,
+    'customer_locations.csv': customer_locations,
+    'vrops_alerts_historical.csv': vrops_alerts_historical,
+    'vrops_list_of_alerts.csv': vrops_list_of_alerts,
+    'combined_non_vcf_inventory.csv': inventory,
+    'combined_vcf_inventory.csv': inventory,
+    'excluded_networks.csv': excluded_networks,
+    'combined_snapshot_reports.csv': snapshot_reports,
+    'combined_vhealth_reports.csv': vhealth_reports,
+    'combined_firmware_reports.csv': firmware_reports,
+    'rvtools_vinfo.csv': rvtools_vinfo,
+    'combined_vdisk_reports.csv': vdisk_reports,
+    'combined_vhosts_reports.csv': vhosts_reports,
+    'combined_network_utilization_report.csv': network_utilization,
+    'combined_certificate_expiry_reports.csv': certificate_expiry,
+    'combined_password_expiration_reports.csv': password_expiration,
+    'combined_antivirus_asset_reports.csv': antivirus_assets,
+    'combined_vrops_list_of_alerts.csv': vrops_list_of_alerts,
+}
+
+
+def generate_datasets(rows: int, seed: int = SEED, filenames=None) -> dict:
+    """
+    Generate DataFrames for the given scale.
+
+    Args:
+        rows: Rows per fact table (dimension tables scale with it)
+        seed: RNG seed
+        filenames: Subset of GENERATORS to produce (default: all)
+
+    Returns:
+        Dictionary of filename -> DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    dims = Dimensions(rows, rng)
+    return {filename: GENERATORS[filename](dims, rows) for filename in (filenames or GENERATORS)}
+
+
+def generate_csv(rows: int, seed: int = SEED, filenames=None) -> dict:
+    """Generate the datasets as CSV bytes (filename -> bytes), as stored in the buckets"""
+    return {
+        filename: df.to_csv(index=False).encode('utf-8')
+        for filename, df in generate_datasets(rows, seed, filenames).items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--output', required=True, help='Directory to write the CSV files to')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for filename, content in generate_csv(args.rows, args.seed).items():
+        with open(os.path.join(args.output, filename), 'wb') as f:
+            f.write(content)
+        print(f"{filename:<45} {len(content) / 1024:>10.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()